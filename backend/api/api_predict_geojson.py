@@ -2,104 +2,44 @@
 API endpoint for predicting sea-ice extent and converting predictions to GeoJSON point clouds.
 
 This module uses a pretrained RBF kernel model to predict sea ice presence and returns
-the predictions as a GeoJSON feature collection. Results can be cached in-memory for
-repeated requests of the same date and parameters.
+the predictions as a GeoJSON feature collection.  The model itself is loaded
+lazily and memory-mapped by :mod:`backend.rbf_model`. Serialized results are stored in the
+persistent response cache keyed by the model file, the request parameters and
+``PREDICTION_VERSION``.
+
+Caching is staged: the per-month probability map (float16) is kept in the
+model's in-memory LRU (:func:`backend.rbf_model.probability_maps`), so requests that only change ``thresh`` or ``radius_km`` just re-apply the
+threshold and the precomputed grid radius mask.
 """
 from __future__ import annotations
 
 from datetime import datetime
-from functools import lru_cache
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import geopandas as gpd
-from pathlib import Path
-import os
 import numpy as np
-import rasterio
-import torch
 from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse
-from rasterio.transform import xy as transform_xy
+from fastapi.responses import Response
 from shapely.geometry import Point
 import json
 
+from backend.cache import cache_key, dumps, get_response_cache
+from backend.converter import DEFAULT_ENGINE, build_point_features
+from backend.maskcodec import FORMAT_VERSION as MASK_FORMAT_VERSION
+from backend.maskcodec import encode_raster, grid_header, quantize_probability
+from backend.polygons import DEFAULT_GEOMETRY, build_polygon_features
+from backend.rbf_model import PredictionError, get_model, model_fingerprint, probability_map
 
-class PredictionError(RuntimeError):
-    """Raised when model prediction or conversion to GeoJSON fails."""
-
-
-# ---------------------- Model Configuration ----------------------
-MODEL_ROOT = Path(
-    os.environ.get(
-        "ICE_MODEL_DIR",
-        Path(__file__).resolve().parent.parent / "datasets" / "trained_data",
-    )
-).resolve()
-MODEL_PATH = MODEL_ROOT / "rbf_model_2015_2025_spatiotemporal.npz"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-print(f"Using device: {DEVICE}")
-print(f"Loading model from: {MODEL_PATH}")
-
-# Load model data
-try:
-    if not MODEL_PATH.exists():
-        raise PredictionError(f"Model file not found at {MODEL_PATH}")
-    data = np.load(str(MODEL_PATH), allow_pickle=True)
-    weights = torch.from_numpy(data["weights"]).to(DEVICE).float()  # (N_valid, T)
-    valid_mask = data["valid_mask"].astype(bool)  # (H, W)
-    years = data["years"]
-    months = data["months"]
-    alpha = float(data.get("alpha", 0.0))
-    gamma = float(data.get("gamma", 1.0))
-    H, W = int(data["H"]), int(data["W"])
-
-    A, B, C, D, E, F = data["transform"].tolist()
-    transform = rasterio.Affine(A, B, C, D, E, F)
-    crs = rasterio.crs.CRS.from_string(str(data["crs"]))
-
-    # Precompute temporal features
-    year_norm = (years - years.min()) / max(1, (years.max() - years.min()))
-    month_sin = np.sin(2 * np.pi * months / 12.0)
-    month_cos = np.cos(2 * np.pi * months / 12.0)
-    t_features = np.stack([year_norm, month_sin, month_cos], axis=1)
-    t = torch.tensor(t_features, dtype=torch.float32, device=DEVICE)
-except Exception as exc:
-    raise PredictionError(f"Failed to load model from '{MODEL_PATH}': {exc}") from exc
-
-
-def _rbf_kernel(x1: torch.Tensor, x2: torch.Tensor, gamma: float) -> torch.Tensor:
-    """
-    Compute the RBF kernel between two sets of temporal features.
-    """
-    diff = x1[:, None, :] - x2[None, :, :]
-    dist2 = torch.sum(diff ** 2, dim=2)
-    return torch.exp(-gamma * dist2)
-
-
-def _get_temporal_features(date: datetime) -> torch.Tensor:
-    """
-    Convert a datetime into normalized temporal features for the model.
-    """
-    year_norm_next = (date.year - years.min()) / max(1, (years.max() - years.min()))
-    month_sin_next = np.sin(2 * np.pi * date.month / 12.0)
-    month_cos_next = np.cos(2 * np.pi * date.month / 12.0)
-    return torch.tensor([[year_norm_next, month_sin_next, month_cos_next]], 
-                       dtype=torch.float32, device=DEVICE)
+# Bump whenever the GeoJSON produced for a given model and request changes.
+PREDICTION_VERSION = 2
 
 
 def _predict_ice_mask(date: datetime, thresh: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
     """
     Generate binary ice presence mask for given date using the RBF model.
     """
-    t_next = _get_temporal_features(date)
-    k_star = _rbf_kernel(t, t_next, gamma)
-    preds = (weights @ k_star).squeeze(-1).detach().cpu().numpy()
-    preds = np.clip(preds, 0, 1)
-
-    pred_prob = np.zeros((H, W), dtype=np.float32)
-    pred_prob[valid_mask] = preds
-    ice_mask = (pred_prob >= thresh) & valid_mask
+    pred_prob = probability_map(date)
+    ice_mask = (pred_prob >= thresh) & get_model().valid_mask
     return ice_mask, pred_prob
 
 
@@ -107,36 +47,50 @@ def _filter_points(
     ice_mask: np.ndarray,
     pred_prob: np.ndarray,
     radius_km: float
-) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Filter ice pixels based on distance from pole and extract coordinates.
+    Filter ice pixels based on distance from pole using the precomputed grid mask.
+
+    Returns the selected pixel mask and the probabilities of those pixels.
     """
-    # Compute distance from pole
-    cols, rows = np.meshgrid(np.arange(W), np.arange(H))
-    xs = transform.c + cols * transform.a + rows * transform.b
-    ys = transform.f + cols * transform.d + rows * transform.e
-    dist_km = np.sqrt(xs**2 + ys**2) / 1000.0
-    
-    # Apply distance filter
-    mask = ice_mask & (dist_km > radius_km)
-    rows, cols = np.where(mask)
-    probs = pred_prob[rows, cols]
-    
-    # Convert to projected coordinates
-    xs_filtered, ys_filtered = transform_xy(transform, rows, cols)
-    return xs_filtered, ys_filtered, probs
+    mask = ice_mask & get_model().grid.radius_mask(radius_km)
+    return mask, pred_prob[mask]
 
 
 def _to_feature_collection(
-    xs: np.ndarray, 
-    ys: np.ndarray,
+    mask: np.ndarray,
     probs: np.ndarray,
-    date: datetime
+    date: datetime,
+    engine: str = DEFAULT_ENGINE,
+    geometry: str = DEFAULT_GEOMETRY,
+    zoom: Optional[int] = None,
 ) -> Dict:
     """
-    Convert coordinate arrays into a GeoJSON feature collection.
+    Convert the selected pixels into a GeoJSON feature collection.
+
+    The ``columnar`` engine reads the precomputed WGS84 pixel coordinates; the
+    ``geopandas`` engine goes through shapely points and a GeoDataFrame.
+    ``geometry="polygon"`` returns the dissolved outline with the mean
+    probability of the selected pixels instead.
     """
-    points = [Point(x, y) for x, y in zip(xs, ys)]
+    model = get_model()
+    grid = model.grid
+    if geometry == "polygon":
+        properties = {"date": date.strftime("%Y-%m-%d")}
+        if probs.size:
+            properties["mean_pred_prob"] = float(probs.mean(dtype=np.float64))
+        return build_polygon_features(mask, grid, properties=properties, zoom=zoom)
+
+    if engine != "geopandas":
+        return build_point_features(
+            grid.lon[mask],
+            grid.lat[mask],
+            properties={"date": date.strftime("%Y-%m-%d"), "pred_prob": probs.astype(float)},
+            show_bbox=False,
+            coordinate_type=list,
+        )
+
+    points = [Point(x, y) for x, y in zip(grid.x[mask], grid.y[mask])]
     if not points:
         return {"type": "FeatureCollection", "features": []}
 
@@ -146,7 +100,7 @@ def _to_feature_collection(
             "pred_prob": probs.astype(float)
         },
         geometry=points,
-        crs=crs
+        crs=model.crs
     ).to_crs(epsg=4326)
 
     return json.loads(gdf.to_json())
@@ -162,16 +116,97 @@ def root():
     return {"message": "Sea Ice Prediction API is running."}
 
 
-@lru_cache(maxsize=128)
-def _cached_prediction(year: int, month: int, thresh: float, radius_km: float) -> Dict:
-    """
-    Cached helper function for generating predictions. Cache is keyed by all parameters.
-    """
+def _prediction_geojson(
+    year: int,
+    month: int,
+    thresh: float,
+    radius_km: float,
+    engine: str,
+    geometry: str = DEFAULT_GEOMETRY,
+    zoom: Optional[int] = None,
+) -> Dict:
     date = datetime(year, month, 1)
     ice_mask, pred_prob = _predict_ice_mask(date, thresh)
-    xs, ys, probs = _filter_points(ice_mask, pred_prob, radius_km)
-    geojson = _to_feature_collection(xs, ys, probs, date)
-    return geojson
+    mask, probs = _filter_points(ice_mask, pred_prob, radius_km)
+    return _to_feature_collection(mask, probs, date, engine, geometry, zoom)
+
+
+def _cached_prediction(
+    year: int,
+    month: int,
+    thresh: float,
+    radius_km: float,
+    engine: str = DEFAULT_ENGINE,
+    geometry: str = DEFAULT_GEOMETRY,
+    zoom: Optional[int] = None,
+) -> bytes:
+    """
+    Cached helper returning the serialized prediction GeoJSON.
+
+    The persistent cache is keyed by the model file fingerprint, all
+    parameters and ``PREDICTION_VERSION``.
+    """
+    key = cache_key(
+        "prediction",
+        model_fingerprint(),
+        int(year),
+        int(month),
+        float(thresh),
+        float(radius_km),
+        engine,
+        geometry,
+        zoom if geometry == "polygon" else None,
+        PREDICTION_VERSION,
+    )
+    return get_response_cache().get_or_create(
+        key, lambda: dumps(_prediction_geojson(year, month, thresh, radius_km, engine, geometry, zoom))
+    )
+
+
+def _prediction_mask_key(
+    year: int, month: int, thresh: float, radius_km: float, values: str, encoding: str
+) -> str:
+    """Cache key (also used as the HTTP ETag) of a binary prediction raster."""
+    return cache_key(
+        "prediction-mask",
+        model_fingerprint(),
+        int(year),
+        int(month),
+        float(thresh) if values == "mask" else None,
+        float(radius_km),
+        values,
+        encoding,
+        MASK_FORMAT_VERSION,
+        PREDICTION_VERSION,
+    )
+
+
+def _cached_prediction_mask(
+    year: int, month: int, thresh: float, radius_km: float, values: str = "mask", encoding: str = "bits"
+) -> bytes:
+    """
+    Cached helper returning the predicted ice mask (``values="mask"``) or the
+    probability map quantized to uint8 (``values="prob"``) as a binary payload.
+    Pixels within ``radius_km`` of the pole are cleared in both cases.
+    """
+
+    def _encode() -> bytes:
+        model = get_model()
+        date = datetime(year, month, 1)
+        ice_mask, pred_prob = _predict_ice_mask(date, thresh)
+        outside = model.grid.radius_mask(radius_km)
+        header = {
+            **grid_header(model.transform, model.crs),
+            "date": date.strftime("%Y-%m-%d"),
+            "radius_km": float(radius_km),
+        }
+        if values == "mask":
+            return encode_raster(ice_mask & outside, encoding, {**header, "threshold": float(thresh)})
+        quantized = np.where(outside, quantize_probability(pred_prob), 0).astype(np.uint8)
+        return encode_raster(quantized, encoding, {**header, "scale": 1 / 255})
+
+    key = _prediction_mask_key(year, month, thresh, radius_km, values, encoding)
+    return get_response_cache().get_or_create(key, _encode)
 
 
 @app.get("/predict")
@@ -180,15 +215,15 @@ def predict_sea_ice(
     month: int = Query(..., ge=1, le=12, description="Month to predict"),
     thresh: float = Query(0.5, ge=0.0, le=1.0, description="Threshold for ice probability"),
     radius_km: float = Query(200.0, ge=0.0, description="Exclude points within this distance (km) from the pole")
-) -> JSONResponse:
+) -> Response:
     """
     Predict sea ice extent for a given year and month.
     Returns a GeoJSON FeatureCollection of Point geometries (ice pixels).
     
-    Results are cached in-memory keyed by all input parameters.
+    Results are cached on disk keyed by the model file and all input parameters.
     """
     try:
         geojson = _cached_prediction(year, month, thresh, radius_km)
-        return JSONResponse(content=geojson)
+        return Response(content=geojson, media_type="application/json")
     except Exception as exc:
         raise PredictionError(f"Failed to generate prediction for {year}-{month:02d}: {exc}") from exc
@@ -1,21 +1,45 @@
 from __future__ import annotations
 
-import os
 import re
+from datetime import datetime
 from pathlib import Path
+from typing import Iterator, Optional
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 
-from backend.converter import GeoDataConversionError, convert_tif_to_geojson
-from .api_predict_geojson import PredictionError, _cached_prediction
+from backend.cache import dumps_with_raw
+from backend.catalog import DATASET_ROOT, CatalogEntry, get_catalog
+from backend.converter import (
+    DEFAULT_ENGINE,
+    ENGINES,
+    GeoDataConversionError,
+    convert_tif_to_geojson_bytes,
+    convert_tif_to_mask_bytes,
+    iter_converted_geojson,
+    mask_cache_key,
+)
+from backend.maskcodec import MASK_ENCODINGS, MEDIA_TYPE, PROBABILITY_ENCODINGS
+from backend.polygons import DEFAULT_GEOMETRY, GEOMETRIES, MAX_ZOOM
+from backend.rbf_model import probability_maps
+from .api_predict_geojson import (
+    PredictionError,
+    _cached_prediction,
+    _cached_prediction_mask,
+    _prediction_mask_key,
+)
 
 router = APIRouter(tags=["ice_extent"])
 
-DATASET_ROOT = Path(
-    os.environ.get("ICE_DATASET_DIR", Path(__file__).resolve().parent.parent / "datasets")
-).resolve()
 DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+ENGINE_PATTERN = "^(" + "|".join(ENGINES) + ")$"
+GEOMETRY_PATTERN = "^(" + "|".join(GEOMETRIES) + ")$"
+STREAM_FORMAT_PATTERN = "^(json|ndjson)$"
+MAX_FORECAST_MONTHS = 120
+ENCODING_PATTERN = "^(" + "|".join(sorted(set(MASK_ENCODINGS + PROBABILITY_ENCODINGS))) + ")$"
+# Observed rasters only change when a file is replaced (which changes the ETag).
+OBSERVED_MAX_AGE = 86400
+PREDICTED_MAX_AGE = 3600
 
 
 def _normalise_date(value: str) -> str:
@@ -24,50 +48,53 @@ def _normalise_date(value: str) -> str:
     return value.replace("-", "")
 
 
+def _json_response(payload: dict, **raw: bytes) -> Response:
+    """Build a JSON response embedding pre-serialized (cached) values."""
+    return Response(content=dumps_with_raw(payload, raw), media_type="application/json")
+
+
+def _binary_response(etag: str, if_none_match: Optional[str], max_age: int, build) -> Response:
+    """Serve a cached binary payload with ETag / Cache-Control, honouring If-None-Match."""
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=build(), media_type=MEDIA_TYPE, headers=headers)
+
+
 def _find_dataset(date_str: str) -> Path:
-    token = _normalise_date(date_str)
-    candidates = sorted(DATASET_ROOT.rglob(f"*{token}*.tif"))
-    if not candidates:
+    _normalise_date(date_str)
+    entry = get_catalog().find(date_str)
+    if entry is None:
         raise HTTPException(
             status_code=404,
             detail=f"No GeoTIFF found for {date_str} under {DATASET_ROOT}",
         )
-    if len(candidates) > 1:
-        exact = [path for path in candidates if path.stem.startswith(token)]
-        if exact:
-            return exact[0]
-    return candidates[0]
-
-
-def _scan_available_dates() -> list[str]:
-    dates: list[str] = []
-    for path in DATASET_ROOT.rglob("*.tif"):
-        stem = path.stem
-        # Expect token like N_YYYYMMDD_...
-        m = re.search(r"(\d{8})", stem)
-        if not m:
-            continue
-        y, mo, d = m.group(1)[:4], m.group(1)[4:6], m.group(1)[6:8]
-        dates.append(f"{y}-{mo}-{d}")
-    return sorted(set(dates))
+    return Path(entry.path)
+
 
+def _scan_available_dates(start: Optional[str] = None, end: Optional[str] = None) -> list[str]:
+    return get_catalog().dates(start, end)
 
-def _datasets_for_year(year: int) -> list[Path]:
-    year_dir = DATASET_ROOT / str(year)
-    if not year_dir.exists():
-        return []
-    return sorted(year_dir.rglob("*.tif"))
+
+def _datasets_for_year(year: int) -> list[CatalogEntry]:
+    return get_catalog().year(year)
 
 
 @router.get("/ice_extent")
 def ice_extent(
     date: str = Query(..., description="Date matching the GeoTIFF filename (YYYY-MM-DD)"),
     radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
+    engine: str = Query(DEFAULT_ENGINE, pattern=ENGINE_PATTERN, description="GeoJSON conversion engine"),
+    geometry: str = Query(DEFAULT_GEOMETRY, pattern=GEOMETRY_PATTERN, description="Ice pixels as 'point' features or a dissolved 'polygon'"),
+    zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM, description="Simplify polygons for this web-map zoom level"),
 ):
     tif_path = _find_dataset(date)
 
     try:
-        feature_collection = convert_tif_to_geojson(str(tif_path), radius_km=radius_km)
+        feature_collection = convert_tif_to_geojson_bytes(
+            str(tif_path), radius_km=radius_km, engine=engine, geometry=geometry, zoom=zoom
+        )
     except FileNotFoundError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
     except GeoDataConversionError as exc:
@@ -79,53 +106,137 @@ def ice_extent(
         "date": date,
         "source": str(tif_path.resolve()),
         "radius_km": radius_km,
-        "feature_collection": feature_collection,
     }
-    return JSONResponse(payload)
+    return _json_response(payload, feature_collection=feature_collection)
 
 
 @router.get("/ice_extent/available_dates")
-def available_dates():
-    """Return all available dates discovered under the dataset root."""
+def available_dates(
+    start: Optional[str] = Query(None, description="Earliest date to include (YYYY-MM-DD)"),
+    end: Optional[str] = Query(None, description="Latest date to include (YYYY-MM-DD)"),
+):
+    """Return available dates from the dataset catalog, optionally within a range."""
+    for value in (start, end):
+        if value is not None:
+            _normalise_date(value)
     try:
-        dates = _scan_available_dates()
+        dates = _scan_available_dates(start, end)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Failed to scan datasets: {exc}") from exc
     return {"count": len(dates), "dates": dates}
 
 
+@router.post("/ice_extent/catalog/reload")
+def reload_catalog(full: bool = Query(False, description="Re-list every directory instead of only changed ones")):
+    """Rescan the dataset root and update the catalog index."""
+    try:
+        stats = get_catalog().refresh(full=full)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Failed to reload catalog: {exc}") from exc
+    return {"count": len(get_catalog()), **stats}
+
+
+def _converted_days(
+    entries: list[CatalogEntry], radius_km: float, engine: str, geometry: str, zoom: Optional[int]
+) -> Iterator[bytes]:
+    """Serialized day items in date order, converted in parallel; failed rasters are skipped."""
+    dates = {entry.path: entry.date for entry in entries}
+    converted = iter_converted_geojson(
+        [entry.path for entry in entries], radius_km=radius_km, engine=engine, geometry=geometry, zoom=zoom
+    )
+    for path, feature_collection, error in converted:
+        if error is not None:
+            # Skip problematic files but continue
+            continue
+        yield dumps_with_raw(
+            {"date": dates[path], "source": str(Path(path).resolve())},
+            {"feature_collection": feature_collection},
+        )
+
+
+def _stream_days(
+    envelope: dict, items: Iterator[bytes], fmt: str, empty_detail: str, key: str = "days"
+) -> StreamingResponse:
+    """
+    Stream items as one chunked JSON document (``envelope`` plus a ``key``
+    array) or as NDJSON, one item per line.
+
+    The first item is produced before the response starts so that a range
+    with no convertible rasters still returns 404.
+    """
+    first = next(items, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail=empty_detail)
+
+    if fmt == "ndjson":
+        def body() -> Iterator[bytes]:
+            yield first + b"\n"
+            for item in items:
+                yield item + b"\n"
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    head = dumps_with_raw(envelope, {key: b"["})[:-1]
+
+    def body() -> Iterator[bytes]:
+        yield head + first
+        for item in items:
+            yield b"," + item
+        yield b"]}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
 @router.get("/ice_extent/by_year")
 def ice_extent_by_year(
     year: int = Query(..., ge=1900, le=2100, description="4-digit year to load"),
     radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
+    engine: str = Query(DEFAULT_ENGINE, pattern=ENGINE_PATTERN, description="GeoJSON conversion engine"),
+    geometry: str = Query(DEFAULT_GEOMETRY, pattern=GEOMETRY_PATTERN, description="Ice pixels as 'point' features or a dissolved 'polygon'"),
+    zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM, description="Simplify polygons for this web-map zoom level"),
+    format: str = Query("json", pattern=STREAM_FORMAT_PATTERN, description="Chunked 'json' document or 'ndjson' lines"),
 ):
-    paths = _datasets_for_year(year)
-    if not paths:
+    """
+    Convert every raster of a year in parallel and stream the days in date order.
+    """
+    entries = _datasets_for_year(year)
+    if not entries:
         raise HTTPException(status_code=404, detail=f"No GeoTIFFs found for year {year}")
 
-    items = []
-    for tif_path in paths:
-        # Extract date token from filename
-        m = re.search(r"(\d{8})", tif_path.stem)
-        if not m:
-            continue
-        token = m.group(1)
-        iso = f"{token[:4]}-{token[4:6]}-{token[6:8]}"
-        try:
-            feature_collection = convert_tif_to_geojson(str(tif_path), radius_km=radius_km)
-        except Exception as exc:
-            # Skip problematic files but continue
-            continue
-        items.append({
-            "date": iso,
-            "source": str(tif_path.resolve()),
-            "feature_collection": feature_collection,
-        })
+    return _stream_days(
+        {"year": year, "radius_km": radius_km},
+        _converted_days(entries, radius_km, engine, geometry, zoom),
+        format,
+        f"No valid GeoTIFFs converted for year {year}",
+    )
+
 
-    if not items:
-        raise HTTPException(status_code=404, detail=f"No valid GeoTIFFs converted for year {year}")
+@router.get("/ice_extent/range")
+def ice_extent_range(
+    start: str = Query(..., description="First date to load (YYYY-MM-DD)"),
+    end: str = Query(..., description="Last date to load (YYYY-MM-DD)"),
+    radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
+    engine: str = Query(DEFAULT_ENGINE, pattern=ENGINE_PATTERN, description="GeoJSON conversion engine"),
+    geometry: str = Query(DEFAULT_GEOMETRY, pattern=GEOMETRY_PATTERN, description="Ice pixels as 'point' features or a dissolved 'polygon'"),
+    zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM, description="Simplify polygons for this web-map zoom level"),
+    format: str = Query("ndjson", pattern=STREAM_FORMAT_PATTERN, description="Chunked 'json' document or 'ndjson' lines"),
+):
+    """
+    Convert every raster between ``start`` and ``end`` (inclusive) in parallel
+    and stream the days in date order.
+    """
+    _normalise_date(start)
+    _normalise_date(end)
+    entries = get_catalog().entries(start, end)
+    if not entries:
+        raise HTTPException(status_code=404, detail=f"No GeoTIFFs found between {start} and {end}")
 
-    return {"year": year, "radius_km": radius_km, "days": items}
+    return _stream_days(
+        {"start": start, "end": end, "radius_km": radius_km},
+        _converted_days(entries, radius_km, engine, geometry, zoom),
+        format,
+        f"No valid GeoTIFFs converted between {start} and {end}",
+    )
 
 
 @router.get("/ice_extent/predict")
@@ -133,6 +244,9 @@ def predict_ice_extent(
     date: str = Query(..., description="Prediction date (YYYY-MM-DD)"),
     radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
     thresh: float = Query(0.5, ge=0.0, le=1.0, description="Threshold for ice probability"),
+    engine: str = Query(DEFAULT_ENGINE, pattern=ENGINE_PATTERN, description="GeoJSON conversion engine"),
+    geometry: str = Query(DEFAULT_GEOMETRY, pattern=GEOMETRY_PATTERN, description="Ice pixels as 'point' features or a dissolved 'polygon'"),
+    zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM, description="Simplify polygons for this web-map zoom level"),
 ):
     """
     Predict sea ice extent for a given date.
@@ -147,7 +261,7 @@ def predict_ice_extent(
         month = int(date[5:7])
         
         # Get prediction from cached function
-        feature_collection = _cached_prediction(year, month, thresh, radius_km)
+        feature_collection = _cached_prediction(year, month, thresh, radius_km, engine, geometry, zoom)
         
     except PredictionError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
@@ -160,6 +274,115 @@ def predict_ice_extent(
         "date": date,
         "radius_km": radius_km,
         "threshold": thresh,
-        "feature_collection": feature_collection,
     }
-    return JSONResponse(payload)
+    return _json_response(payload, feature_collection=feature_collection)
+
+
+@router.get("/ice_extent/forecast")
+def forecast_ice_extent(
+    start: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="First month to predict (YYYY-MM)"),
+    months: int = Query(12, ge=1, le=MAX_FORECAST_MONTHS, description="Number of consecutive months"),
+    radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
+    thresh: float = Query(0.5, ge=0.0, le=1.0, description="Threshold for ice probability"),
+    engine: str = Query(DEFAULT_ENGINE, pattern=ENGINE_PATTERN, description="GeoJSON conversion engine"),
+    geometry: str = Query(DEFAULT_GEOMETRY, pattern=GEOMETRY_PATTERN, description="Ice pixels as 'point' features or a dissolved 'polygon'"),
+    zoom: Optional[int] = Query(None, ge=0, le=MAX_ZOOM, description="Simplify polygons for this web-map zoom level"),
+    format: str = Query("ndjson", pattern=STREAM_FORMAT_PATTERN, description="Chunked 'json' document or 'ndjson' lines"),
+):
+    """
+    Predict ``months`` consecutive months starting at ``start`` and stream
+    one feature collection per month.
+
+    All probability maps are computed up front in a single matmul; each
+    month's GeoJSON is then built (or read from the cache) as it is streamed.
+    """
+    year, month = int(start[:4]), int(start[5:7])
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail=f"Invalid month in '{start}'.")
+    if year < 1 or year + (month - 2 + months) // 12 > datetime.max.year:
+        raise HTTPException(status_code=400, detail=f"Forecast from '{start}' falls outside the supported years.")
+    dates = [datetime(year + (month - 1 + i) // 12, (month - 1 + i) % 12 + 1, 1) for i in range(months)]
+
+    try:
+        probability_maps(dates)
+    except PredictionError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    def items() -> Iterator[bytes]:
+        for date in dates:
+            feature_collection = _cached_prediction(
+                date.year, date.month, thresh, radius_km, engine, geometry, zoom
+            )
+            yield dumps_with_raw({"date": date.date().isoformat()}, {"feature_collection": feature_collection})
+
+    return _stream_days(
+        {"start": start, "months": months, "radius_km": radius_km, "threshold": thresh},
+        items(),
+        format,
+        "No months to forecast",
+        key="months",
+    )
+
+
+@router.get("/ice_extent/mask")
+def ice_extent_mask(
+    date: str = Query(..., description="Date matching the GeoTIFF filename (YYYY-MM-DD)"),
+    radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
+    encoding: str = Query("bits", pattern=ENCODING_PATTERN, description="'bits' (bit-packed) or 'rle'"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Return the observed ice mask as a compact binary raster (see ``backend.maskcodec``).
+    """
+    if encoding not in MASK_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Masks support the encodings {MASK_ENCODINGS}.")
+    tif_path = str(_find_dataset(date))
+
+    try:
+        return _binary_response(
+            mask_cache_key(tif_path, radius_km, encoding),
+            if_none_match,
+            OBSERVED_MAX_AGE,
+            lambda: convert_tif_to_mask_bytes(tif_path, radius_km=radius_km, encoding=encoding),
+        )
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except GeoDataConversionError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+
+@router.get("/ice_extent/predict/mask")
+def predict_ice_extent_mask(
+    date: str = Query(..., description="Prediction date (YYYY-MM-DD)"),
+    radius_km: float = Query(500, ge=0, description="Radial distance filter (kilometres)"),
+    thresh: float = Query(0.5, ge=0.0, le=1.0, description="Threshold for ice probability"),
+    values: str = Query("mask", pattern="^(mask|prob)$", description="Thresholded 'mask' or uint8-quantized 'prob'"),
+    encoding: Optional[str] = Query(
+        None, pattern=ENCODING_PATTERN, description="'bits' or 'rle' for masks, 'raw' or 'rle' for probabilities"
+    ),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Return the predicted ice mask or probability map as a compact binary raster.
+    """
+    if not DATE_PATTERN.match(date):
+        raise HTTPException(status_code=400, detail="Date must be provided as YYYY-MM-DD.")
+    allowed = MASK_ENCODINGS if values == "mask" else PROBABILITY_ENCODINGS
+    encoding = encoding or allowed[0]
+    if encoding not in allowed:
+        raise HTTPException(status_code=400, detail=f"values={values} supports the encodings {allowed}.")
+    year, month = int(date[:4]), int(date[5:7])
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail=f"Invalid month in date '{date}'.")
+
+    try:
+        return _binary_response(
+            _prediction_mask_key(year, month, thresh, radius_km, values, encoding),
+            if_none_match,
+            PREDICTED_MAX_AGE,
+            lambda: _cached_prediction_mask(year, month, thresh, radius_km, values, encoding),
+        )
+    except PredictionError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Unexpected prediction error: {exc}") from exc
@@ -1,77 +1,292 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Tuple, Dict, Any
+from pydantic import BaseModel, Field
+from datetime import date, datetime, timedelta
+from typing import Tuple, Dict, Any, Optional
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
+import rasterio
+import shapely
 from scipy.spatial import cKDTree
 
+from backend.rbf_model import PredictionError
 from backend.routing import pathfinder
+from backend.routing.navgrid import NavigationGrid, NavigationStack, reference_water, resolve_layer
+from backend.routing.shipping_corridor_handler import get_corridors
 
 router = APIRouter(tags=["route_navigation"])
 
+# A navmap cell is blocked as ice when an ice point lies within this many
+# degrees (or one cell, if the cells are larger).
+NAVMAP_RADIUS_DEG = 0.02
+MAX_NAVMAP_CELLS = 4_000_000
+# Grid used when the point spacing cannot be estimated (a single point).
+NAVMAP_SIZE = 200
+# Points sampled to estimate the point spacing for the automatic grid.
+DENSITY_SAMPLE = 10_000
+EARTH_RADIUS_KM = 6371.0088
+
+
+class LayerRef(BaseModel):
+    """An ice layer resolved server-side: an observed ``date`` or a predicted ``year``/``month``."""
+    date: Optional[str] = Field(None, pattern=r"^\d{4}-\d{2}-\d{2}$")
+    year: Optional[int] = Field(None, ge=1900, le=2100)
+    month: Optional[int] = Field(None, ge=1, le=12)
+    thresh: float = Field(0.5, ge=0.0, le=1.0)
+    # Cost profile for weighted routing on the ice probabilities (see navgrid.COST_PROFILES).
+    profile: Optional[str] = None
+
+
 class RouteRequest(BaseModel):
     start: Tuple[float, float]  # (lon, lat)
     end: Tuple[float, float]    # (lon, lat)
-    geojson: Dict[str, Any]
+    # Either a layer handle (routes on the native grid) or the ice GeoJSON itself
+    # (features are ice, e.g. /ice_extent output; routes avoid them and land).
+    layer: Optional[LayerRef] = None
+    geojson: Optional[Dict[str, Any]] = None
+    # Prefer shipping corridors: cells on a corridor cost half (see ShippingCorridorHandler).
     use_corridor: bool = False
+    # Navmap cells along each axis for GeoJSON input; by default one cell per point spacing.
+    grid_size: Optional[int] = Field(None, ge=2, le=2000)
+    # Search time budget: returns the best route found in time (anytime weighted A*).
+    max_seconds: Optional[float] = Field(None, gt=0, le=60)
+    weight: float = Field(2.0, ge=1.0, le=10.0)
+    # Time-dependent routing: leave on ``departure`` at ``speed_knots`` through the
+    # observed and forecast grids of the following days (``layer`` only sets thresh).
+    departure: Optional[str] = Field(None, pattern=r"^\d{4}-\d{2}-\d{2}$")
+    speed_knots: float = Field(12.0, gt=0, le=40)
+    max_days: int = Field(60, ge=1, le=366)
 
 
-@router.post("/route_navigation")
-def compute_route(request: RouteRequest):
-    print("=== 🚀 Route Request Received ===")
-    print(f"Start: {request.start} End: {request.end}")
-    print(f"GeoJSON features: {len(request.geojson.get('features', []))}")
+def _ice_points(geometries) -> np.ndarray:
+    """(N, 2) lon/lat of every geometry: the points themselves, else centroids."""
+    return shapely.get_coordinates(shapely.centroid(np.asarray(geometries)))
+
+
+def _navmap_shape(tree: cKDTree, points: np.ndarray, bounds, grid_size: Optional[int]) -> Tuple[int, int]:
+    """
+    ``(H, W)`` of the navmap: ``grid_size`` square, or cells as wide as the
+    median nearest-neighbour spacing of the points, within ``MAX_NAVMAP_CELLS``.
+    """
+    if grid_size is not None:
+        return grid_size, grid_size
+    sample = points
+    if len(points) > DENSITY_SAMPLE:
+        sample = points[np.random.default_rng(0).choice(len(points), DENSITY_SAMPLE, replace=False)]
+    dist, _ = tree.query(sample, k=2, workers=-1)
+    spacing = float(np.median(dist[:, 1])) if len(points) > 1 else 0.0
+    width, height = bounds[2] - bounds[0], bounds[3] - bounds[1]
+    if spacing <= 0:
+        return NAVMAP_SIZE, NAVMAP_SIZE
+    spacing = max(spacing, np.sqrt(width * height / MAX_NAVMAP_CELLS))
+    return max(2, int(np.ceil(height / spacing)) + 1), max(2, int(np.ceil(width / spacing)) + 1)
+
+
+def rasterize_navmap(tree: cKDTree, xs: np.ndarray, ys: np.ndarray, radius: float) -> np.ndarray:
+    """1 where a point lies within ``radius`` of the cell centre, in one batched KD-tree query."""
+    gx, gy = np.meshgrid(xs, ys)
+    cells = np.column_stack([gx.ravel(), gy.ravel()])
+    dist, _ = tree.query(cells, k=1, distance_upper_bound=radius, workers=-1)
+    return (dist < radius).reshape(len(ys), len(xs)).astype(np.uint8)
+
 
+def _layer_grid(layer: LayerRef) -> NavigationGrid:
     try:
-        gdf = gpd.GeoDataFrame.from_features(request.geojson["features"])
-        if gdf.empty:
-            raise HTTPException(status_code=400, detail="Empty GeoJSON")
-
-        geom_type = gdf.geometry.iloc[0].geom_type
-        if geom_type == "Point":
-            print("🧊 Detected Point geometries — building KDTree")
-            ice_points = np.array([[p.x, p.y] for p in gdf.geometry])
-        else:
-            print("📦 Non-point geometries detected — using centroids")
-            ice_points = np.array([[p.centroid.x, p.centroid.y] for p in gdf.geometry])
+        return resolve_layer(layer.date, layer.year, layer.month, layer.thresh, layer.profile)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except PredictionError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+
+def _great_circle_km(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lon1, lat1, lon2, lat2 = np.radians([lon1, lat1, lon2, lat2])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)))
+
+
+def _geojson_navmap(request: RouteRequest):
+    """
+    Rasterize posted ice GeoJSON: (navmap, (start cell, snap km), (goal cell,
+    snap km), pixels -> lon/lat, WGS84 transform of the navmap).
+
+    As on layer grids, navigable cells are open water: cells near an ice
+    feature are blocked, and so is land, taken from :func:`reference_water`
+    since the GeoJSON does not carry it.
+    """
+    gdf = gpd.GeoDataFrame.from_features(request.geojson["features"])
+    if gdf.empty:
+        raise HTTPException(status_code=400, detail="Empty GeoJSON")
+
+    geom_type = gdf.geometry.iloc[0].geom_type
+    if geom_type == "Point":
+        print("🧊 Detected Point geometries — building KDTree")
+    else:
+        print("📦 Non-point geometries detected — using centroids")
+    ice_points = _ice_points(gdf.geometry.values)
 
-        tree = cKDTree(ice_points)
+    tree = cKDTree(ice_points)
 
-        bounds = gdf.total_bounds  # [minx, miny, maxx, maxy]
-        W, H = 200, 200 
-        xs = np.linspace(bounds[0], bounds[2], W)
-        ys = np.linspace(bounds[1], bounds[3], H)
-        navmap = np.zeros((H, W), dtype=np.uint8)
+    bounds = gdf.total_bounds  # [minx, miny, maxx, maxy]
+    H, W = _navmap_shape(tree, ice_points, bounds, request.grid_size)
+    xs = np.linspace(bounds[0], bounds[2], W)
+    ys = np.linspace(bounds[1], bounds[3], H)
+    cell = max(xs[1] - xs[0], ys[1] - ys[0])
+    ice = rasterize_navmap(tree, xs, ys, max(NAVMAP_RADIUS_DEG, cell))
+    navmap = 1 - ice
+    reference = reference_water()
+    if reference is not None:
+        gx, gy = np.meshgrid(xs, ys)
+        navmap &= reference.water_at(gx, gy)
+    else:
+        print("⚠️ No observed day or model available to mask land; only ice is avoided")
+    print(f"Navmap {H}x{W}, {int(ice.sum())} ice cells, {int(navmap.sum())} navigable")
 
+    def latlon_to_px(lon, lat):
+        j = int((lon - bounds[0]) / (bounds[2] - bounds[0]) * (W - 1))
+        i = int((lat - bounds[1]) / (bounds[3] - bounds[1]) * (H - 1))
+        i = np.clip(i, 0, H - 1)
+        j = np.clip(j, 0, W - 1)
+        return i, j
 
-        for i, y in enumerate(ys):
-            for j, x in enumerate(xs):
-                dist, _ = tree.query([x, y], k=1)
-                if dist < 0.02: 
-                    navmap[i, j] = 1
+    nearest = pathfinder.nearest_navigable(navmap)
 
-        def latlon_to_px(lon, lat):
-            j = int((lon - bounds[0]) / (bounds[2] - bounds[0]) * (W - 1))
-            i = int((lat - bounds[1]) / (bounds[3] - bounds[1]) * (H - 1))
-            i = np.clip(i, 0, H - 1)
-            j = np.clip(j, 0, W - 1)
-            return i, j
+    def snap(lon, lat):
+        i, j = pathfinder.snap_cell(nearest, latlon_to_px(lon, lat))
+        return (i, j), _great_circle_km(lon, lat, xs[j], ys[i])
 
-        start_px = latlon_to_px(*request.start)
-        goal_px = latlon_to_px(*request.end)
+    def to_coords(pixels):
+        return [(xs[j], ys[i]) for (i, j) in pixels]
 
-        path_pixels = pathfinder.astar_pathfinding(navmap, start_px, goal_px)
+    dx, dy = xs[1] - xs[0], ys[1] - ys[0]
+    transform = rasterio.Affine(dx, 0, xs[0] - dx / 2, 0, dy, ys[0] - dy / 2)
+    return navmap, snap(*request.start), snap(*request.end), to_coords, transform
+
+
+def _straight_line(request: RouteRequest):
+    return [
+        (request.start[0] + t * (request.end[0] - request.start[0]),
+         request.start[1] + t * (request.end[1] - request.start[1]))
+        for t in np.linspace(0, 1, 50)
+    ]
+
+
+def _timed_route(request: RouteRequest):
+    """
+    Earliest-arrival route leaving on ``request.departure``: each day is
+    navigated on its observed grid, else on the forecast of its month.
+    """
+    try:
+        departure = date.fromisoformat(request.departure)
+        thresh = request.layer.thresh if request.layer is not None else 0.5
+        stack = NavigationStack(departure, request.max_days, thresh)
+        first = stack.grid(0)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except PredictionError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    try:
+        (start_px, start_km), (goal_px, goal_km) = first.snap(*request.start), first.snap(*request.end)
+        result = pathfinder.earliest_arrival_pathfinding(
+            stack, start_px, goal_px, stack.crossing_hours(request.speed_knots), first.water, stack.horizon
+        )
+        leave = datetime.combine(departure, datetime.min.time())
+        properties = {
+            "method": "time_dependent",
+            "grid": list(first.shape),
+            "status": result.status,
+            "snap_km": [round(start_km, 3), round(goal_km, 3)],
+            "departure": request.departure,
+            "speed_knots": request.speed_knots,
+        }
+        if len(result.path) < 2:
+            print(f"⚠️ No route within {request.max_days} days ({result.status}), using straight fallback")
+            path_coords = _straight_line(request)
+            properties["method"] = "fallback"
+        else:
+            path_coords = first.to_lonlat(result.path)
+            properties.update(
+                hours=round(result.cost, 2),
+                arrival=(leave + timedelta(hours=result.cost)).isoformat(timespec="minutes"),
+                # Hours after departure at each coordinate (including waits for ice to clear).
+                times=[round(t, 2) for t in result.times],
+                layers=[
+                    {"from_hours": stack.slot_starts[slot], **stack.layer(slot)}
+                    for slot in sorted({stack.slot_at(t) for t in result.times})
+                ],
+            )
+        print(f"Timed route: {result.status}, {result.expansions} expansions")
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "LineString", "coordinates": path_coords},
+                    "properties": properties,
+                }
+            ],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Route computation failed: {e}")
+
+
+@router.post("/route_navigation")
+def compute_route(request: RouteRequest):
+    print("=== 🚀 Route Request Received ===")
+    print(f"Start: {request.start} End: {request.end}")
+
+    if request.departure is not None:
+        return _timed_route(request)
+
+    layer = None
+    if request.layer is not None:
+        layer = _layer_grid(request.layer)
+        print(f"Layer: {layer.layer}")
+    elif request.geojson is not None:
+        print(f"GeoJSON features: {len(request.geojson.get('features', []))}")
+    else:
+        raise HTTPException(status_code=400, detail="Provide either 'layer' or 'geojson'.")
+
+    try:
+        if layer is not None:
+            navmap = layer.navigable
+            (start_px, start_km), (goal_px, goal_km) = layer.snap(*request.start), layer.snap(*request.end)
+            to_coords = layer.to_lonlat
+            transform, crs = layer.grid.transform, layer.grid.crs
+        else:
+            navmap, (start_px, start_km), (goal_px, goal_km), to_coords, transform = _geojson_navmap(request)
+            crs = "EPSG:4326"
+        H, W = navmap.shape
+
+        labels = layer.components if layer is not None else pathfinder.component_labels(navmap)
+        cost = layer.cost if layer is not None else None
+        if request.use_corridor:
+            bonus = get_corridors().bonus_raster(transform, (H, W), crs)
+            cost = bonus if cost is None else cost * bonus
+        bound, total_cost = 1.0, None
+        if not pathfinder.connected(labels, start_px, goal_px):
+            path_pixels, status = [], "unreachable"
+        elif request.max_seconds is not None or cost is not None:
+            weight = request.weight if request.max_seconds is not None else 1.0
+            result = pathfinder.anytime_pathfinding(
+                navmap, start_px, goal_px, weight, request.max_seconds, labels=labels, cost=cost
+            )
+            path_pixels, status, bound = result.path, result.status, result.bound
+            if cost is not None and result.path:
+                total_cost = round(result.cost, 3)
+        else:
+            path_pixels = pathfinder.astar_pathfinding(navmap, start_px, goal_px, jump_points=True)
+            status = "optimal" if path_pixels else "unreachable"
 
         if not path_pixels or len(path_pixels) < 2:
-            print("⚠️ No valid A* path found, using straight fallback")
-            path_coords = [
-                (request.start[0] + t * (request.end[0] - request.start[0]),
-                 request.start[1] + t * (request.end[1] - request.start[1]))
-                for t in np.linspace(0, 1, 50)
-            ]
+            print(f"⚠️ No valid A* path found ({status}), using straight fallback")
+            path_coords = _straight_line(request)
         else:
-            path_coords = [(xs[j], ys[i]) for (i, j) in path_pixels]
+            path_coords = to_coords(path_pixels)
 
         geojson_route = {
             "type": "FeatureCollection",
@@ -83,7 +298,14 @@ def compute_route(request: RouteRequest):
                         "coordinates": path_coords
                     },
                     "properties": {
-                        "method": "astar" if len(path_pixels) > 2 else "fallback"
+                        "method": "astar" if len(path_pixels) > 2 else "fallback",
+                        "grid": [H, W],
+                        "status": status,
+                        # Distance from the requested start/end to the water cells routed from.
+                        "snap_km": [round(start_km, 3), round(goal_km, 3)],
+                        **({"bound": bound} if status == "bounded" else {}),
+                        **({"cost": total_cost} if total_cost is not None else {}),
+                        **({"layer": layer.layer} if layer is not None else {}),
                     }
                 }
             ]
@@ -4,10 +4,13 @@ load_dotenv()
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from backend.api.ice_extent import router as ice_extent_router
 from backend.api.route_prediction import router as route_prediction_router
 from backend.api.route_navigation import router as route_navigation_router
+from backend.catalog import get_catalog
+from backend.rbf_model import model_status, start_warm_up
 
 API_PREFIX = os.getenv("API_PREFIX", "/api")
 app = FastAPI(title="NASA Ice Backend", version="0.1.0")
@@ -17,6 +20,20 @@ def health():
 
     return {"status": "ok"} 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until the prediction model has been loaded."""
+    status = model_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.on_event("startup")
+def build_dataset_catalog():
+    get_catalog()
+
+@app.on_event("startup")
+def warm_up_model():
+    start_warm_up()
+
 app.include_router(ice_extent_router, prefix=API_PREFIX)
 app.include_router(route_prediction_router, prefix=API_PREFIX)
 app.include_router(route_navigation_router, prefix=API_PREFIX)
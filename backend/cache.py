@@ -0,0 +1,302 @@
+"""
+Persistent, size-bounded cache for serialized API responses.
+
+Converted GeoJSON documents are stored as files under ``ICE_CACHE_DIR``
+(defaults to ``backend/instance/cache``) with a small SQLite index tracking
+their size and last access time.  The cache is shared by every worker process
+on the host, survives restarts, and evicts least-recently-used entries once
+the total size exceeds ``ICE_CACHE_MAX_BYTES`` (defaults to 2 GiB; ``0``
+disables caching).
+
+Keys are content-addressed: callers combine a fingerprint of the source file
+(path, size and modification time) with the request parameters and a code
+version, so replacing a GeoTIFF or changing the conversion logic never serves
+stale data.
+
+The cache can be pre-warmed for a whole dataset root::
+
+    python -m backend.cache warm --radius 500 --radius 200
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "instance" / "cache"
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+class ResponseCache:
+    """
+    Byte-bounded LRU cache of serialized payloads stored on disk.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self._index_path = self.root / "index.sqlite"
+        self._initialised = False
+        self._init_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialised:
+            with self._init_lock:
+                if not self._initialised:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    with sqlite3.connect(self._index_path, timeout=30) as conn:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS entries ("
+                            " key TEXT PRIMARY KEY,"
+                            " size INTEGER NOT NULL,"
+                            " last_access REAL NOT NULL)"
+                        )
+                        conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+                    self._initialised = True
+        return sqlite3.connect(self._index_path, timeout=30)
+
+    def _blob_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        try:
+            payload = self._blob_path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        finally:
+            conn.close()
+        return payload
+
+    def put(self, key: str, payload: bytes) -> None:
+        if not self.enabled or len(payload) > self.max_bytes:
+            return
+        path = self._blob_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(payload)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)",
+                    (key, len(payload), time.time()),
+                )
+            self._evict(conn)
+        finally:
+            conn.close()
+
+    def get_or_create(self, key: str, factory: Callable[[], bytes]) -> bytes:
+        payload = self.get(key)
+        if payload is None:
+            payload = factory()
+            self.put(key, payload)
+        return payload
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            victims.append(key)
+            total -= size
+        with conn:
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in victims])
+        for key in victims:
+            self._blob_path(key).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False, "entries": 0, "bytes": 0, "max_bytes": 0}
+        conn = self._connect()
+        try:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        finally:
+            conn.close()
+        return {"enabled": True, "entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+
+class ArrayCache:
+    """
+    Thread-safe, byte-bounded in-memory LRU of read-only NumPy arrays.
+
+    Holds intermediate results (e.g. probability maps) that are cheap to keep
+    per process but expensive to recompute.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._entries: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+            return array
+
+    def put(self, key: Hashable, array: np.ndarray) -> np.ndarray:
+        array.setflags(write=False)
+        if array.nbytes > self.max_bytes:
+            return array
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = array
+            self._bytes += array.nbytes
+            while self._bytes > self.max_bytes:
+                _, victim = self._entries.popitem(last=False)
+                self._bytes -= victim.nbytes
+        return array
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], np.ndarray]) -> np.ndarray:
+        array = self.get(key)
+        if array is None:
+            array = self.put(key, factory())
+        return array
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def cache_key(*parts) -> str:
+    """
+    Build a stable cache key from JSON-serializable parts.
+    """
+    token = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path) -> tuple:
+    """
+    Identify a file's content by path, size and modification time.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    return str(path), stat.st_size, stat.st_mtime_ns
+
+
+def dumps(obj) -> bytes:
+    """
+    Serialize exactly as ``fastapi.responses.JSONResponse`` would.
+    """
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_with_raw(obj: dict, raw: Dict[str, bytes]) -> bytes:
+    """
+    Serialize ``obj`` and append already-serialized JSON values from ``raw``.
+
+    Lets endpoints embed cached GeoJSON bytes in a response envelope without
+    decoding and re-encoding them.
+    """
+    head = dumps(obj)
+    if not raw:
+        return head
+    parts = [head[:-1]]
+    for i, (name, value) in enumerate(raw.items()):
+        separator = b"," if (obj or i) else b""
+        parts.append(separator + dumps(name) + b":" + value)
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+_CACHE: Optional[ResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide cache configured from the environment.
+    """
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                root = Path(os.environ.get("ICE_CACHE_DIR", DEFAULT_CACHE_DIR))
+                max_bytes = int(os.environ.get("ICE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+                _CACHE = ResponseCache(root, max_bytes)
+    return _CACHE
+
+
+def _warm(args: argparse.Namespace) -> None:
+    from concurrent.futures import ProcessPoolExecutor
+
+    from backend.converter import convert_tif_to_geojson_bytes
+
+    root = Path(args.root).resolve()
+    paths = sorted(root.rglob("*.tif"))
+    jobs = [(str(path), radius, args.engine) for path in paths for radius in args.radius]
+    print(f"Warming cache for {len(paths)} rasters x {len(args.radius)} radii under {root}")
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(convert_tif_to_geojson_bytes, *job) for job in jobs]
+        for i, (job, future) in enumerate(zip(jobs, futures), 1):
+            try:
+                future.result()
+            except Exception as exc:
+                failures += 1
+                print(f"[{i}/{len(jobs)}] {job[0]} (radius {job[1]}) failed: {exc}")
+    print(f"Done: {len(jobs) - failures} cached, {failures} failed. {get_response_cache().stats()}")
+
+
+def main(argv=None) -> None:
+    from backend.catalog import DATASET_ROOT
+    from backend.converter import DEFAULT_ENGINE, ENGINES
+
+    parser = argparse.ArgumentParser(description="Manage the persistent ice-extent response cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    warm = sub.add_parser("warm", help="Convert every GeoTIFF under the dataset root into the cache.")
+    warm.add_argument("--root", default=DATASET_ROOT, help="Dataset root to scan (defaults to ICE_DATASET_DIR).")
+    warm.add_argument("--radius", type=float, action="append", help="Radius in km; repeatable (default 500).")
+    warm.add_argument("--engine", default=DEFAULT_ENGINE, choices=ENGINES)
+    warm.add_argument("--workers", type=int, default=None)
+
+    sub.add_parser("stats", help="Print cache usage.")
+
+    args = parser.parse_args(argv)
+    if args.command == "warm":
+        args.radius = args.radius or [500.0]
+        _warm(args)
+    else:
+        print(get_response_cache().stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+In-memory catalog of the GeoTIFF archive under the dataset root.
+
+Walking ``ICE_DATASET_DIR`` with ``rglob`` on every request becomes slow once
+the full 1978–2025 daily archive is mounted.  The catalog maps each date to
+its raster(s) (path, product type, size, mtime), keeps a sorted date list for
+O(log n) range queries, and persists itself to a small SQLite index
+(``ICE_CATALOG_PATH``, defaults to ``backend/instance/catalog.sqlite``).
+
+Refreshes are incremental: directories whose modification time is unchanged
+since the last scan are not re-listed, only their known rasters are
+re-stat'ed, so files rewritten in place (same name, which leaves the
+directory's mtime alone) are still picked up.  The catalog is refreshed at startup,
+on demand (``POST /api/ice_extent/catalog/reload``) and, when
+``ICE_CATALOG_POLL_SECONDS`` is set, by a background polling thread.
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DATASET_ROOT = Path(
+    os.environ.get("ICE_DATASET_DIR", Path(__file__).resolve().parent / "datasets")
+).resolve()
+CATALOG_PATH = Path(
+    os.environ.get("ICE_CATALOG_PATH", Path(__file__).resolve().parent / "instance" / "catalog.sqlite")
+)
+DATE_TOKEN = re.compile(r"(\d{8})")
+PRODUCT_PATTERN = re.compile(r"^[NS]_\d{8}_(.+)$")
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    date: str  # YYYY-MM-DD
+    path: str
+    product: str
+    size: int
+    mtime_ns: int
+
+    @property
+    def token(self) -> str:
+        return self.date.replace("-", "")
+
+
+def _entry_for(path: str, size: int, mtime_ns: int) -> Optional[CatalogEntry]:
+    stem = Path(path).stem
+    match = DATE_TOKEN.search(stem)
+    if not match:
+        return None
+    token = match.group(1)
+    product = PRODUCT_PATTERN.match(stem)
+    return CatalogEntry(
+        date=f"{token[:4]}-{token[4:6]}-{token[6:8]}",
+        path=path,
+        product=product.group(1) if product else stem,
+        size=size,
+        mtime_ns=mtime_ns,
+    )
+
+
+def _restat(files: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+    """
+    ``files`` with their current size and mtime (vanished files dropped);
+    the same list when nothing changed.
+    """
+    current = []
+    changed = False
+    for path, size, mtime_ns in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            changed = True
+            continue
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            changed = True
+        current.append((path, stat.st_size, stat.st_mtime_ns))
+    return current if changed else files
+
+
+class DatasetCatalog:
+    """
+    Date-indexed view of the GeoTIFF archive, persisted to SQLite.
+    """
+
+    def __init__(self, root: Path = DATASET_ROOT, index_path: Optional[Path] = CATALOG_PATH):
+        self.root = Path(root).resolve()
+        self.index_path = Path(index_path) if index_path else None
+        self._lock = threading.Lock()
+        # directory -> (mtime_ns, child directories, files as (path, size, mtime_ns))
+        self._dirs: Dict[str, Tuple[int, List[str], List[Tuple[str, int, int]]]] = {}
+        self._by_date: Dict[str, List[CatalogEntry]] = {}
+        self._dates: List[str] = []
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._load_index()
+
+    # ------------------------------------------------------------------ queries
+    def find(self, date: str) -> Optional[CatalogEntry]:
+        """Return the raster for a ``YYYY-MM-DD`` date, if any."""
+        candidates = self._by_date.get(date)
+        if not candidates:
+            return None
+        token = date.replace("-", "")
+        exact = [entry for entry in candidates if Path(entry.path).stem.startswith(token)]
+        return exact[0] if exact else candidates[0]
+
+    def dates(self, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        """Sorted available dates, optionally restricted to ``[start, end]``."""
+        dates = self._dates
+        lo = bisect.bisect_left(dates, start) if start else 0
+        hi = bisect.bisect_right(dates, end) if end else len(dates)
+        return dates[lo:hi]
+
+    def entries(self, start: Optional[str] = None, end: Optional[str] = None) -> List[CatalogEntry]:
+        """One raster per date in ``[start, end]``, in date order."""
+        return [self.find(date) for date in self.dates(start, end)]
+
+    def year(self, year: int) -> List[CatalogEntry]:
+        return self.entries(f"{year:04d}-01-01", f"{year:04d}-12-31")
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    # ------------------------------------------------------------------ refresh
+    def refresh(self, full: bool = False) -> Dict[str, int]:
+        """
+        Rescan the dataset root, re-listing only directories that changed
+        and re-stat'ing the rasters of the others.
+
+        Returns counts of added, removed and updated rasters.
+        """
+        with self._lock:
+            previous = {entry.path: entry for entries in self._by_date.values() for entry in entries}
+            old_dirs = {} if full else self._dirs
+            new_dirs: Dict[str, Tuple[int, List[str], List[Tuple[str, int, int]]]] = {}
+            relisted: List[str] = []
+            if self.root.is_dir():
+                self._scan(str(self.root), old_dirs, new_dirs, relisted)
+            removed_dirs = [path for path in self._dirs if path not in new_dirs]
+            if not relisted and not removed_dirs:
+                return {"added": 0, "removed": 0, "updated": 0}
+
+            by_date: Dict[str, List[CatalogEntry]] = {}
+            for _, _, files in new_dirs.values():
+                for path, size, mtime_ns in files:
+                    entry = previous.get(path)
+                    if entry is None or entry.size != size or entry.mtime_ns != mtime_ns:
+                        entry = _entry_for(path, size, mtime_ns)
+                    if entry is not None:
+                        by_date.setdefault(entry.date, []).append(entry)
+            for entries in by_date.values():
+                entries.sort(key=lambda entry: entry.path)
+
+            current = {entry.path: entry for entries in by_date.values() for entry in entries}
+            stats = {
+                "added": len(current.keys() - previous.keys()),
+                "removed": len(previous.keys() - current.keys()),
+                "updated": sum(1 for path in current.keys() & previous.keys() if current[path] != previous[path]),
+            }
+
+            self._dirs = new_dirs
+            self._by_date = by_date
+            self._dates = sorted(by_date)
+            self._save_index(relisted, removed_dirs, rewrite=full)
+            return stats
+
+    def _scan(self, directory: str, old_dirs, new_dirs, relisted: List[str]) -> None:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        cached = old_dirs.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            subdirs, files = cached[1], _restat(cached[2])
+            if files is not cached[2]:
+                relisted.append(directory)
+        else:
+            subdirs, files = [], []
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if item.is_dir(follow_symlinks=True):
+                            subdirs.append(item.path)
+                        elif item.name.endswith(".tif") and item.is_file(follow_symlinks=True):
+                            stat = item.stat()
+                            files.append((item.path, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                return
+            relisted.append(directory)
+        new_dirs[directory] = (mtime_ns, subdirs, files)
+        for subdir in subdirs:
+            self._scan(subdir, old_dirs, new_dirs, relisted)
+
+    def start_polling(self, interval_seconds: float) -> None:
+        """Refresh the catalog every ``interval_seconds`` in a daemon thread."""
+        if self._poller is not None or interval_seconds <= 0:
+            return
+
+        def _poll() -> None:
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.refresh()
+                except Exception as exc:  # pragma: no cover - keep polling
+                    print(f"Catalog refresh failed: {exc}")
+
+        self._poller = threading.Thread(target=_poll, name="dataset-catalog-poll", daemon=True)
+        self._poller.start()
+
+    def stop_polling(self) -> None:
+        self._stop.set()
+
+    # ------------------------------------------------------------- persistence
+    def _connect(self) -> sqlite3.Connection:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, subdirs TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, dir TEXT NOT NULL, date TEXT, product TEXT,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS files_date ON files(date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS files_dir ON files(dir)")
+        return conn
+
+    def _load_index(self) -> None:
+        if self.index_path is None or not self.index_path.exists():
+            return
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+            if row is None or row[0] != str(self.root):
+                # Index belongs to another dataset root; start from scratch.
+                conn.execute("DELETE FROM dirs")
+                conn.execute("DELETE FROM files")
+                conn.commit()
+                return
+            files: Dict[str, List[Tuple[str, int, int]]] = {}
+            for path, directory, size, mtime_ns in conn.execute("SELECT path, dir, size, mtime_ns FROM files"):
+                files.setdefault(directory, []).append((path, size, mtime_ns))
+            dirs = {
+                path: (mtime_ns, [p for p in subdirs.split("\n") if p], files.get(path, []))
+                for path, mtime_ns, subdirs in conn.execute("SELECT path, mtime_ns, subdirs FROM dirs")
+            }
+        except sqlite3.Error:
+            return
+        finally:
+            conn.close()
+
+        by_date: Dict[str, List[CatalogEntry]] = {}
+        for _, _, dir_files in dirs.values():
+            for path, size, mtime_ns in dir_files:
+                entry = _entry_for(path, size, mtime_ns)
+                if entry is not None:
+                    by_date.setdefault(entry.date, []).append(entry)
+        for entries in by_date.values():
+            entries.sort(key=lambda entry: entry.path)
+        self._dirs = dirs
+        self._by_date = by_date
+        self._dates = sorted(by_date)
+
+    def _save_index(self, relisted: List[str], removed_dirs: List[str], rewrite: bool = False) -> None:
+        if self.index_path is None:
+            return
+        try:
+            conn = self._connect()
+        except (OSError, sqlite3.Error) as exc:
+            print(f"Could not persist dataset catalog to {self.index_path}: {exc}")
+            return
+        try:
+            with conn:
+                if rewrite:
+                    conn.execute("DELETE FROM dirs")
+                    conn.execute("DELETE FROM files")
+                stale = [(path,) for path in (*removed_dirs, *relisted)]
+                conn.executemany("DELETE FROM dirs WHERE path = ?", stale)
+                conn.executemany("DELETE FROM files WHERE dir = ?", stale)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root', ?)", (str(self.root),))
+
+                conn.executemany(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+                    [
+                        (path, self._dirs[path][0], "\n".join(self._dirs[path][1]))
+                        for path in relisted
+                    ],
+                )
+                rows = []
+                for directory in relisted:
+                    for path, size, mtime_ns in self._dirs[directory][2]:
+                        entry = _entry_for(path, size, mtime_ns)
+                        rows.append((
+                            path,
+                            directory,
+                            entry.date if entry else None,
+                            entry.product if entry else None,
+                            size,
+                            mtime_ns,
+                        ))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, dir, date, product, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        finally:
+            conn.close()
+
+
+_CATALOG: Optional[DatasetCatalog] = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def get_catalog() -> DatasetCatalog:
+    """
+    Return the process-wide catalog, building it (and starting the poller) on first use.
+    """
+    global _CATALOG
+    if _CATALOG is None:
+        with _CATALOG_LOCK:
+            if _CATALOG is None:
+                catalog = DatasetCatalog(DATASET_ROOT, CATALOG_PATH)
+                catalog.refresh()
+                catalog.start_polling(float(os.environ.get("ICE_CATALOG_POLL_SECONDS", "0")))
+                _CATALOG = catalog
+    return _CATALOG
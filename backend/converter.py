@@ -1,28 +1,92 @@
 """
 Utilities for converting sea-ice GeoTIFF rasters into GeoJSON point clouds.
 
-The heavy lifting is done with rasterio, NumPy, and GeoPandas.  Converted
-feature collections can be cached in-memory so repeated requests for the same
-file are fast.
+The heavy lifting is done with rasterio, NumPy, and pyproj.  Per-pixel
+coordinates and the pole-distance radius masks come from the shared grid
+geometry cache in :mod:`backend.grid`.  Two conversion engines are available:
+
+- ``columnar`` (default) masks the raster, looks up the precomputed WGS84
+  coordinate arrays and assembles the FeatureCollection directly, without
+  creating shapely or GeoPandas objects.
+- ``geopandas`` is the original implementation that builds one shapely
+  ``Point`` per pixel and reprojects through a GeoDataFrame.
+
+Rasters that have been packed into the data cube (:mod:`backend.cube`, at
+``ICE_CUBE_DIR``, defaulting to ``<dataset root>/cube``) are read from its
+memory map instead of the GeoTIFF, as long as the source file is unchanged.
+
+Both engines produce identical output.  With ``geometry="polygon"`` the ice
+mask is instead traced into a dissolved, optionally simplified MultiPolygon
+(:mod:`backend.polygons`).  Serialized feature collections are
+stored in the persistent response cache (:mod:`backend.cache`) keyed by the
+file's fingerprint, the request parameters and ``CONVERTER_VERSION``.
 """
 from __future__ import annotations
 
-from functools import lru_cache
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
-from typing import Dict, Iterable, Tuple
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import geopandas as gpd
 import numpy as np
 import rasterio
-from rasterio.transform import xy as transform_xy
 from shapely.geometry import Point
 
+from backend.cache import cache_key, dumps, file_fingerprint, get_response_cache
+from backend.catalog import DATASET_ROOT
+from backend.cube import CubeError, IceCube
+from backend.grid import GridGeometry, get_grid_geometry
+from backend.maskcodec import FORMAT_VERSION as MASK_FORMAT_VERSION
+from backend.maskcodec import MASK_ENCODINGS, encode_raster, grid_header
+from backend.polygons import DEFAULT_GEOMETRY, GEOMETRIES, build_polygon_features
+
+ENGINES = ("columnar", "geopandas")
+DEFAULT_ENGINE = "columnar"
+# Bump whenever the GeoJSON produced for a given raster changes.
+CONVERTER_VERSION = 1
+CUBE_DIR = Path(os.environ.get("ICE_CUBE_DIR", DATASET_ROOT / "cube"))
+
+_cube: Optional[IceCube] = None
+_cube_lock = threading.Lock()
+
 
 class GeoDataConversionError(RuntimeError):
     """Raised when we fail to convert a GeoTIFF into GeoJSON."""
 
 
-def _load_raster(path: Path) -> Tuple[np.ndarray, rasterio.Affine, rasterio.crs.CRS]:
+def _ice_cube() -> Optional[IceCube]:
+    """Return the packed data cube if one has been built, picking up appends."""
+    global _cube
+    with _cube_lock:
+        try:
+            if _cube is None:
+                if not (CUBE_DIR / "meta.json").exists():
+                    return None
+                _cube = IceCube(CUBE_DIR)
+            else:
+                _cube.refresh()
+        except (CubeError, OSError, ValueError):
+            _cube = None
+        return _cube
+
+
+def load_raster(path: Path) -> Tuple[np.ndarray, rasterio.Affine, rasterio.crs.CRS]:
+    """
+    Class codes, transform and CRS of a daily raster, served from the packed
+    cube when it holds the unchanged file.
+
+    Raises ``GeoDataConversionError`` if the raster cannot be read.
+    """
+    cube = _ice_cube()
+    if cube is not None:
+        index = cube.lookup_source(path)
+        if index is not None:
+            return cube.codes[index], cube.transform, cube.crs
+
     try:
         with rasterio.open(path) as src:
             data = src.read(1)
@@ -37,37 +101,22 @@ def _load_raster(path: Path) -> Tuple[np.ndarray, rasterio.Affine, rasterio.crs.
     return data, transform, crs
 
 
-def _pixel_coordinates(
-    transform: rasterio.Affine, width: int, height: int
-) -> Tuple[np.ndarray, np.ndarray]:
-    """
-    Compute the projected coordinates for every pixel center in the raster.
-    """
-    cols, rows = np.meshgrid(np.arange(width), np.arange(height))
-    xs = transform.c + cols * transform.a + rows * transform.b
-    ys = transform.f + cols * transform.d + rows * transform.e
-    return xs, ys
-
-
-def _filter_points(
-    data: np.ndarray,
-    xs: np.ndarray,
-    ys: np.ndarray,
-    radius_km: float,
-    transform: rasterio.Affine,
-) -> Iterable[Point]:
+def _ice_mask(data: np.ndarray, grid: GridGeometry, radius_km: float) -> np.ndarray:
     """
     Mask the raster to keep only pixels whose value indicates ice presence
     and whose distance from the origin exceeds the desired radius.
     """
-    if data.shape != xs.shape or xs.shape != ys.shape:
+    if data.shape != grid.shape:
         raise GeoDataConversionError("Raster dimensions mismatch while generating coordinates.")
+    return (data == 1) & grid.radius_mask(radius_km)
+
 
-    dist_km = np.sqrt(xs**2 + ys**2) / 1000
-    mask = (data == 1) & (dist_km > radius_km)
-    rows, cols = np.where(mask)
-    xs_filtered, ys_filtered = transform_xy(transform, rows, cols)
-    for x, y in zip(xs_filtered, ys_filtered):
+def _filter_points(data: np.ndarray, grid: GridGeometry, radius_km: float) -> Iterable[Point]:
+    """
+    Yield a shapely ``Point`` per ice pixel centre; used by the ``geopandas`` engine.
+    """
+    mask = _ice_mask(data, grid, radius_km)
+    for x, y in zip(grid.x[mask], grid.y[mask]):
         yield Point(x, y)
 
 
@@ -80,18 +129,216 @@ def _to_feature_collection(points: Iterable[Point], crs) -> Dict:
     return gdf.__geo_interface__
 
 
-@lru_cache(maxsize=128)
-def convert_tif_to_geojson(path: str, radius_km: float = 500) -> Dict:
+def build_point_features(
+    lons: np.ndarray,
+    lats: np.ndarray,
+    properties: Optional[Dict[str, Sequence]] = None,
+    show_bbox: bool = True,
+    coordinate_type=tuple,
+) -> Dict:
+    """
+    Assemble a GeoJSON FeatureCollection of Point features from coordinate arrays.
+
+    ``properties`` maps a property name to either a scalar shared by every
+    feature or a per-feature sequence.  With ``show_bbox`` the output mirrors
+    ``GeoDataFrame.__geo_interface__``; without it, ``GeoDataFrame.to_json``.
+    """
+    if len(lons) == 0:
+        return {"type": "FeatureCollection", "features": []}
+
+    xs: List[float] = np.asarray(lons, dtype=np.float64).tolist()
+    ys: List[float] = np.asarray(lats, dtype=np.float64).tolist()
+
+    columns = []
+    for name, value in (properties or {}).items():
+        if isinstance(value, (str, bytes)) or np.isscalar(value):
+            columns.append((name, None, value))
+        else:
+            columns.append((name, np.asarray(value).tolist(), None))
+
+    features = []
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        props = {name: (values[i] if values is not None else scalar) for name, values, scalar in columns}
+        feature = {
+            "id": str(i),
+            "type": "Feature",
+            "properties": props,
+            "geometry": {"type": "Point", "coordinates": coordinate_type((x, y))},
+        }
+        if show_bbox:
+            feature["bbox"] = (x, y, x, y)
+        features.append(feature)
+
+    collection: Dict = {"type": "FeatureCollection", "features": features}
+    if show_bbox:
+        collection["bbox"] = (min(xs), min(ys), max(xs), max(ys))
+    return collection
+
+
+def _check_engine(engine: str, geometry: str = DEFAULT_GEOMETRY) -> None:
+    if engine not in ENGINES:
+        raise GeoDataConversionError(f"Unknown conversion engine '{engine}'; expected one of {ENGINES}.")
+    if geometry not in GEOMETRIES:
+        raise GeoDataConversionError(f"Unknown geometry '{geometry}'; expected one of {GEOMETRIES}.")
+
+
+def _geojson_key(path, radius_km: float, engine: str, geometry: str, zoom: Optional[int]) -> str:
+    if geometry == "point":
+        zoom = None
+    return cache_key(
+        "geojson", file_fingerprint(path), float(radius_km), engine, geometry, zoom, CONVERTER_VERSION
+    )
+
+
+def convert_tif_to_geojson(
+    path: str,
+    radius_km: float = 500,
+    engine: str = DEFAULT_ENGINE,
+    geometry: str = DEFAULT_GEOMETRY,
+    zoom: Optional[int] = None,
+) -> Dict:
     """
     Convert a GeoTIFF file into a GeoJSON FeatureCollection (as a dict).
 
-    Results are cached in-memory keyed by the file path and radius.
+    ``engine`` selects the ``columnar`` or ``geopandas`` conversion path for
+    point output.  ``geometry="polygon"`` returns the dissolved ice outline
+    instead, simplified for web-map ``zoom`` when given.
+    This function does not cache; see :func:`convert_tif_to_geojson_bytes`.
     """
+    _check_engine(engine, geometry)
     tif_path = Path(path)
     if not tif_path.exists():
         raise FileNotFoundError(f"GeoTIFF not found at {tif_path}")
 
-    data, transform, crs = _load_raster(tif_path)
-    xs, ys = _pixel_coordinates(transform, data.shape[1], data.shape[0])
-    points = list(_filter_points(data, xs, ys, radius_km, transform))
-    return _to_feature_collection(points, crs)
+    data, transform, crs = load_raster(tif_path)
+    grid = get_grid_geometry(transform, data.shape, crs)
+    if geometry == "polygon":
+        return build_polygon_features(_ice_mask(data, grid, radius_km), grid, zoom=zoom)
+    if engine == "geopandas":
+        points = list(_filter_points(data, grid, radius_km))
+        return _to_feature_collection(points, crs)
+
+    mask = _ice_mask(data, grid, radius_km)
+    return build_point_features(grid.lon[mask], grid.lat[mask])
+
+
+def convert_tif_to_geojson_bytes(
+    path: str,
+    radius_km: float = 500,
+    engine: str = DEFAULT_ENGINE,
+    geometry: str = DEFAULT_GEOMETRY,
+    zoom: Optional[int] = None,
+) -> bytes:
+    """
+    Return the serialized GeoJSON FeatureCollection for a GeoTIFF file.
+
+    Results are stored in the persistent response cache keyed by the file's
+    path, size and modification time, the radius, the engine, the geometry
+    mode and zoom, and ``CONVERTER_VERSION``.
+    """
+    _check_engine(engine, geometry)
+    tif_path = Path(path)
+    if not tif_path.exists():
+        raise FileNotFoundError(f"GeoTIFF not found at {tif_path}")
+
+    key = _geojson_key(tif_path, radius_km, engine, geometry, zoom)
+    return get_response_cache().get_or_create(
+        key, lambda: dumps(convert_tif_to_geojson(str(tif_path), radius_km, engine, geometry, zoom))
+    )
+
+
+def mask_cache_key(path: str, radius_km: float = 500, encoding: str = "bits") -> str:
+    """Cache key (also used as the HTTP ETag) of a binary ice mask."""
+    return cache_key("mask", file_fingerprint(path), float(radius_km), encoding, MASK_FORMAT_VERSION)
+
+
+def convert_tif_to_mask_bytes(path: str, radius_km: float = 500, encoding: str = "bits") -> bytes:
+    """
+    Return the ice mask of a GeoTIFF as a compact binary payload (see
+    :mod:`backend.maskcodec`), cached like the GeoJSON output.
+    """
+    if encoding not in MASK_ENCODINGS:
+        raise GeoDataConversionError(f"Unknown mask encoding '{encoding}'; expected one of {MASK_ENCODINGS}.")
+    tif_path = Path(path)
+    if not tif_path.exists():
+        raise FileNotFoundError(f"GeoTIFF not found at {tif_path}")
+
+    def _encode() -> bytes:
+        data, transform, crs = load_raster(tif_path)
+        grid = get_grid_geometry(transform, data.shape, crs)
+        mask = _ice_mask(data, grid, radius_km)
+        return encode_raster(mask, encoding, {**grid_header(transform, crs), "radius_km": float(radius_km)})
+
+    return get_response_cache().get_or_create(mask_cache_key(str(tif_path), radius_km, encoding), _encode)
+
+
+CONVERT_WORKERS = int(os.environ.get("ICE_CONVERT_WORKERS", "0")) or None
+CONVERT_MAX_IN_FLIGHT = int(os.environ.get("ICE_CONVERT_MAX_IN_FLIGHT", "0")) or None
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _conversion_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned (not forked) workers: the API process runs background threads.
+            _pool = ProcessPoolExecutor(max_workers=CONVERT_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def iter_converted_geojson(
+    paths: Sequence[str],
+    radius_km: float = 500,
+    engine: str = DEFAULT_ENGINE,
+    geometry: str = DEFAULT_GEOMETRY,
+    zoom: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[Tuple[str, Optional[bytes], Optional[Exception]]]:
+    """
+    Convert many rasters on a process pool, yielding ``(path, geojson_bytes, error)``
+    in input order.
+
+    At most ``max_in_flight`` conversions are queued at once, and new work is
+    only submitted as results are consumed, so a slow client applies
+    backpressure instead of the server buffering a whole year.  Results that
+    are already cached are served without touching the pool.
+    """
+    _check_engine(engine, geometry)
+    pool = _conversion_pool()
+    limit = max_in_flight or CONVERT_MAX_IN_FLIGHT or 2 * (CONVERT_WORKERS or os.cpu_count() or 1)
+    cache = get_response_cache()
+    pending: Deque[Tuple[str, Future]] = deque()
+    queue = iter(paths)
+
+    def _submit_next() -> bool:
+        path = next(queue, None)
+        if path is None:
+            return False
+        future: Future
+        try:
+            cached = cache.get(_geojson_key(path, radius_km, engine, geometry, zoom))
+        except OSError:
+            cached = None
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+        else:
+            future = pool.submit(convert_tif_to_geojson_bytes, path, radius_km, engine, geometry, zoom)
+        pending.append((path, future))
+        return True
+
+    try:
+        while len(pending) < limit and _submit_next():
+            pass
+        while pending:
+            path, future = pending.popleft()
+            try:
+                yield path, future.result(), None
+            except Exception as exc:
+                yield path, None, exc
+            _submit_next()
+    finally:
+        for _, future in pending:
+            future.cancel()
@@ -0,0 +1,385 @@
+"""
+Packed daily sea-ice data cube built from the NSIDC GeoTIFF archive.
+
+Every daily ``N_YYYYMMDD_extent_v4.0.tif`` shares one 25 km grid, so the
+archive is consolidated into a single memory-mapped ``T x H x W`` array:
+
+- ``codes.u8``: raw NSIDC class codes per day (0 ocean, 1 ice, 253 coast,
+  254 land, 255 missing) as uint8
+- ``ice_bits.u8``: the ice masks (code 1) bit-packed along the row axis
+- ``land_mask.npy`` / ``coast_mask.npy`` / ``valid_mask.npy``: shared masks
+  accumulated over every day in the cube
+- ``meta.json``: grid transform/CRS, the sorted date index and the source
+  fingerprint (path, size, mtime) of every day
+
+Readers serve one day, a date range or a single pixel's time series straight
+from the memory map, without opening any GeoTIFF.  Builds merge into an
+existing cube: new days are appended in place (the metadata is written last
+so concurrent readers never see a partially written frame) and days whose
+source file changed are rewritten in their frame.
+
+Build or extend a cube with::
+
+    python -m backend.cube build --root backend/datasets --out backend/datasets/cube
+
+``ice-predict`` imports this module through ``seaice_forecast/cube.py``, so
+both sides share one reader and writer of the format.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as Date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import rasterio
+
+CUBE_FORMAT_VERSION = 1
+ICE_CODE = 1
+COAST_CODE = 253
+LAND_CODE = 254
+# Days scanned at a time when the shared masks are recomputed from the cube.
+MASK_BLOCK_DAYS = 256
+DATE_TOKEN = re.compile(r"(\d{8})")
+
+
+class CubeError(RuntimeError):
+    """Raised when a cube cannot be built or read."""
+
+
+def _iso(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, Date):
+        return value.isoformat()
+    value = str(value)
+    if len(value) == 8 and value.isdigit():
+        return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    return value
+
+
+def discover_rasters(root) -> List[Tuple[str, str]]:
+    """
+    Return ``(YYYY-MM-DD, path)`` pairs for every dated GeoTIFF under ``root``,
+    one per date, sorted by date.
+    """
+    found: Dict[str, str] = {}
+    for path in sorted(Path(root).rglob("*.tif")):
+        match = DATE_TOKEN.search(path.stem)
+        if match:
+            found.setdefault(_iso(match.group(1)), str(path.resolve()))
+    return sorted(found.items())
+
+
+def _fingerprint(path: str) -> List:
+    stat = os.stat(path)
+    return [str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns]
+
+
+def _read_codes(path: str) -> Tuple[np.ndarray, rasterio.Affine, object]:
+    with rasterio.open(path) as src:
+        return src.read(1), src.transform, src.crs
+
+
+class IceCube:
+    """
+    Read-only view of a packed cube directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._meta_mtime_ns: Optional[int] = None
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Re-read the metadata if the cube was extended; returns True if it changed."""
+        meta_path = self.directory / "meta.json"
+        try:
+            mtime_ns = meta_path.stat().st_mtime_ns
+        except FileNotFoundError as exc:
+            raise CubeError(f"No cube found at {self.directory}") from exc
+        if mtime_ns == self._meta_mtime_ns:
+            return False
+
+        with self._lock:
+            meta = json.loads(meta_path.read_text())
+            if meta.get("version") != CUBE_FORMAT_VERSION:
+                raise CubeError(f"Unsupported cube version {meta.get('version')} at {self.directory}")
+            self.height, self.width = meta["shape"]
+            self.transform = rasterio.Affine(*meta["transform"])
+            self.crs = rasterio.crs.CRS.from_wkt(meta["crs"])
+            self.dates: List[str] = meta["dates"]
+            self.sources: List[List] = meta["sources"]
+            self._date_index = {d: i for i, d in enumerate(self.dates)}
+            self._source_index = {src[0]: i for i, src in enumerate(self.sources)}
+
+            count = len(self.dates)
+            shape = (count, self.height, self.width)
+            self.codes = np.memmap(self.directory / "codes.u8", dtype=np.uint8, mode="r", shape=shape)
+            packed_shape = (count, self.height, (self.width + 7) // 8)
+            self.ice_bits = np.memmap(self.directory / "ice_bits.u8", dtype=np.uint8, mode="r", shape=packed_shape)
+            self.land_mask = np.load(self.directory / "land_mask.npy")
+            self.coast_mask = np.load(self.directory / "coast_mask.npy")
+            self.valid_mask = np.load(self.directory / "valid_mask.npy")
+            self._meta_mtime_ns = mtime_ns
+        return True
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __contains__(self, value) -> bool:
+        return _iso(value) in self._date_index
+
+    def index(self, value) -> int:
+        try:
+            return self._date_index[_iso(value)]
+        except KeyError as exc:
+            raise KeyError(f"Date {_iso(value)} is not in the cube") from exc
+
+    def lookup_source(self, path) -> Optional[int]:
+        """
+        Index of the day built from ``path``, if that file is unchanged since.
+        """
+        try:
+            fingerprint = _fingerprint(str(path))
+        except OSError:
+            return None
+        i = self._source_index.get(fingerprint[0])
+        if i is None or self.sources[i] != fingerprint:
+            return None
+        return i
+
+    def _slice(self, start, end) -> slice:
+        lo = bisect.bisect_left(self.dates, _iso(start)) if start is not None else 0
+        hi = bisect.bisect_right(self.dates, _iso(end)) if end is not None else len(self.dates)
+        return slice(lo, hi)
+
+    def day(self, value) -> np.ndarray:
+        """Class codes ``(H, W)`` for one day."""
+        return self.codes[self.index(value)]
+
+    def ice(self, value) -> np.ndarray:
+        """Boolean ice mask ``(H, W)`` for one day, unpacked from the bit cube."""
+        i = self.index(value)
+        return np.unpackbits(self.ice_bits[i], axis=-1, count=self.width).astype(bool)
+
+    def range(self, start=None, end=None) -> Tuple[List[str], np.ndarray]:
+        """Dates and class codes ``(T', H, W)`` for ``[start, end]`` (a view, not a copy)."""
+        window = self._slice(start, end)
+        return self.dates[window], self.codes[window]
+
+    def ice_range(self, start=None, end=None) -> Tuple[List[str], np.ndarray]:
+        """Dates and boolean ice masks ``(T', H, W)`` for ``[start, end]``."""
+        window = self._slice(start, end)
+        masks = np.unpackbits(self.ice_bits[window], axis=-1, count=self.width).astype(bool)
+        return self.dates[window], masks
+
+    def series(self, row: int, col: int, start=None, end=None) -> Tuple[List[str], np.ndarray]:
+        """Dates and class codes of one pixel over ``[start, end]``."""
+        window = self._slice(start, end)
+        return self.dates[window], np.asarray(self.codes[window, row, col])
+
+
+def _write_atomic(path: Path, writer) -> None:
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}-", dir=path.parent)
+    os.close(fd)
+    try:
+        writer(tmp_name)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def _save_npy(path: str, array: np.ndarray) -> None:
+    with open(path, "wb") as fh:
+        np.save(fh, array)
+
+
+def _accumulate_masks(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Land and coast masks over every day of a ``(T, H, W)`` code cube, read in blocks."""
+    land = np.zeros(codes.shape[1:], dtype=bool)
+    coast = np.zeros(codes.shape[1:], dtype=bool)
+    for lo in range(0, codes.shape[0], MASK_BLOCK_DAYS):
+        block = np.asarray(codes[lo : lo + MASK_BLOCK_DAYS])
+        land |= (block == LAND_CODE).any(axis=0)
+        coast |= (block == COAST_CODE).any(axis=0)
+    return land, coast
+
+
+def build_cube(
+    rasters: Sequence[Tuple[str, str]],
+    directory,
+    workers: Optional[int] = None,
+    progress: bool = True,
+) -> IceCube:
+    """
+    Create the cube at ``directory`` from ``(date, path)`` pairs, or merge
+    them into the existing one.
+
+    Days already in the cube are always kept, so a build from a subset of
+    the archive (e.g. ``--start``/``--end``) never drops history.  Days with
+    an unchanged source file are skipped, days whose source changed are
+    rewritten in their frame, and new days after the last one are appended
+    in place.  New days before it are merged in by repacking into staging
+    files, copying the other frames from the existing cube.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rasters = sorted((_iso(d), str(p)) for d, p in rasters)
+    if not rasters:
+        raise CubeError("No rasters to pack.")
+
+    existing: Optional[IceCube] = None
+    changed: List[Tuple[int, str, str]] = []
+    new = rasters
+    if (directory / "meta.json").exists():
+        existing = IceCube(directory)
+        changed = [
+            (existing.index(d), d, p)
+            for d, p in rasters
+            if d in existing and existing.sources[existing.index(d)] != _fingerprint(p)
+        ]
+        new = [(d, p) for d, p in rasters if d not in existing]
+        if not changed and not new:
+            return existing
+
+    first_codes, transform, crs = _read_codes((new or changed)[0][-1])
+    height, width = first_codes.shape
+    if existing is not None and (
+        (existing.height, existing.width) != (height, width) or tuple(existing.transform) != tuple(transform)
+    ):
+        raise CubeError("New rasters do not match the cube's grid.")
+
+    # Frames to write as (index, date, source): a GeoTIFF path, or the index of
+    # a frame copied from the existing cube.
+    writes: List[Tuple[int, str, Union[str, int]]]
+    in_place = existing is not None and (not new or new[0][0] > existing.dates[-1])
+    if in_place:
+        base = len(existing)
+        dates, sources = list(existing.dates), list(existing.sources)
+        writes = [(i, d, p) for i, d, p in changed]
+        writes += [(base + offset, d, p) for offset, (d, p) in enumerate(new)]
+        dates += [d for d, _ in new]
+        sources += [None] * len(new)
+        land = existing.land_mask.copy()
+        coast = existing.coast_mask.copy()
+        mode = "r+"
+    else:
+        merged: Dict[str, Union[str, int]] = {}
+        if existing is not None:
+            merged.update((d, i) for i, d in enumerate(existing.dates))
+        merged.update((d, p) for d, p in new)
+        merged.update((d, p) for _, d, p in changed)
+        dates = sorted(merged)
+        sources = [existing.sources[merged[d]] if isinstance(merged[d], int) else None for d in dates]
+        writes = [(i, d, merged[d]) for i, d in enumerate(dates)]
+        land = np.zeros((height, width), dtype=bool)
+        coast = np.zeros((height, width), dtype=bool)
+        mode = "w+"
+
+    total = len(dates)
+    packed_width = (width + 7) // 8
+    codes_path = directory / "codes.u8"
+    bits_path = directory / "ice_bits.u8"
+    if mode == "w+":
+        # Rebuild into staging files so readers keep their current mapping.
+        codes_path = directory / ".codes.u8.partial"
+        bits_path = directory / ".ice_bits.u8.partial"
+    else:
+        for path, row_bytes in ((codes_path, height * width), (bits_path, height * packed_width)):
+            with open(path, "r+b") as fh:
+                fh.truncate(total * row_bytes)
+    codes = np.memmap(codes_path, dtype=np.uint8, mode=mode, shape=(total, height, width))
+    bits = np.memmap(bits_path, dtype=np.uint8, mode=mode, shape=(total, height, packed_width))
+
+    def _load(item: Tuple[int, str, Union[str, int]]):
+        i, day, source = item
+        if isinstance(source, int):
+            return i, day, source, np.asarray(existing.codes[source])
+        data, day_transform, _ = _read_codes(source)
+        if data.shape != (height, width) or tuple(day_transform) != tuple(transform):
+            raise CubeError(f"{source} does not match the cube's grid.")
+        return i, day, source, data
+
+    iterator: Iterable = ThreadPoolExecutor(max_workers=workers).map(_load, writes)
+    if progress:
+        try:
+            from tqdm import tqdm
+
+            iterator = tqdm(iterator, total=len(writes), desc="Packing cube")
+        except ImportError:  # pragma: no cover - tqdm is optional
+            pass
+
+    for i, day, source, data in iterator:
+        codes[i] = data
+        bits[i] = np.packbits(data == ICE_CODE, axis=-1)
+        land |= data == LAND_CODE
+        coast |= data == COAST_CODE
+        if not isinstance(source, int):
+            sources[i] = _fingerprint(source)
+    codes.flush()
+    bits.flush()
+    if changed and mode == "r+":
+        # Rewritten days may have dropped land/coast pixels the old masks still hold.
+        land, coast = _accumulate_masks(codes)
+    del codes, bits
+    if mode == "w+":
+        os.replace(codes_path, directory / "codes.u8")
+        os.replace(bits_path, directory / "ice_bits.u8")
+
+    valid = ~(land | coast)
+    for name, mask in (("land_mask", land), ("coast_mask", coast), ("valid_mask", valid)):
+        _write_atomic(directory / f"{name}.npy", lambda tmp, mask=mask: _save_npy(tmp, mask))
+
+    meta = {
+        "version": CUBE_FORMAT_VERSION,
+        "shape": [height, width],
+        "transform": list(transform)[:6],
+        "crs": rasterio.crs.CRS.from_user_input(crs).to_wkt(),
+        "dates": dates,
+        "sources": sources,
+    }
+    _write_atomic(directory / "meta.json", lambda tmp: Path(tmp).write_text(json.dumps(meta)))
+    return IceCube(directory)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build or inspect the packed sea-ice data cube.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Pack (or extend) a cube from a GeoTIFF archive.")
+    build.add_argument("--root", required=True, help="Directory containing N_YYYYMMDD_*.tif files.")
+    build.add_argument("--out", required=True, help="Cube directory to create or extend.")
+    build.add_argument("--start", help="First date to add (YYYY-MM-DD); days already in the cube are kept.")
+    build.add_argument("--end", help="Last date to add (YYYY-MM-DD); days already in the cube are kept.")
+    build.add_argument("--workers", type=int, default=None, help="Reader threads.")
+
+    info = sub.add_parser("info", help="Summarise an existing cube.")
+    info.add_argument("cube")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        rasters = [
+            (d, p) for d, p in discover_rasters(args.root)
+            if (args.start is None or d >= args.start) and (args.end is None or d <= args.end)
+        ]
+        cube = build_cube(rasters, args.out, workers=args.workers)
+    else:
+        cube = IceCube(args.cube)
+    size = cube.codes.nbytes + cube.ice_bits.nbytes
+    span = f"{cube.dates[0]} .. {cube.dates[-1]}" if len(cube) else "empty"
+    print(f"{cube.directory}: {len(cube)} days ({span}), grid {cube.height}x{cube.width}, {size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
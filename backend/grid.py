@@ -0,0 +1,171 @@
+"""
+Precomputed geometry for fixed raster grids such as the NSIDC 25 km
+polar-stereographic grid.
+
+Every sea-ice raster in the archive shares one transform, shape and CRS, so
+the per-pixel projected coordinates, WGS84 longitude/latitude, distance from
+the pole and pixel area only need to be computed once.  They are persisted as
+``.npy`` files and memory-mapped on later loads, so every process (API workers,
+training scripts, batch converters) shares them through the page cache.
+
+The arrays are written to ``ICE_GRID_CACHE_DIR`` (defaults to
+``~/.cache/nasa-ice/grid``).  ``ice-predict`` imports this module through
+``seaice_forecast/grid.py``, so both sides read and write the same cache files.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+import rasterio
+from pyproj import Proj, Transformer
+
+GRID_CACHE_DIR = Path(
+    os.environ.get("ICE_GRID_CACHE_DIR", Path.home() / ".cache" / "nasa-ice" / "grid")
+)
+# Bump whenever the on-disk arrays change meaning.
+GRID_FORMAT_VERSION = 1
+ARRAY_NAMES = ("x", "y", "lon", "lat", "dist_km", "area_km2")
+
+
+class GridGeometry:
+    """
+    Per-pixel geometry of a raster grid.
+
+    - ``x``/``y``: projected pixel-centre coordinates (identical to
+      ``rasterio.transform.xy(..., offset="center")``)
+    - ``lon``/``lat``: WGS84 pixel-centre coordinates
+    - ``dist_km``: distance of each pixel's upper-left corner from the
+      projection origin (the pole), as used by the radius filters
+    - ``area_km2``: true ground area of each pixel
+    """
+
+    def __init__(self, key: str, transform: rasterio.Affine, shape: Tuple[int, int], crs, arrays: Dict[str, np.ndarray]):
+        self.key = key
+        self.transform = transform
+        self.shape = shape
+        self.crs = crs
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        self._radius_masks: Dict[float, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def radius_mask(self, radius_km: float) -> np.ndarray:
+        """
+        Boolean mask of pixels farther than ``radius_km`` from the pole.
+
+        Masks are computed once per radius and reused (read-only).
+        """
+        radius_km = float(radius_km)
+        mask = self._radius_masks.get(radius_km)
+        if mask is None:
+            mask = np.asarray(self.dist_km > radius_km)
+            mask.setflags(write=False)
+            with self._lock:
+                # Sliders can produce many radii; keep the cache small.
+                if len(self._radius_masks) >= 64:
+                    self._radius_masks.pop(next(iter(self._radius_masks)))
+                self._radius_masks[radius_km] = mask
+        return mask
+
+
+_GRIDS: Dict[str, GridGeometry] = {}
+_GRIDS_LOCK = threading.Lock()
+
+
+def _grid_key(transform: rasterio.Affine, shape: Tuple[int, int], crs_wkt: str) -> str:
+    token = repr((tuple(transform)[:6], tuple(shape), crs_wkt, GRID_FORMAT_VERSION))
+    return hashlib.sha1(token.encode("utf-8")).hexdigest()[:16]
+
+
+def _compute_arrays(transform: rasterio.Affine, shape: Tuple[int, int], crs_wkt: str) -> Dict[str, np.ndarray]:
+    height, width = shape
+    cols, rows = np.meshgrid(np.arange(width), np.arange(height))
+
+    corner_x = transform.c + cols * transform.a + rows * transform.b
+    corner_y = transform.f + cols * transform.d + rows * transform.e
+    dist_km = np.sqrt(corner_x**2 + corner_y**2) / 1000
+
+    xs, ys = rasterio.transform.xy(transform, rows.ravel(), cols.ravel())
+    xs = np.asarray(xs, dtype=np.float64).reshape(shape)
+    ys = np.asarray(ys, dtype=np.float64).reshape(shape)
+
+    transformer = Transformer.from_crs(crs_wkt, "EPSG:4326", always_xy=True)
+    lon, lat = transformer.transform(xs, ys)
+
+    cell_area_km2 = abs(transform.a * transform.e - transform.b * transform.d) / 1e6
+    factors = Proj(crs_wkt).get_factors(lon, lat)
+    area_km2 = cell_area_km2 / np.asarray(factors.areal_scale)
+
+    return {
+        "x": xs,
+        "y": ys,
+        "lon": np.asarray(lon, dtype=np.float64),
+        "lat": np.asarray(lat, dtype=np.float64),
+        "dist_km": dist_km,
+        "area_km2": np.asarray(area_km2, dtype=np.float64),
+    }
+
+
+def _load_arrays(directory: Path) -> Dict[str, np.ndarray]:
+    return {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in ARRAY_NAMES}
+
+
+def _persist_arrays(directory: Path, arrays: Dict[str, np.ndarray]) -> None:
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".{directory.name}-", dir=directory.parent))
+    try:
+        for name in ARRAY_NAMES:
+            np.save(staging / f"{name}.npy", arrays[name])
+        os.replace(staging, directory)
+    except OSError:
+        # Another process won the race (or the cache is read-only); either way
+        # the in-memory arrays are still valid.
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def get_grid_geometry(transform: rasterio.Affine, shape: Tuple[int, int], crs) -> GridGeometry:
+    """
+    Return the (cached) geometry for a grid, computing and persisting it on first use.
+    """
+    crs_wkt = rasterio.crs.CRS.from_user_input(crs).to_wkt()
+    shape = (int(shape[0]), int(shape[1]))
+    key = _grid_key(transform, shape, crs_wkt)
+
+    grid = _GRIDS.get(key)
+    if grid is not None:
+        return grid
+
+    with _GRIDS_LOCK:
+        grid = _GRIDS.get(key)
+        if grid is not None:
+            return grid
+
+        directory = GRID_CACHE_DIR / key
+        try:
+            arrays = _load_arrays(directory)
+        except (OSError, ValueError):
+            arrays = _compute_arrays(transform, shape, crs_wkt)
+            _persist_arrays(directory, arrays)
+            try:
+                arrays = _load_arrays(directory)
+            except (OSError, ValueError):
+                pass
+
+        grid = GridGeometry(key, transform, shape, crs, arrays)
+        _GRIDS[key] = grid
+        return grid
+
+
+def grid_geometry_for_raster(path) -> GridGeometry:
+    """
+    Convenience wrapper reading the transform, shape and CRS from a raster file.
+    """
+    with rasterio.open(path) as src:
+        return get_grid_geometry(src.transform, (src.height, src.width), src.crs)
@@ -0,0 +1,121 @@
+"""
+Compact binary encoding of grid rasters (ice masks and quantized probabilities)
+for canvas-based frontends.
+
+A payload is laid out as::
+
+    b"ICEM" | uint32 LE header length | JSON header (space-padded to 4 bytes) | data
+
+The JSON header describes the grid (``shape`` as ``[height, width]``, the
+six affine ``transform`` coefficients and ``crs``) plus ``dtype``,
+``encoding`` and any request metadata.  Pixels are stored row-major starting
+at the top-left corner of the grid.  Encodings:
+
+- ``bits`` (boolean masks only) – ``np.packbits`` with the most significant
+  bit first; ``ceil(height * width / 8)`` bytes.
+- ``raw`` (``uint8`` only) – one byte per pixel.
+- ``rle`` – ``runs`` run lengths as uint32 LE followed by ``runs`` uint8 run
+  values (``0``/``1`` for masks).
+
+Quantized probabilities carry a ``scale`` in the header: ``p ≈ value * scale``.
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import Dict, Tuple
+
+import numpy as np
+
+MAGIC = b"ICEM"
+FORMAT_VERSION = 1
+MASK_ENCODINGS = ("bits", "rle")
+PROBABILITY_ENCODINGS = ("raw", "rle")
+MEDIA_TYPE = "application/octet-stream"
+
+
+def run_length_encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return ``(lengths, values)`` of the runs in the flattened array."""
+    flat = np.asarray(values, dtype=np.uint8).ravel()
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint8)
+    starts = np.flatnonzero(np.diff(flat)) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.concatenate((starts, [flat.size])))
+    return lengths.astype(np.uint32), flat[starts]
+
+
+def run_length_decode(lengths: np.ndarray, values: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    return np.repeat(values, lengths).reshape(shape)
+
+
+def quantize_probability(prob: np.ndarray) -> np.ndarray:
+    """Map probabilities in ``[0, 1]`` to ``uint8`` (``value / 255``)."""
+    return np.rint(np.clip(prob, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def encode_raster(values: np.ndarray, encoding: str, header: Dict) -> bytes:
+    """
+    Encode a boolean mask or ``uint8`` raster with the given grid header.
+
+    ``header`` must hold ``transform`` and ``crs``; ``shape``, ``dtype``,
+    ``encoding`` and ``version`` are filled in here.
+    """
+    values = np.asarray(values)
+    is_mask = values.dtype == np.bool_
+    allowed = MASK_ENCODINGS if is_mask else PROBABILITY_ENCODINGS
+    if encoding not in allowed:
+        raise ValueError(f"Unsupported encoding '{encoding}' for {values.dtype}; expected one of {allowed}.")
+    if not is_mask and values.dtype != np.uint8:
+        raise ValueError(f"Expected a boolean or uint8 raster, got {values.dtype}.")
+
+    header = {
+        **header,
+        "version": FORMAT_VERSION,
+        "shape": list(values.shape),
+        "dtype": "bool" if is_mask else "uint8",
+        "encoding": encoding,
+    }
+    if encoding == "bits":
+        data = np.packbits(values.ravel(), bitorder="big").tobytes()
+    elif encoding == "raw":
+        data = np.ascontiguousarray(values).tobytes()
+    else:
+        lengths, run_values = run_length_encode(values)
+        header["runs"] = int(lengths.size)
+        data = lengths.astype("<u4").tobytes() + run_values.tobytes()
+
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    head += b" " * (-len(head) % 4)
+    return MAGIC + struct.pack("<I", len(head)) + head + data
+
+
+def decode_raster(payload: bytes) -> Tuple[Dict, np.ndarray]:
+    """Inverse of :func:`encode_raster`; returns ``(header, values)``."""
+    if payload[:4] != MAGIC:
+        raise ValueError("Not an ice-mask payload.")
+    (length,) = struct.unpack("<I", payload[4:8])
+    header = json.loads(payload[8 : 8 + length])
+    data = memoryview(payload)[8 + length :]
+    shape = tuple(header["shape"])
+    size = shape[0] * shape[1]
+
+    if header["encoding"] == "bits":
+        values = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=size, bitorder="big")
+        values = values.reshape(shape)
+    elif header["encoding"] == "raw":
+        values = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+    else:
+        runs = header["runs"]
+        lengths = np.frombuffer(data[: 4 * runs], dtype="<u4")
+        run_values = np.frombuffer(data[4 * runs : 5 * runs], dtype=np.uint8)
+        values = run_length_decode(lengths, run_values, shape)
+
+    if header["dtype"] == "bool":
+        values = values.astype(bool)
+    return header, values
+
+
+def grid_header(transform, crs) -> Dict:
+    """The ``transform``/``crs`` part of a header for a rasterio transform and CRS."""
+    return {"transform": list(transform)[:6], "crs": crs.to_string()}
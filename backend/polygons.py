@@ -0,0 +1,175 @@
+"""
+Polygonized GeoJSON output for ice masks.
+
+Instead of one Point feature per 25 km pixel, the mask is traced into polygons
+(``rasterio.features.shapes``), dissolved into a single MultiPolygon in the
+grid's projected CRS, optionally simplified, and reprojected to WGS84.
+
+Simplification tolerances are precomputed per web-map zoom level
+(``SIMPLIFY_TOLERANCES_M``): half a screen pixel at that zoom, so the outline
+is visually unchanged when drawn at the requested zoom or below.
+
+Polar stereographic meridians are straight rays from the pole, so the parts
+of the outline that cross the antimeridian are cut along the 180° ray in
+projected space before reprojecting.  Each side is then pinned to +180 or
+-180, which keeps every ring within [-180, 180] without wrapping across the
+map.  Outlines enclosing the pole get a tiny hole there, since the pole has no
+single longitude.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import rasterio.features
+import shapely
+from pyproj import Transformer
+from shapely.geometry import LineString, MultiPolygon, Polygon, mapping, shape
+from shapely.geometry.polygon import orient
+
+from backend.grid import GridGeometry
+
+GEOMETRIES = ("point", "polygon")
+DEFAULT_GEOMETRY = "point"
+# Web Mercator ground resolution at zoom 0 (256 px tiles), metres per pixel at the equator.
+_ZOOM0_RESOLUTION_M = 156543.03392804097
+MAX_ZOOM = 8
+SIMPLIFY_TOLERANCES_M: Dict[int, float] = {
+    zoom: 0.5 * _ZOOM0_RESOLUTION_M / 2**zoom for zoom in range(MAX_ZOOM + 1)
+}
+COORDINATE_DECIMALS = 5
+
+_projections: Dict[str, "_Projection"] = {}
+_projections_lock = threading.Lock()
+
+
+class _Projection:
+    """Grid-to-WGS84 transformer plus the antimeridian ray and half-planes of a polar grid."""
+
+    def __init__(self, grid: GridGeometry):
+        self.to_wgs84 = Transformer.from_crs(grid.crs, "EPSG:4326", always_xy=True)
+        from_wgs84 = Transformer.from_crs("EPSG:4326", grid.crs, always_xy=True)
+
+        pole_lat = 90.0 if float(np.nanmean(grid.lat)) >= 0 else -90.0
+        pole = from_wgs84.transform(0.0, pole_lat)
+        self.pole = shapely.Point(pole).buffer(abs(grid.transform.a) / 100)
+        # The equator lies well outside any polar grid.
+        self.antimeridian = LineString([pole, from_wgs84.transform(180.0, 0.0)])
+
+        def _half(lons: np.ndarray) -> Polygon:
+            xs, ys = from_wgs84.transform(lons, np.zeros_like(lons))
+            return Polygon([pole, *zip(xs, ys)])
+
+        self.east = _half(np.linspace(0.0, 180.0, 65))
+        self.west = _half(np.linspace(-180.0, 0.0, 65))
+
+    def _reproject(self, geom, seam_lon: Optional[float]):
+        def _transform(coords: np.ndarray) -> np.ndarray:
+            lon, lat = self.to_wgs84.transform(coords[:, 0], coords[:, 1])
+            lon = np.asarray(lon)
+            if seam_lon is not None:
+                # Points on the cut come back as either +180 or -180.
+                lon = np.where(np.abs(lon) > 179.999, seam_lon, lon)
+            return np.round(np.column_stack([lon, lat]), COORDINATE_DECIMALS)
+
+        return shapely.transform(geom, _transform)
+
+    def reproject(self, geom, segment_m: float) -> List[Polygon]:
+        """Reproject polygons to WGS84, splitting those that cross the antimeridian."""
+        polygons: List[Polygon] = []
+        for part in shapely.get_parts(geom):
+            part = shapely.segmentize(part, segment_m)
+            if part.intersects(self.pole):
+                part = part.difference(self.pole)
+            if part.intersects(self.antimeridian):
+                pieces = [
+                    (part.intersection(self.east), 180.0),
+                    (part.intersection(self.west), -180.0),
+                ]
+            else:
+                pieces = [(part, None)]
+            for piece, seam_lon in pieces:
+                for polygon in shapely.get_parts(piece):
+                    if isinstance(polygon, Polygon) and not polygon.is_empty:
+                        polygons.append(self._reproject(polygon, seam_lon))
+        # Re-join the halves of pieces that were only cut at the prime meridian.
+        merged = shapely.union_all(shapely.make_valid(polygons))
+        return [orient(polygon, 1.0) for polygon in shapely.get_parts(merged) if isinstance(polygon, Polygon)]
+
+
+def _projection(grid: GridGeometry) -> _Projection:
+    projection = _projections.get(grid.key)
+    if projection is None:
+        with _projections_lock:
+            projection = _projections.get(grid.key)
+            if projection is None:
+                projection = _projections[grid.key] = _Projection(grid)
+    return projection
+
+
+def simplify_tolerance(zoom: Optional[int]) -> float:
+    """Simplification tolerance (projected metres) for a zoom level; ``None`` keeps pixel outlines."""
+    if zoom is None:
+        return 0.0
+    return SIMPLIFY_TOLERANCES_M[min(max(int(zoom), 0), MAX_ZOOM)]
+
+
+def dissolve_mask(mask: np.ndarray, grid: GridGeometry, zoom: Optional[int] = None):
+    """
+    Trace the ``True`` pixels of ``mask`` into one (Multi)Polygon in the grid CRS.
+    """
+    shapes = rasterio.features.shapes(
+        mask.astype(np.uint8), mask=mask, transform=grid.transform, connectivity=4
+    )
+    merged = shapely.union_all([shape(geometry) for geometry, _ in shapes])
+    tolerance = simplify_tolerance(zoom)
+    if tolerance > 0:
+        merged = shapely.simplify(_drop_specks(merged, tolerance**2), tolerance, preserve_topology=True)
+    return merged
+
+
+def _drop_specks(geom, min_area: float):
+    """Remove polygons and holes smaller than ``min_area`` (invisible at the target zoom)."""
+    polygons = []
+    for part in shapely.get_parts(geom):
+        if part.area < min_area:
+            continue
+        holes = [ring for ring in part.interiors if Polygon(ring).area >= min_area]
+        polygons.append(Polygon(part.exterior, holes))
+    return MultiPolygon(polygons)
+
+
+def build_polygon_features(
+    mask: np.ndarray,
+    grid: GridGeometry,
+    properties: Optional[Dict] = None,
+    zoom: Optional[int] = None,
+) -> Dict:
+    """
+    Assemble a GeoJSON FeatureCollection with a single MultiPolygon feature
+    covering the ``True`` pixels of ``mask``.
+
+    The feature's properties are ``properties`` plus the pixel count and the
+    true ground area (``area_km2``) of the masked pixels.
+    """
+    if not mask.any():
+        return {"type": "FeatureCollection", "features": []}
+
+    merged = dissolve_mask(mask, grid, zoom)
+    # Densify long edges so they follow the projection's curvature in WGS84.
+    segment_m = max(4 * abs(grid.transform.a), 2 * simplify_tolerance(zoom))
+    polygons = _projection(grid).reproject(merged, segment_m=segment_m)
+    geometry = MultiPolygon(polygons)
+
+    props = dict(properties or {})
+    props["pixels"] = int(mask.sum())
+    props["area_km2"] = float(np.asarray(grid.area_km2)[mask].sum())
+    feature = {
+        "id": "0",
+        "type": "Feature",
+        "properties": props,
+        "geometry": mapping(geometry),
+        "bbox": geometry.bounds,
+    }
+    return {"type": "FeatureCollection", "features": [feature], "bbox": geometry.bounds}
@@ -0,0 +1,153 @@
+"""
+Collapse RBF model weights onto unique (year, month) training frames.
+
+The predictor's temporal features depend only on a frame's year and month, so
+every daily frame within a month yields an identical kernel column.  Summing
+the weight columns of such frames gives an exactly equivalent model with one
+column per unique (year, month), roughly 30× smaller than the daily
+``(N_valid, T)`` matrix and correspondingly cheaper to evaluate.
+
+The API compacts models automatically on load; write a compacted model file
+(and check it against the original) with::
+
+    python -m backend.rbf_compact path/to/model.npz --out path/to/model.compact.npz --verify
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+# Rows summed per block, bounding the temporary copy when reading a large (memory-mapped) model.
+ROW_BLOCK = 8192
+
+
+def compact_weights(
+    weights: np.ndarray, years: np.ndarray, months: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sum weight columns that share a (year, month).
+
+    Returns ``(weights, years, months)`` with one column per unique
+    (year, month), sorted chronologically.  Sums are accumulated in float64
+    and stored in the input dtype.  Already-compact models are returned as is.
+    """
+    years = np.asarray(years)
+    months = np.asarray(months)
+    keys = years.astype(np.int64) * 12 + (months.astype(np.int64) - 1)
+    unique, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    if unique.size == keys.size and np.all(np.diff(keys) > 0):
+        return weights, years, months
+
+    order = np.argsort(keys, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    compact = np.empty((weights.shape[0], unique.size), dtype=weights.dtype)
+    for lo in range(0, weights.shape[0], ROW_BLOCK):
+        block = np.asarray(weights[lo : lo + ROW_BLOCK], dtype=np.float64)[:, order]
+        compact[lo : lo + ROW_BLOCK] = np.add.reduceat(block, starts, axis=1)
+    return compact, years[first], months[first]
+
+
+def compact_model(source: Path, destination: Path) -> Tuple[int, int]:
+    """
+    Write a compacted copy of an RBF ``.npz`` model; returns the column counts before and after.
+    """
+    with np.load(source, allow_pickle=True) as data:
+        arrays = {name: data[name] for name in data.files}
+    before = arrays["weights"].shape[1]
+    arrays["weights"], arrays["years"], arrays["months"] = compact_weights(
+        arrays["weights"], arrays["years"], arrays["months"]
+    )
+    if arrays["weights"].shape[1] != before:
+        # Per-frame dates no longer match the columns (and rule out incremental training).
+        arrays.pop("dates", None)
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", suffix=".npz", dir=destination.parent)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, **arrays)
+        os.chmod(tmp_name, source.stat().st_mode & 0o777)
+        os.replace(tmp_name, destination)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return before, arrays["weights"].shape[1]
+
+
+def year_normalisation(data) -> Tuple[float, float]:
+    """
+    ``(origin, span)`` of a model's year feature: as stored by the trainer,
+    else (older models) the range of its training years.
+    """
+    if "year_origin" in data:
+        return float(data["year_origin"]), float(data["year_span"])
+    years = np.asarray(data["years"])
+    return float(years.min()), float(max(1, years.max() - years.min()))
+
+
+def temporal_features(years: np.ndarray, months: np.ndarray, origin: float, span: float) -> np.ndarray:
+    """[year_norm, sin(month), cos(month)] rows, with years normalised as ``(year - origin) / span``."""
+    return np.stack(
+        [(years - origin) / span, np.sin(2 * np.pi * months / 12.0), np.cos(2 * np.pi * months / 12.0)], axis=1
+    )
+
+
+def rbf_kernel(x1: np.ndarray, x2: np.ndarray, gamma: float) -> np.ndarray:
+    """
+    Compute the RBF kernel between two sets of temporal features.
+
+    The one kernel shared by the predictor, the quantizer and the checks here.
+    """
+    diff = x1[:, None, :] - x2[None, :, :]
+    dist2 = np.sum(diff**2, axis=2)
+    return np.exp(-gamma * dist2)
+
+
+def max_prediction_difference(source: Path, compacted: Path, samples: int = 24) -> float:
+    """
+    Largest absolute difference between the predictions of two models over
+    ``samples`` months spanning (and extrapolating past) the training period.
+    """
+    with np.load(source, allow_pickle=True) as a, np.load(compacted, allow_pickle=True) as b:
+        years = a["years"]
+        origin, span = year_normalisation(a)
+        gamma = float(a["gamma"])
+        query_years = np.linspace(years.min(), years.max() + 2, samples).round().astype(int)
+        query_months = (np.arange(samples) % 12) + 1
+        query = temporal_features(query_years, query_months, origin, span)
+
+        worst = 0.0
+        for model in (a, b):
+            model_t = temporal_features(model["years"], model["months"], origin, span)
+            k_star = rbf_kernel(model_t, query, gamma)
+            preds = model["weights"].astype(np.float64) @ k_star
+            if model is a:
+                reference = preds
+            else:
+                worst = float(np.abs(preds - reference).max())
+    return worst
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Collapse RBF model weights onto unique (year, month) frames.")
+    parser.add_argument("model", type=Path, help="Input .npz model.")
+    parser.add_argument("--out", type=Path, help="Output path (defaults to <model>.compact.npz).")
+    parser.add_argument("--verify", action="store_true", help="Compare predictions of the two models.")
+    args = parser.parse_args(argv)
+
+    out = args.out or args.model.with_suffix(".compact.npz")
+    if args.verify and out.resolve() == args.model.resolve():
+        parser.error("--verify needs --out to differ from the input model.")
+    before, after = compact_model(args.model, out)
+    print(f"Wrote {out}: {before} -> {after} weight columns")
+    if args.verify:
+        print(f"Max prediction difference: {max_prediction_difference(args.model, out):.3e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Lazily loaded, memory-mapped RBF sea-ice model.
+
+The trained model ships as a compressed ``.npz`` (``ICE_MODEL_DIR``, file
+``rbf_model_2015_2025_spatiotemporal.npz``).  On first use it is exported
+once, with its weights compacted onto unique (year, month) columns
+(:mod:`backend.rbf_compact`), into a directory of uncompressed ``.npy`` files
+under ``ICE_MODEL_CACHE_DIR`` (defaults to ``~/.cache/nasa-ice/model``).  The
+arrays are then memory-mapped read-only, so every worker process on the host
+shares one copy of the weights through the page cache.
+
+Models trained by ``ice-predict/rbf.py`` only carry weights for pixels that
+vary over the training period (``active_mask``); pixels that were always or
+never ice are stored as ``constant_values`` and filled in directly.
+
+Weights can be stored as float16 or int8 coefficients in the eigenbasis of
+the training kernel (:mod:`backend.rbf_quantize`), either in the ``.npz``
+itself or by setting ``ICE_MODEL_WEIGHTS_DTYPE``; they are dequantized block
+by block at inference.
+
+Nothing is loaded at import time.  :func:`get_model` loads on first call (and
+reloads when the ``.npz`` changes); :func:`start_warm_up` does the same in a
+background thread at startup, with :func:`model_status` backing the readiness
+probe.
+
+:func:`probability_maps` keeps each month's predicted probability map
+(float16) in an in-memory LRU bounded by ``ICE_PROBABILITY_CACHE_MAX_BYTES``
+(default 256 MiB), shared by the prediction endpoints and routing.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+
+from backend.cache import ArrayCache, file_fingerprint
+from backend.grid import GridGeometry, get_grid_geometry
+from backend.rbf_compact import compact_weights, rbf_kernel, temporal_features, year_normalisation
+from backend.rbf_quantize import WEIGHT_DTYPES, dequantize_weights, quantize_weights, quantized_matmul
+
+MODEL_ROOT = Path(
+    os.environ.get(
+        "ICE_MODEL_DIR",
+        Path(__file__).resolve().parent / "datasets" / "trained_data",
+    )
+).resolve()
+MODEL_PATH = MODEL_ROOT / "rbf_model_2015_2025_spatiotemporal.npz"
+MODEL_CACHE_DIR = Path(
+    os.environ.get("ICE_MODEL_CACHE_DIR", Path.home() / ".cache" / "nasa-ice" / "model")
+)
+# Storage format of the exported weights: float32, float16 or int8.  Unset
+# keeps the format of the .npz file.
+WEIGHTS_DTYPE = os.environ.get("ICE_MODEL_WEIGHTS_DTYPE") or None
+# Bump whenever the exported layout changes.
+LAYOUT_VERSION = 3
+ARRAY_NAMES = ("weights", "valid_mask", "active_mask", "constant_values", "years", "months")
+PROBABILITY_CACHE_MAX_BYTES = int(os.environ.get("ICE_PROBABILITY_CACHE_MAX_BYTES", 256 * 1024**2))
+
+_PROBABILITY_MAPS = ArrayCache(PROBABILITY_CACHE_MAX_BYTES)
+
+
+class PredictionError(RuntimeError):
+    """Raised when model prediction or conversion to GeoJSON fails."""
+
+
+class RBFModel:
+    """
+    Read-only view of an exported model directory.
+
+    - ``weights``: (N_active, T) float32, float16 or int8, memory-mapped
+    - ``weight_basis``: (T, T) basis of quantized weights, otherwise ``None``
+    - ``valid_mask``: (H, W) pixels the model predicts
+    - ``active_mask``: (H, W) valid pixels that vary over the training
+      frames and have a weight row; the other valid pixels take their
+      ``constant_values`` (0 or 1)
+    - ``years``/``months``: training frame of each weight column
+    - ``t``: (T, 3) float32 temporal features of the training frames
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / "meta.json").read_text())
+        if meta.get("version") != LAYOUT_VERSION:
+            raise ValueError(f"Unsupported model layout version {meta.get('version')!r}.")
+        self.source = tuple(meta["source"])
+        self.alpha = float(meta["alpha"])
+        self.gamma = float(meta["gamma"])
+        self.H, self.W = int(meta["H"]), int(meta["W"])
+        self.transform = rasterio.Affine(*meta["transform"])
+        self.crs = rasterio.crs.CRS.from_string(meta["crs"])
+
+        arrays = {name: np.load(self.directory / f"{name}.npy", mmap_mode="r") for name in ARRAY_NAMES}
+        self.weights = arrays["weights"]
+        basis_path = self.directory / "weight_basis.npy"
+        self.weight_basis = np.load(basis_path) if basis_path.exists() else None
+        self.valid_mask = np.asarray(arrays["valid_mask"], dtype=bool)
+        self.active_mask = np.asarray(arrays["active_mask"], dtype=bool)
+        self.constant_values = np.asarray(arrays["constant_values"], dtype=np.uint8)
+        self.years = np.asarray(arrays["years"])
+        self.months = np.asarray(arrays["months"])
+        self.grid: GridGeometry = get_grid_geometry(self.transform, (self.H, self.W), self.crs)
+
+        self._year_origin = float(meta["year_origin"])
+        self._year_span = float(meta["year_span"])
+        self.t = self.temporal_features(self.years, self.months)
+
+    def temporal_features(self, years, months) -> np.ndarray:
+        """
+        Normalized [year, sin(month), cos(month)] features, one row per frame.
+        """
+        years = np.atleast_1d(np.asarray(years, dtype=np.float64))
+        months = np.atleast_1d(np.asarray(months, dtype=np.float64))
+        year_norm = (years - self._year_origin) / self._year_span
+        month_sin = np.sin(2 * np.pi * months / 12.0)
+        month_cos = np.cos(2 * np.pi * months / 12.0)
+        return np.stack([year_norm, month_sin, month_cos], axis=1).astype(np.float32)
+
+    def probability_grid(self, preds: np.ndarray, dtype=np.float32) -> np.ndarray:
+        """
+        Expand predictions for the active pixels into an (H, W) grid holding
+        the constant pixels' values elsewhere (zero outside ``valid_mask``).
+        """
+        grid = self.constant_values.astype(dtype)
+        grid[self.active_mask] = preds
+        return grid
+
+    def predict(self, year: int, month: int) -> np.ndarray:
+        """
+        Ice probability of every active pixel for one month, clipped to [0, 1].
+        """
+        return self.predict_many([year], [month])[:, 0]
+
+    def predict_many(self, years, months) -> np.ndarray:
+        """
+        Ice probabilities of every active pixel for several months at once,
+        as an (N_active, len(years)) array: one kernel matrix and a single matmul.
+        """
+        k_star = rbf_kernel(self.t, self.temporal_features(years, months), self.gamma)
+        return np.clip(quantized_matmul(self.weights, self.weight_basis, k_star), 0, 1)
+
+
+def _layout_dir(source: Tuple, dtype: Optional[str]) -> Path:
+    token = repr((source, dtype, LAYOUT_VERSION))
+    digest = hashlib.sha1(token.encode("utf-8")).hexdigest()[:16]
+    return MODEL_CACHE_DIR / f"{Path(source[0]).stem}-{digest}"
+
+
+def export_model(path: Path = MODEL_PATH, dtype: Optional[str] = WEIGHTS_DTYPE) -> Path:
+    """
+    Export an ``.npz`` model to the memory-mappable layout (if not already
+    done) and return the directory.
+
+    ``dtype`` selects the stored weight format; ``None`` keeps the model's own.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise PredictionError(f"Model file not found at {path}")
+    if dtype is not None and dtype not in WEIGHT_DTYPES:
+        raise PredictionError(f"Unknown weight dtype '{dtype}'; expected one of {WEIGHT_DTYPES}.")
+    source = file_fingerprint(path)
+    directory = _layout_dir(source, dtype)
+    if (directory / "meta.json").exists():
+        return directory
+
+    with np.load(path, allow_pickle=True) as data:
+        basis = data["weight_basis"] if "weight_basis" in data.files else None
+        if dtype is None:
+            dtype = str(np.dtype(data["weights"].dtype))
+            dtype = dtype if dtype in WEIGHT_DTYPES else "float32"
+        weights, years, months = compact_weights(
+            dequantize_weights(data["weights"], basis), data["years"], data["months"]
+        )
+        valid_mask = data["valid_mask"].astype(bool)
+        if "active_mask" in data.files:
+            active_mask = data["active_mask"].astype(bool)
+            constant_values = np.where(valid_mask & ~active_mask, data["constant_values"], 0).astype(np.uint8)
+        else:
+            # Dense model: pixels never iced in training have all-zero weight
+            # rows and predict exactly 0, so they can be dropped losslessly.
+            nonzero = np.any(weights != 0, axis=1)
+            active_mask = np.zeros_like(valid_mask)
+            active_mask[valid_mask] = nonzero
+            weights = weights[nonzero]
+            constant_values = np.zeros(valid_mask.shape, dtype=np.uint8)
+        origin, span = year_normalisation(data)
+        weights, weight_basis = quantize_weights(
+            weights, dtype, temporal_features(years, months, origin, span), float(data.get("gamma", 1.0))
+        )
+        arrays = {
+            "weights": np.ascontiguousarray(weights),
+            "valid_mask": valid_mask,
+            "active_mask": active_mask,
+            "constant_values": constant_values,
+            "years": np.asarray(years),
+            "months": np.asarray(months),
+        }
+        if weight_basis is not None:
+            arrays["weight_basis"] = weight_basis
+        meta = {
+            "version": LAYOUT_VERSION,
+            "source": list(source),
+            "weights_dtype": dtype,
+            "alpha": float(data.get("alpha", 0.0)),
+            "gamma": float(data.get("gamma", 1.0)),
+            "year_origin": origin,
+            "year_span": span,
+            "H": int(data["H"]),
+            "W": int(data["W"]),
+            "transform": [float(v) for v in data["transform"].tolist()],
+            "crs": str(data["crs"]),
+        }
+
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".{directory.name}-", dir=directory.parent))
+    try:
+        for name, array in arrays.items():
+            np.save(staging / f"{name}.npy", array)
+        (staging / "meta.json").write_text(json.dumps(meta))
+        os.replace(staging, directory)
+    except OSError:
+        # Another worker exported the same model first.
+        shutil.rmtree(staging, ignore_errors=True)
+        if not (directory / "meta.json").exists():
+            raise
+
+    # Drop exports of older versions of this model file.
+    for stale in directory.parent.glob(f"{path.stem}-*"):
+        if stale == directory:
+            continue
+        try:
+            stale_source = json.loads((stale / "meta.json").read_text())["source"][0]
+        except (OSError, ValueError, KeyError, IndexError):
+            continue
+        if stale_source == source[0]:
+            shutil.rmtree(stale, ignore_errors=True)
+    return directory
+
+
+_model: Optional[RBFModel] = None
+_model_lock = threading.Lock()
+_status: Dict[str, Optional[str]] = {"state": "idle", "error": None}
+
+
+def model_fingerprint() -> tuple:
+    """
+    Fingerprint of the model file, for keying cached predictions.
+
+    Raises :class:`PredictionError` (and marks the model failed) when the file
+    is missing or unreadable.
+    """
+    try:
+        return file_fingerprint(MODEL_PATH)
+    except OSError as exc:
+        message = f"Model file not found at {MODEL_PATH}"
+        _status.update(state="failed", error=message)
+        raise PredictionError(message) from exc
+
+
+def get_model() -> RBFModel:
+    """
+    Return the process-wide model, exporting and memory-mapping it on first use.
+
+    Reloads transparently when the ``.npz`` file is replaced.
+    """
+    global _model
+    source = model_fingerprint()
+    model = _model
+    if model is not None and model.source == source:
+        return model
+
+    with _model_lock:
+        if _model is not None and _model.source == source:
+            return _model
+        _status.update(state="loading", error=None)
+        try:
+            _model = RBFModel(export_model(MODEL_PATH))
+        except Exception as exc:
+            _status.update(state="failed", error=str(exc))
+            if isinstance(exc, PredictionError):
+                raise
+            raise PredictionError(f"Failed to load model from '{MODEL_PATH}': {exc}") from exc
+        _status.update(state="ready", error=None)
+        return _model
+
+
+def probability_maps(dates: Sequence[datetime]) -> List[np.ndarray]:
+    """
+    Predicted ice probability for the month of each date as read-only
+    float16 (H, W) grids, zero outside the model's valid pixels.
+
+    Maps are kept in a byte-bounded in-memory LRU keyed by the model file and
+    (year, month), so threshold and radius changes skip the matmul.  Missing
+    months are computed together in a single matmul.
+    """
+    model = get_model()
+    keys = [(model.source, date.year, date.month) for date in dates]
+    maps = [_PROBABILITY_MAPS.get(key) for key in keys]
+    missing = [i for i, pred_prob in enumerate(maps) if pred_prob is None]
+    if missing:
+        preds = model.predict_many([dates[i].year for i in missing], [dates[i].month for i in missing])
+        for column, i in enumerate(missing):
+            maps[i] = _PROBABILITY_MAPS.put(keys[i], model.probability_grid(preds[:, column], np.float16))
+    return maps
+
+
+def probability_map(date: datetime) -> np.ndarray:
+    """Probability grid for the month of ``date``; see :func:`probability_maps`."""
+    return probability_maps([date])[0]
+
+
+def start_warm_up() -> threading.Thread:
+    """Load the model in a daemon thread so the first prediction request is fast."""
+
+    def _warm() -> None:
+        try:
+            get_model()
+        except PredictionError as exc:
+            print(f"Model warm-up failed: {exc}")
+
+    thread = threading.Thread(target=_warm, name="rbf-model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_status() -> Dict[str, object]:
+    """Readiness of the model: ``state`` is idle, loading, ready or failed."""
+    return {"ready": _status["state"] == "ready", "model": str(MODEL_PATH), **_status}
@@ -0,0 +1,186 @@
+"""
+Quantized storage for RBF model weights.
+
+Predictions are clipped to [0, 1] and thresholded, so the weights tolerate
+much less precision than float32.  The solved weights are large and cancel
+each other out, though, so they are not quantized directly: each row is
+first rotated onto the eigenvectors of the training kernel matrix, where the
+coefficients that matter for a prediction are well separated from the large
+ones that barely contribute.  Two formats are supported:
+
+- ``float16`` – half the size.
+- ``int8`` – a quarter of the size; each eigen-component (column) is scaled
+  by its own ``max(|c|) / 127``.
+
+Both store the (T, T) ``weight_basis`` that maps the coefficients back, with
+the int8 scales folded in: ``weights ≈ coefficients @ weight_basis``.  At
+inference the basis is applied to the (T, M) kernel matrix instead, and the
+coefficients are only ever expanded to float32 block by block.
+
+Models are quantized on export when ``ICE_MODEL_WEIGHTS_DTYPE`` is set (see
+:mod:`backend.rbf_model`), or offline with a validation report comparing the
+predictions against float32::
+
+    python -m backend.rbf_quantize model.npz --dtype int8 --out model.int8.npz
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from backend.rbf_compact import ROW_BLOCK, compact_weights, rbf_kernel, temporal_features, year_normalisation
+
+WEIGHT_DTYPES = ("float32", "float16", "int8")
+# Rows dequantized per block at inference, bounding the float32 temporary.
+DEQUANT_BLOCK = 16384
+
+
+def quantize_weights(
+    weights: np.ndarray, dtype: str, t: np.ndarray, gamma: float
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Return ``(weights, weight_basis)`` in the requested storage ``dtype``;
+    ``weight_basis`` is ``None`` for ``float32``.
+
+    ``t`` holds the temporal features of the weight columns and ``gamma`` the
+    kernel width the model was trained with.
+    """
+    if dtype not in WEIGHT_DTYPES:
+        raise ValueError(f"Unknown weight dtype '{dtype}'; expected one of {WEIGHT_DTYPES}.")
+    if dtype == "float32":
+        return np.asarray(weights, dtype=np.float32), None
+
+    _, eigenvectors = np.linalg.eigh(rbf_kernel(np.asarray(t, np.float64), np.asarray(t, np.float64), gamma))
+    coefficients = np.empty(weights.shape, dtype=np.float32)
+    for lo in range(0, weights.shape[0], ROW_BLOCK):
+        coefficients[lo : lo + ROW_BLOCK] = np.asarray(weights[lo : lo + ROW_BLOCK], np.float64) @ eigenvectors
+    basis = eigenvectors.T
+    if dtype == "float16":
+        return coefficients.astype(np.float16), basis.astype(np.float32)
+
+    scales = np.abs(coefficients).max(axis=0) / 127.0 if coefficients.size else np.ones(basis.shape[0])
+    scales[scales == 0] = 1.0
+    quantized = np.rint(coefficients / scales.astype(np.float32)).astype(np.int8)
+    return quantized, (scales[:, None] * basis).astype(np.float32)
+
+
+def dequantize_weights(weights: np.ndarray, weight_basis: Optional[np.ndarray] = None) -> np.ndarray:
+    """Float32 weights from any stored format."""
+    weights = np.asarray(weights, dtype=np.float32)
+    if weight_basis is not None:
+        weights = weights @ np.asarray(weight_basis, dtype=np.float32)
+    return weights
+
+
+def quantized_matmul(
+    weights: np.ndarray, weight_basis: Optional[np.ndarray], k_star: np.ndarray
+) -> np.ndarray:
+    """
+    ``dequantize(weights) @ k_star`` evaluated as ``weights @ (weight_basis @ k_star)``
+    block by block, so a float16 or int8 (possibly memory-mapped) matrix is
+    never expanded in full.
+    """
+    k_star = np.asarray(k_star, dtype=np.float32)
+    if weight_basis is not None:
+        k_star = np.asarray(weight_basis, dtype=np.float32) @ k_star
+    if weights.dtype == np.float32:
+        return weights @ k_star
+    out = np.empty((weights.shape[0], k_star.shape[1]), dtype=np.float32)
+    for lo in range(0, weights.shape[0], DEQUANT_BLOCK):
+        out[lo : lo + DEQUANT_BLOCK] = weights[lo : lo + DEQUANT_BLOCK].astype(np.float32) @ k_star
+    return out
+
+
+def validation_report(
+    reference: np.ndarray,
+    weights: np.ndarray,
+    weight_basis: Optional[np.ndarray],
+    t: np.ndarray,
+    query: np.ndarray,
+    gamma: float,
+    thresh: float = 0.5,
+) -> Dict[str, float]:
+    """
+    Compare clipped predictions of quantized weights against float32 ``reference``
+    for every row of ``query`` (temporal features).
+
+    Reports the largest probability error and how many pixel-months change
+    side of ``thresh``.
+    """
+    k_star = rbf_kernel(t, query, gamma)
+    expected = np.clip(quantized_matmul(reference, None, k_star), 0, 1)
+    actual = np.clip(quantized_matmul(weights, weight_basis, k_star), 0, 1)
+    return {
+        "months": int(query.shape[0]),
+        "pixels": int(reference.shape[0]),
+        "max_prob_error": float(np.abs(actual - expected).max()),
+        "mean_prob_error": float(np.abs(actual - expected).mean()),
+        "changed_pixels": int(((actual >= thresh) != (expected >= thresh)).sum()),
+        "bytes": int(weights.nbytes + (weight_basis.nbytes if weight_basis is not None else 0)),
+        "reference_bytes": int(reference.nbytes),
+    }
+
+
+def quantize_model(source: Path, destination: Path, dtype: str, samples: int = 36) -> Dict[str, float]:
+    """
+    Write a compacted, quantized copy of an RBF ``.npz`` model and return its
+    validation report against the float32 weights.
+    """
+    with np.load(source, allow_pickle=True) as data:
+        arrays = {name: data[name] for name in data.files}
+    reference = dequantize_weights(arrays["weights"], arrays.pop("weight_basis", None))
+    reference, years, months = compact_weights(reference, arrays["years"], arrays["months"])
+    arrays["years"], arrays["months"] = years, months
+    arrays.pop("dates", None)
+    origin, span = year_normalisation(arrays)
+    t = temporal_features(years, months, origin, span)
+    gamma = float(arrays["gamma"])
+    arrays["weights"], basis = quantize_weights(reference, dtype, t, gamma)
+    if basis is not None:
+        arrays["weight_basis"] = basis
+
+    query_years = np.linspace(years.min(), years.max() + 2, samples).round().astype(int)
+    query_months = (np.arange(samples) % 12) + 1
+    report = validation_report(
+        reference,
+        arrays["weights"],
+        basis,
+        t,
+        temporal_features(query_years, query_months, origin, span),
+        gamma,
+    )
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", suffix=".npz", dir=destination.parent)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, **arrays)
+        os.chmod(tmp_name, source.stat().st_mode & 0o777)
+        os.replace(tmp_name, destination)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Quantize RBF model weights and report the prediction error.")
+    parser.add_argument("model", type=Path, help="Input .npz model.")
+    parser.add_argument("--dtype", choices=WEIGHT_DTYPES[1:], default="int8")
+    parser.add_argument("--out", type=Path, help="Output path (defaults to <model>.<dtype>.npz).")
+    args = parser.parse_args(argv)
+
+    out = args.out or args.model.with_suffix(f".{args.dtype}.npz")
+    report = quantize_model(args.model, out, args.dtype)
+    print(f"Wrote {out}")
+    for name, value in report.items():
+        print(f"  {name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Navigation grids at native NSIDC resolution, resolved server-side.
+
+Routing requests reference an ice layer by handle instead of posting its
+GeoJSON back to the server:
+
+- an observed day (``date``), read through the dataset catalog;
+- a predicted month (``year``, ``month``, ``thresh``) from the RBF model.
+
+Navigable cells are open ocean: not land, coast or missing data, and not
+ice (observed code 1, or a predicted probability of at least ``thresh``).
+
+With a cost ``profile`` (:data:`COST_PROFILES`) a layer instead carries a
+float32 ``cost`` raster for weighted search: each cell costs its true width
+in km, scaled up by its ice probability ``p`` (observed ice counts as
+``p = 1``) as ``1 + ice_weight * p``.  Cells at or above the profile's
+``max_prob`` are blocked, so routes can trade distance for ice exposure.
+
+For time-dependent routing, a :class:`NavigationStack` strings grids
+together over the days after a departure: observed days where the catalog
+has them, the forecast month otherwise.
+
+Each grid is built once and kept in an in-memory LRU of
+``ICE_NAVGRID_CACHE_ENTRIES`` layers (default 256, 133 KiB each at 304 x 448,
+plus 532 KiB for a cost raster) keyed by the source file or model
+fingerprint and profile, so repeated routes on the same layer skip all
+preprocessing.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pyproj import Transformer
+
+from backend.cache import file_fingerprint
+from backend.catalog import get_catalog
+from backend.converter import GeoDataConversionError, load_raster
+from backend.grid import GridGeometry, get_grid_geometry
+from backend.rbf_model import PredictionError, get_model, probability_map
+from backend.routing.pathfinder import component_labels, nearest_navigable, snap_cell
+
+OCEAN_CODE = 0
+ICE_CODE = 1
+NAVGRID_CACHE_ENTRIES = int(os.environ.get("ICE_NAVGRID_CACHE_ENTRIES", 256))
+# A day without an observation reuses the latest one at most this many days old.
+MAX_OBSERVATION_AGE_DAYS = 3
+KM_PER_NAUTICAL_MILE = 1.852
+
+
+@dataclass(frozen=True)
+class CostProfile:
+    """Cell cost ``width_km * (1 + ice_weight * p)``; cells with ``p >= max_prob`` are blocked."""
+
+    ice_weight: float
+    max_prob: float
+
+
+COST_PROFILES: Dict[str, CostProfile] = {
+    # Ice-free water only, by true distance.
+    "shortest": CostProfile(ice_weight=0.0, max_prob=0.5),
+    # Detours through likely-open water, crossing only marginal ice.
+    "balanced": CostProfile(ice_weight=4.0, max_prob=0.9),
+    # Everything but land is passable; ice exposure dominates the cost.
+    "lowest_exposure": CostProfile(ice_weight=25.0, max_prob=1.01),
+}
+
+_layers: "OrderedDict[Hashable, NavigationGrid]" = OrderedDict()
+_layers_lock = threading.Lock()
+_to_grid: Dict[str, Transformer] = {}
+_to_grid_lock = threading.Lock()
+
+
+class NavigationGrid:
+    """
+    Navigable cells (``navigable``, read-only uint8, 1 = open water) of one
+    layer on its native raster grid, and for cost layers the read-only
+    float32 ``cost`` of entering each cell (``inf`` where blocked).
+    ``water`` marks the sea cells, navigable or not (1 = not land, coast or
+    missing data).
+    """
+
+    def __init__(
+        self,
+        navigable: np.ndarray,
+        grid: GridGeometry,
+        layer: Dict,
+        cost: Optional[np.ndarray] = None,
+        water: Optional[np.ndarray] = None,
+    ):
+        self.navigable = navigable
+        self.grid = grid
+        self.layer = layer
+        self.cost = cost
+        self.water = water if water is not None else navigable
+        self._components: Optional[np.ndarray] = None
+        self._nearest: Optional[np.ndarray] = None
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.navigable.shape
+
+    @property
+    def components(self) -> np.ndarray:
+        """Connected-component labels of the navigable cells, computed on first use."""
+        if self._components is None:
+            labels = component_labels(self.navigable)
+            labels.setflags(write=False)
+            self._components = labels
+        return self._components
+
+    @property
+    def nearest(self) -> Optional[np.ndarray]:
+        """Flat index of the closest navigable cell for every cell, computed on first use."""
+        if self._nearest is None:
+            nearest = nearest_navigable(self.navigable)
+            if nearest is not None:
+                nearest.setflags(write=False)
+            self._nearest = nearest
+        return self._nearest
+
+    def to_pixel(self, lon: float, lat: float) -> Tuple[int, int]:
+        """(row, col) of the cell containing a WGS84 point, clamped to the grid."""
+        x, y = _transformer(self.grid).transform(lon, lat)
+        col, row = ~self.grid.transform * (x, y)
+        h, w = self.shape
+        return int(np.clip(np.floor(row), 0, h - 1)), int(np.clip(np.floor(col), 0, w - 1))
+
+    def snap(self, lon: float, lat: float) -> Tuple[Tuple[int, int], float]:
+        """
+        Closest navigable cell to a WGS84 point, and the distance in km from
+        the point to that cell's centre (measured in the grid projection).
+        """
+        x, y = _transformer(self.grid).transform(lon, lat)
+        cell = snap_cell(self.nearest, self.to_pixel(lon, lat))
+        return cell, float(np.hypot(x - self.grid.x[cell], y - self.grid.y[cell]) / 1000)
+
+    def water_at(self, lons, lats) -> np.ndarray:
+        """Whether WGS84 points lie on water cells; points off the grid count as water."""
+        x, y = _transformer(self.grid).transform(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        cols, rows = ~self.grid.transform * (np.asarray(x), np.asarray(y))
+        rows, cols = np.floor(rows), np.floor(cols)
+        h, w = self.shape
+        inside = (rows >= 0) & (rows < h) & (cols >= 0) & (cols < w)
+        water = np.ones(inside.shape, dtype=bool)
+        water[inside] = self.water[rows[inside].astype(np.intp), cols[inside].astype(np.intp)] > 0
+        return water
+
+    def to_lonlat(self, pixels: Sequence[Tuple[int, int]]) -> List[Tuple[float, float]]:
+        """WGS84 centres of a sequence of (row, col) cells."""
+        if not pixels:
+            return []
+        rows, cols = np.asarray(pixels).T
+        return list(zip(self.grid.lon[rows, cols].tolist(), self.grid.lat[rows, cols].tolist()))
+
+
+def _cached_layer(key: Hashable, build: Callable[[], NavigationGrid]) -> NavigationGrid:
+    with _layers_lock:
+        layer = _layers.get(key)
+        if layer is not None:
+            _layers.move_to_end(key)
+            return layer
+    layer = build()
+    layer.navigable.setflags(write=False)
+    layer.water.setflags(write=False)
+    if layer.cost is not None:
+        layer.cost.setflags(write=False)
+    with _layers_lock:
+        _layers[key] = layer
+        while len(_layers) > NAVGRID_CACHE_ENTRIES:
+            _layers.popitem(last=False)
+    return layer
+
+
+def _transformer(grid: GridGeometry) -> Transformer:
+    transformer = _to_grid.get(grid.key)
+    if transformer is None:
+        with _to_grid_lock:
+            transformer = _to_grid.setdefault(
+                grid.key, Transformer.from_crs("EPSG:4326", grid.crs, always_xy=True)
+            )
+    return transformer
+
+
+def _cost_profile(profile: str) -> CostProfile:
+    try:
+        return COST_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown cost profile '{profile}'; expected one of {sorted(COST_PROFILES)}.") from None
+
+
+def cost_field(prob: np.ndarray, blocked: np.ndarray, grid: GridGeometry, profile: CostProfile) -> np.ndarray:
+    """
+    Float32 cost of entering each cell for ice probabilities ``prob``:
+    the cell's true width in km times ``1 + ice_weight * prob``, ``inf``
+    where ``blocked`` or ``prob >= max_prob``.
+    """
+    prob = np.asarray(prob, dtype=np.float32)
+    width_km = np.sqrt(np.asarray(grid.area_km2, dtype=np.float32))
+    cost = width_km * (1.0 + np.float32(profile.ice_weight) * prob)
+    cost[blocked | (prob >= profile.max_prob)] = np.inf
+    return cost
+
+
+def _cost_grid(prob: np.ndarray, blocked: np.ndarray, grid: GridGeometry, layer: Dict, profile: str) -> NavigationGrid:
+    cost = cost_field(prob, blocked, grid, COST_PROFILES[profile])
+    water = (~blocked).astype(np.uint8)
+    return NavigationGrid(np.isfinite(cost).astype(np.uint8), grid, {**layer, "profile": profile}, cost, water)
+
+
+def observed_grid(date: str, profile: Optional[str] = None) -> NavigationGrid:
+    """
+    Navigation grid of an observed day (``YYYY-MM-DD``), as a cost layer if
+    a ``profile`` is given.
+
+    Raises ``FileNotFoundError`` if the catalog has no raster for that date.
+    """
+    if profile is not None:
+        _cost_profile(profile)
+    entry = get_catalog().find(date)
+    if entry is None:
+        raise FileNotFoundError(f"No GeoTIFF found for {date}")
+    path = Path(entry.path)
+
+    def _build() -> NavigationGrid:
+        data, transform, crs = load_raster(path)
+        data = np.asarray(data)
+        grid = get_grid_geometry(transform, data.shape, crs)
+        blocked = (data != OCEAN_CODE) & (data != ICE_CODE)
+        if profile is None:
+            navigable = (data == OCEAN_CODE).astype(np.uint8)
+            return NavigationGrid(navigable, grid, {"date": date}, water=(~blocked).astype(np.uint8))
+        return _cost_grid((data == ICE_CODE).astype(np.float32), blocked, grid, {"date": date}, profile)
+
+    return _cached_layer(("observed",) + file_fingerprint(path) + (profile,), _build)
+
+
+def predicted_grid(year: int, month: int, thresh: float = 0.5, profile: Optional[str] = None) -> NavigationGrid:
+    """
+    Navigation grid of a predicted month: valid model pixels whose ice
+    probability is below ``thresh``.  With a ``profile``, a cost layer over
+    the probabilities themselves (``thresh`` is then unused).
+    """
+    if profile is not None:
+        _cost_profile(profile)
+        thresh = None
+    else:
+        thresh = float(thresh)
+    model = get_model()
+    key = ("predicted", model.source, int(year), int(month), thresh, profile)
+
+    def _build() -> NavigationGrid:
+        pred_prob = probability_map(datetime(int(year), int(month), 1))
+        if profile is not None:
+            return _cost_grid(pred_prob, ~model.valid_mask, model.grid, {"year": year, "month": month}, profile)
+        navigable = (model.valid_mask & (pred_prob < thresh)).astype(np.uint8)
+        layer = {"year": year, "month": month, "thresh": thresh}
+        return NavigationGrid(navigable, model.grid, layer, water=model.valid_mask.astype(np.uint8))
+
+    return _cached_layer(key, _build)
+
+
+def resolve_layer(
+    date: Optional[str] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    thresh: float = 0.5,
+    profile: Optional[str] = None,
+) -> NavigationGrid:
+    """Observed grid if ``date`` is given, else the predicted grid for ``year``/``month``."""
+    if date is not None:
+        return observed_grid(date, profile)
+    if year is None or month is None:
+        raise ValueError("A layer needs either a date or a year and month.")
+    return predicted_grid(year, month, thresh, profile)
+
+
+def reference_water() -> Optional[NavigationGrid]:
+    """
+    A grid whose ``water`` marks the sea, for inputs that carry no land
+    information: the latest observed day in the catalog, else the model's
+    valid pixels.  ``None`` when neither is available.
+    """
+    dates = get_catalog().dates()
+    if dates:
+        try:
+            return observed_grid(dates[-1])
+        except (FileNotFoundError, GeoDataConversionError):
+            pass
+    try:
+        model = get_model()
+    except PredictionError:
+        return None
+    water = model.valid_mask.astype(np.uint8)
+    water.setflags(write=False)
+    return NavigationGrid(water, model.grid, {"model": True}, water=water)
+
+
+class NavigationStack:
+    """
+    Navigation grids over the ``days`` after a ``departure`` date, for
+    time-dependent routing.
+
+    Each day uses the observed grid of that day, or of the latest
+    observation up to :data:`MAX_OBSERVATION_AGE_DAYS` earlier, and the
+    forecast grid of its month (at ``thresh``) otherwise.  Consecutive days
+    that share a grid form one time slot.  Working out the slots only needs
+    catalog lookups; each grid is resolved on first use through the layer
+    cache, so stacks over overlapping dates share their grids.
+    """
+
+    def __init__(self, departure: date, days: int, thresh: float = 0.5):
+        self.departure = departure
+        self.days = int(days)
+        self.thresh = float(thresh)
+        self.slot_starts: List[float] = []  # hours after departure
+        self._refs: List[Tuple] = []
+        self._day_slots: List[int] = []
+        self._grids: Dict[int, NavigationGrid] = {}
+
+        catalog = get_catalog()
+        observed: Optional[date] = None
+        for offset in range(self.days + 1):
+            day = departure + timedelta(days=offset)
+            if catalog.find(day.isoformat()) is not None:
+                observed = day
+            if observed is not None and (day - observed).days <= MAX_OBSERVATION_AGE_DAYS:
+                ref: Tuple = ("observed", observed.isoformat())
+            else:
+                ref = ("predicted", day.year, day.month)
+            if not self._refs or self._refs[-1] != ref:
+                self._refs.append(ref)
+                self.slot_starts.append(offset * 24.0)
+            self._day_slots.append(len(self._refs) - 1)
+
+    @property
+    def horizon(self) -> float:
+        """Hours after departure covered by the stack."""
+        return (self.days + 1) * 24.0
+
+    def slot_at(self, hours: float) -> int:
+        """Index of the slot covering ``hours`` after departure."""
+        return self._day_slots[min(int(hours // 24), self.days)]
+
+    def grid(self, slot: int) -> NavigationGrid:
+        grid = self._grids.get(slot)
+        if grid is None:
+            ref = self._refs[slot]
+            grid = observed_grid(ref[1]) if ref[0] == "observed" else predicted_grid(ref[1], ref[2], self.thresh)
+            self._grids[slot] = grid
+        return grid
+
+    def navmap(self, slot: int) -> np.ndarray:
+        return self.grid(slot).navigable
+
+    def layer(self, slot: int) -> Dict:
+        return self.grid(slot).layer
+
+    def crossing_hours(self, speed_knots: float) -> np.ndarray:
+        """Hours to cross each cell (its true width) at ``speed_knots``."""
+        width_km = np.sqrt(np.asarray(self.grid(0).grid.area_km2, dtype=np.float64))
+        return width_km / (speed_knots * KM_PER_NAUTICAL_MILE)
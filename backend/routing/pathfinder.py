@@ -1,33 +1,525 @@
+"""
+8-connected grid search on binary navmaps (1 = navigable).
+
+Cells are addressed by flat indices into the navmap padded with a blocked
+one-cell border, so neighbours never need bounds checks.  The search state
+(g-scores, parents, closed set) lives in preallocated NumPy arrays, accessed
+through memoryviews in the inner loop.  Straight moves cost 1 and diagonal
+moves sqrt(2), and the octile distance is used as the (admissible)
+heuristic, so returned paths are shortest paths.
+
+``jump_points=True`` runs Jump Point Search instead: on these uniform-cost
+grids it finds a path of the same length while only queueing the cells where
+the path can turn.  Both return every cell of the path.
+
+For large grids, :func:`anytime_pathfinding` runs Anytime Weighted A* under a
+wall-clock or expansion budget and returns the best path found so far with a
+bound on its suboptimality.  Start/goal pairs in different 8-connected
+components (:func:`component_labels`, computed once per navmap) are rejected
+before any search, and positions off the navigable cells are snapped to the
+closest one with a precomputed distance transform (:func:`nearest_navigable`).
+
+:func:`earliest_arrival_pathfinding` routes through navmaps that change
+over time (one per time slot) for a vessel at a given speed, keeping one
+earliest-arrival label per cell rather than expanding (cell, time) pairs.
+
+Benchmark both on a raster (and upsampled copies of it) with::
+
+    python -m backend.routing.pathfinder N_19781026_extent_v4.0.tif --upsample 1 2 4
+"""
+from __future__ import annotations
+
+import argparse
 import heapq
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
 import numpy as np
+from scipy import ndimage
+
+SQRT2 = math.sqrt(2.0)
+_OCTILE = SQRT2 - 2.0
+# Expansions between wall-clock checks in anytime_pathfinding.
+CLOCK_CHECK_INTERVAL = 1024
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """
+    Outcome of :func:`anytime_pathfinding`.
+
+    ``status`` is ``optimal`` (search completed), ``bounded`` (budget ran out
+    after a path was found), ``timeout`` (budget ran out before one was) or
+    ``unreachable``.  ``bound`` is an upper bound on ``cost`` divided by the
+    optimal cost (1.0 when optimal, ``inf`` without a path).  Time-dependent
+    searches also give the arrival ``times`` (hours) at each path cell.
+    """
+
+    path: List[Tuple[int, int]]
+    cost: float
+    bound: float
+    status: str
+    expansions: int
+    times: Optional[List[float]] = None
+
+
+def component_labels(navmap: np.ndarray) -> np.ndarray:
+    """8-connected component label of every navigable cell (0 where blocked)."""
+    labels, _ = ndimage.label(np.asarray(navmap) == 1, structure=np.ones((3, 3), dtype=bool))
+    return labels
+
+
+def connected(labels: np.ndarray, start, goal) -> bool:
+    """
+    Whether ``goal`` can be reached from ``start`` according to
+    :func:`component_labels`, in constant time.
+
+    The start cell itself need not be navigable: a path may leave it to any
+    navigable neighbour, as in :func:`astar_pathfinding`.
+    """
+    h, w = labels.shape
+    (r, c), (gr, gc) = (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1]))
+    if not (0 <= r < h and 0 <= c < w and 0 <= gr < h and 0 <= gc < w):
+        return False
+    if (r, c) == (gr, gc):
+        return True
+    target = labels[gr, gc]
+    return bool(target) and bool((labels[max(r - 1, 0) : r + 2, max(c - 1, 0) : c + 2] == target).any())
 
-def astar_pathfinding(navmap, start, goal):
-    """Simple 8-connected A* pathfinding on binary map."""
+
+def _padded(navmap: np.ndarray) -> Tuple[bytes, int]:
+    """Navigable flags of ``navmap`` with a blocked border, and the padded width."""
+    h, w = navmap.shape
+    open_cells = np.zeros((h + 2, w + 2), dtype=np.uint8)
+    open_cells[1:-1, 1:-1] = np.asarray(navmap) == 1
+    return open_cells.tobytes(), w + 2
+
+
+def _path(parent, node: int, stride: int) -> List[Tuple[int, int]]:
+    """Cells from the start to ``node`` following ``parent``, filling in skipped cells."""
+    path = [divmod(node, stride)]
+    while parent[node] >= 0:
+        prev = parent[node]
+        (r0, c0), (r1, c1) = divmod(prev, stride), path[-1]
+        steps = max(abs(r1 - r0), abs(c1 - c0))
+        dr, dc = (r0 > r1) - (r0 < r1), (c0 > c1) - (c0 < c1)
+        path.extend((r1 + k * dr, c1 + k * dc) for k in range(1, steps + 1))
+        node = prev
+    return [(r - 1, c - 1) for r, c in reversed(path)]
+
+
+def _jump(cells: bytes, node: int, dr: int, dc: int, goal: int, stride: int) -> int:
+    """
+    Next jump point from ``node`` (exclusive) in direction (dr, dc), or -1.
+    """
+    step = dr * stride + dc
+    if dr and dc:
+        # A diagonal stops where either of its straight sweeps finds a jump point.
+        node += step
+        while cells[node]:
+            if node == goal:
+                return node
+            if (cells[node + dr * stride - dc] and not cells[node - dc]) or (
+                cells[node - dr * stride + dc] and not cells[node - dr * stride]
+            ):
+                return node
+            if _jump(cells, node, 0, dc, goal, stride) >= 0 or _jump(cells, node, dr, 0, goal, stride) >= 0:
+                return node
+            node += step
+        return -1
+
+    side = 1 if dr else stride  # the two cells beside a straight move
+    node += step
+    while cells[node]:
+        if node == goal:
+            return node
+        if (cells[node + side + step] and not cells[node + side]) or (
+            cells[node - side + step] and not cells[node - side]
+        ):
+            return node
+        node += step
+    return -1
+
+
+def _directions(cells: bytes, node: int, parent: int, stride: int) -> Sequence[Tuple[int, int]]:
+    """Directions worth searching from ``node`` when reached from ``parent`` (pruned JPS neighbours)."""
+    if parent < 0:
+        return ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+    pr, pc = divmod(parent, stride)
+    r, c = divmod(node, stride)
+    dr, dc = (r > pr) - (r < pr), (c > pc) - (c < pc)
+    if dr and dc:
+        dirs = [(dr, dc), (dr, 0), (0, dc)]
+        if not cells[node - dc]:
+            dirs.append((dr, -dc))
+        if not cells[node - dr * stride]:
+            dirs.append((-dr, dc))
+        return dirs
+    dirs = [(dr, dc)]
+    if dr:
+        for side in (-1, 1):
+            if not cells[node + side]:
+                dirs.append((dr, side))
+    else:
+        for side in (-1, 1):
+            if not cells[node + side * stride]:
+                dirs.append((side, dc))
+    return dirs
+
+
+def astar_pathfinding(navmap, start, goal, jump_points: bool = False):
+    """
+    Shortest 8-connected path from ``start`` to ``goal`` (``(row, col)``
+    cells) over the cells where ``navmap == 1``.
+
+    Returns the path as a list of cells including both ends, or ``[]`` when
+    the goal cannot be reached.  ``jump_points`` selects Jump Point Search.
+    """
     h, w = navmap.shape
-    open_set = [(0, start)]
-    came_from = {}
-    g_score = {start: 0}
-    neighbors = [(-1,0), (1,0), (0,-1), (0,1), (-1,-1), (-1,1), (1,-1), (1,1)]
+    if not (0 <= start[0] < h and 0 <= start[1] < w and 0 <= goal[0] < h and 0 <= goal[1] < w):
+        return []
+    cells, stride = _padded(navmap)
+    size = len(cells)
+    source = (int(start[0]) + 1) * stride + int(start[1]) + 1
+    target = (int(goal[0]) + 1) * stride + int(goal[1]) + 1
+
+    g_arr = np.full(size, np.inf)
+    parent_arr = np.full(size, -1, dtype=np.int64)
+    closed_arr = np.zeros(size, dtype=np.uint8)
+    g, parent, closed = memoryview(g_arr), memoryview(parent_arr), memoryview(closed_arr)
+
+    gr, gc = divmod(target, stride)
 
-    def heuristic(a, b):
-        return abs(a[0]-b[0]) + abs(a[1]-b[1])
+    def heuristic(node: int) -> float:
+        r, c = divmod(node, stride)
+        dr, dc = abs(r - gr), abs(c - gc)
+        return dr + dc + _OCTILE * (dr if dr < dc else dc)
 
+    g[source] = 0.0
+    open_set = [(heuristic(source), source)]
+    if jump_points:
+        while open_set:
+            _, node = heapq.heappop(open_set)
+            if closed[node]:
+                continue
+            if node == target:
+                return _path(parent, node, stride)
+            closed[node] = 1
+            base = g[node]
+            for dr, dc in _directions(cells, node, parent[node], stride):
+                nxt = _jump(cells, node, dr, dc, target, stride)
+                if nxt < 0 or closed[nxt]:
+                    continue
+                steps = abs(nxt // stride - node // stride) if dr else abs(nxt - node)
+                tentative = base + steps * (SQRT2 if dc and dr else 1.0)
+                if tentative < g[nxt]:
+                    g[nxt] = tentative
+                    parent[nxt] = node
+                    heapq.heappush(open_set, (tentative + heuristic(nxt), nxt))
+        return []
+
+    straight = (-stride, stride, -1, 1)
+    diagonal = (-stride - 1, -stride + 1, stride - 1, stride + 1)
     while open_set:
-        _, current = heapq.heappop(open_set)
-        if current == goal:
-            path = [current]
-            while current in came_from:
-                current = came_from[current]
-                path.append(current)
-            return path[::-1]
-        for dr, dc in neighbors:
-            nr, nc = current[0]+dr, current[1]+dc
-            if 0 <= nr < h and 0 <= nc < w and navmap[nr, nc] == 1:
-                cost = 1.0 if abs(dr)+abs(dc)==1 else 1.4
-                tentative_g = g_score[current] + cost
-                if tentative_g < g_score.get((nr,nc), float("inf")):
-                    came_from[(nr,nc)] = current
-                    g_score[(nr,nc)] = tentative_g
-                    f = tentative_g + heuristic((nr,nc), goal)
-                    heapq.heappush(open_set, (f, (nr,nc)))
+        _, node = heapq.heappop(open_set)
+        if closed[node]:
+            continue
+        if node == target:
+            return _path(parent, node, stride)
+        closed[node] = 1
+        base = g[node]
+        for offsets, cost in ((straight, 1.0), (diagonal, SQRT2)):
+            tentative = base + cost
+            for offset in offsets:
+                nxt = node + offset
+                if cells[nxt] and not closed[nxt] and tentative < g[nxt]:
+                    g[nxt] = tentative
+                    parent[nxt] = node
+                    heapq.heappush(open_set, (tentative + heuristic(nxt), nxt))
     return []
+
+
+def nearest_navigable(navmap: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Flat index (``row * width + col``) of the closest navigable cell, by exact
+    Euclidean distance, for every cell of ``navmap``; ``None`` when no cell
+    is navigable.
+    """
+    blocked = np.asarray(navmap) != 1
+    if blocked.all():
+        return None
+    rows, cols = ndimage.distance_transform_edt(blocked, return_distances=False, return_indices=True)
+    return (rows * blocked.shape[1] + cols).astype(np.int32)
+
+
+def snap_cell(nearest: Optional[np.ndarray], cell) -> Tuple[int, int]:
+    """Closest navigable cell to ``cell`` (clamped to the grid) via :func:`nearest_navigable`."""
+    if nearest is None:
+        return int(cell[0]), int(cell[1])
+    h, w = nearest.shape
+    r, c = min(max(int(cell[0]), 0), h - 1), min(max(int(cell[1]), 0), w - 1)
+    return divmod(int(nearest[r, c]), w)
+
+
+def anytime_pathfinding(
+    navmap,
+    start,
+    goal,
+    weight: float = 2.0,
+    max_seconds: Optional[float] = None,
+    max_expansions: Optional[int] = None,
+    labels: Optional[np.ndarray] = None,
+    cost: Optional[np.ndarray] = None,
+) -> SearchResult:
+    """
+    Anytime Weighted A* from ``start`` to ``goal`` on the same grid as
+    :func:`astar_pathfinding`.
+
+    ``cost`` optionally gives the (positive) cost of entering each cell, so
+    a step costs its length times the cost of the cell it enters; the
+    heuristic is then the octile distance times the cheapest navigable cell.
+
+    Cells are expanded in order of ``g + weight * h``, which reaches a first
+    path quickly; the search then keeps improving it, pruning every cell that
+    cannot beat the current path, until the open list is empty (the path is
+    optimal) or ``max_seconds``/``max_expansions`` run out.  The returned
+    ``bound`` is the path cost over the smallest ``g + h`` left open, a lower
+    bound on the optimal cost.  Pass precomputed ``labels``
+    (:func:`component_labels`) to skip labelling the navmap.
+    """
+    deadline = time.perf_counter() + max_seconds if max_seconds is not None else None
+    if labels is None:
+        labels = component_labels(navmap)
+    if not connected(labels, start, goal):
+        return SearchResult([], math.inf, math.inf, "unreachable", 0)
+
+    cells, stride = _padded(navmap)
+    size = len(cells)
+    source = (int(start[0]) + 1) * stride + int(start[1]) + 1
+    target = (int(goal[0]) + 1) * stride + int(goal[1]) + 1
+    g_arr = np.full(size, np.inf)
+    parent_arr = np.full(size, -1, dtype=np.int64)
+    g, parent = memoryview(g_arr), memoryview(parent_arr)
+    cell_cost_arr = np.ones((navmap.shape[0] + 2, stride))
+    scale = 1.0
+    if cost is not None:
+        open_cells = np.asarray(navmap) == 1
+        cell_cost_arr[1:-1, 1:-1] = cost
+        scale = float(np.min(cost, where=open_cells, initial=np.inf)) if open_cells.any() else 1.0
+    cell_cost = memoryview(cell_cost_arr.ravel())
+
+    gr, gc = divmod(target, stride)
+
+    def heuristic(node: int) -> float:
+        r, c = divmod(node, stride)
+        dr, dc = abs(r - gr), abs(c - gc)
+        return scale * (dr + dc + _OCTILE * (dr if dr < dc else dc))
+
+    budget = max_expansions if max_expansions is not None else math.inf
+    moves = tuple((offset, 1.0) for offset in (-stride, stride, -1, 1)) + tuple(
+        (offset, SQRT2) for offset in (-stride - 1, -stride + 1, stride - 1, stride + 1)
+    )
+
+    best_path: List[Tuple[int, int]] = []
+    best = math.inf
+    expansions = 0
+    g[source] = 0.0
+    open_set = [(weight * heuristic(source), 0.0, source)]
+    exhausted = True
+    while open_set:
+        if expansions >= budget or (
+            deadline is not None and expansions % CLOCK_CHECK_INTERVAL == 0 and time.perf_counter() > deadline
+        ):
+            exhausted = False
+            break
+        _, base, node = heapq.heappop(open_set)
+        if base > g[node] or base + heuristic(node) >= best:
+            continue
+        if node == target:
+            best, best_path = base, _path(parent, node, stride)
+            continue
+        expansions += 1
+        for offset, length in moves:
+            nxt = node + offset
+            tentative = base + length * cell_cost[nxt]
+            if cells[nxt] and tentative < g[nxt]:
+                h_next = heuristic(nxt)
+                if tentative + h_next < best:
+                    g[nxt] = tentative
+                    parent[nxt] = node
+                    heapq.heappush(open_set, (tentative + weight * h_next, tentative, nxt))
+
+    if exhausted:
+        status = "optimal" if best_path else "unreachable"
+        return SearchResult(best_path, best, 1.0 if best_path else math.inf, status, expansions)
+    if not best_path:
+        return SearchResult([], math.inf, math.inf, "timeout", expansions)
+    lower = min((entry_g + heuristic(node) for _, entry_g, node in open_set if entry_g <= g[node]), default=best)
+    return SearchResult(best_path, best, best / min(lower, best) if lower > 0 else math.inf, "bounded", expansions)
+
+
+def earliest_arrival_pathfinding(
+    stack,
+    start,
+    goal,
+    cell_hours: np.ndarray,
+    water: Optional[np.ndarray] = None,
+    horizon: Optional[float] = None,
+) -> SearchResult:
+    """
+    Earliest arrival at ``goal`` leaving ``start`` at hour 0 through navmaps
+    that change over time.
+
+    ``stack`` provides them by time slot: ``slot_starts`` (ascending hours,
+    the first 0), ``slot_at(hours)`` and ``navmap(slot)``, which is only
+    called for slots the search reaches.  Entering a cell takes the
+    diagonal or straight step length times its ``cell_hours``, and the cell
+    must be navigable in the slot the vessel arrives in; otherwise the
+    vessel waits where it is until the first later slot in which the cell is
+    open, provided its own cell stays navigable until it leaves (the move is
+    dropped if not).  This is A* over arrival times with one
+    earliest-arrival label per cell and the octile distance at the fastest
+    crossing time as heuristic.  Leaving later never arrives earlier, so the
+    labels are exact whenever waiting is possible; they may miss a route
+    that only works by reaching a cell later, after an interval in which it
+    is iced over.  Forward scans for an open slot are remembered per cell,
+    and cells outside ``water`` (never navigable, e.g. land) are skipped
+    outright.
+
+    Arrivals later than ``horizon`` hours are discarded.  ``cost`` is the
+    arrival time at the goal and ``times`` the arrival time at each path cell.
+    """
+    h, w = cell_hours.shape
+    stride = w + 2
+    size = (h + 2) * stride
+    source = (int(start[0]) + 1) * stride + int(start[1]) + 1
+    target = (int(goal[0]) + 1) * stride + int(goal[1]) + 1
+    horizon = math.inf if horizon is None else float(horizon)
+
+    padded_hours = np.full((h + 2, stride), np.inf)
+    padded_hours[1:-1, 1:-1] = cell_hours
+    crossing = memoryview(padded_hours.ravel())
+    sea, _ = _padded(stack.navmap(0) if water is None else water)
+    fastest = float(np.min(cell_hours, where=np.asarray(cell_hours) > 0, initial=np.inf))
+    fastest = fastest if math.isfinite(fastest) else 0.0
+
+    slot_starts = list(stack.slot_starts)
+    open_cells: List[Optional[bytes]] = [None] * len(slot_starts)
+
+    def cells(slot: int) -> bytes:
+        flags = open_cells[slot]
+        if flags is None:
+            flags = open_cells[slot] = _padded(stack.navmap(slot))[0]
+        return flags
+
+    # Cell n is known to be closed in slots [scan_from[n], scan_to[n]).
+    scan_from_arr = np.zeros(size, dtype=np.int32)
+    scan_to_arr = np.zeros(size, dtype=np.int32)
+    scan_from, scan_to = memoryview(scan_from_arr), memoryview(scan_to_arr)
+
+    arrival_arr = np.full(size, np.inf)
+    parent_arr = np.full(size, -1, dtype=np.int64)
+    closed_arr = np.zeros(size, dtype=np.uint8)
+    arrival, parent, closed = memoryview(arrival_arr), memoryview(parent_arr), memoryview(closed_arr)
+
+    gr, gc = divmod(target, stride)
+
+    def heuristic(node: int) -> float:
+        r, c = divmod(node, stride)
+        dr, dc = abs(r - gr), abs(c - gc)
+        return fastest * (dr + dc + _OCTILE * (dr if dr < dc else dc))
+
+    moves = tuple((offset, 1.0) for offset in (-stride, stride, -1, 1)) + tuple(
+        (offset, SQRT2) for offset in (-stride - 1, -stride + 1, stride - 1, stride + 1)
+    )
+    slot_count = len(slot_starts)
+    slot_at = stack.slot_at
+    expansions = 0
+    arrival[source] = 0.0
+    open_set = [(heuristic(source), 0.0, source)]
+    while open_set:
+        _, t, node = heapq.heappop(open_set)
+        if closed[node]:
+            continue
+        if node == target:
+            path = _path(parent, node, stride)
+            times = [arrival[(r + 1) * stride + c + 1] for r, c in path]
+            return SearchResult(path, t, 1.0, "optimal", expansions, times)
+        closed[node] = 1
+        expansions += 1
+        # Last slot through which this cell is known to stay open since the arrival.
+        node_open = slot_at(t)
+        for offset, length in moves:
+            nxt = node + offset
+            if not sea[nxt] or closed[nxt]:
+                continue
+            reach = t + length * crossing[nxt]
+            if reach > horizon:
+                continue
+            slot = slot_at(reach)
+            if not cells(slot)[nxt]:
+                if scan_from[nxt] <= slot < scan_to[nxt]:
+                    opens = scan_to[nxt]
+                else:
+                    opens = slot + 1
+                    while opens < slot_count and slot_starts[opens] <= horizon and not cells(opens)[nxt]:
+                        opens += 1
+                    scan_from[nxt], scan_to[nxt] = slot, opens
+                if opens >= slot_count or slot_starts[opens] > horizon:
+                    continue
+                reach = slot_starts[opens]
+                # The vessel waits here until it has to leave to arrive as nxt opens.
+                leave = slot_at(reach - length * crossing[nxt])
+                while node_open < leave and cells(node_open + 1)[node]:
+                    node_open += 1
+                if node_open < leave:
+                    continue
+            if reach < arrival[nxt]:
+                arrival[nxt] = reach
+                parent[nxt] = node
+                heapq.heappush(open_set, (reach + heuristic(nxt), reach, nxt))
+    return SearchResult([], math.inf, math.inf, "unreachable", expansions)
+
+
+def path_length(path: Sequence[Tuple[int, int]]) -> float:
+    """Length of a cell path in cell widths (diagonal steps count sqrt(2))."""
+    steps = np.abs(np.diff(np.asarray(path, dtype=np.int64).reshape(-1, 2), axis=0))
+    return float(np.where(steps.sum(axis=1) == 2, SQRT2, 1.0).sum())
+
+
+def _benchmark_pairs(navmap: np.ndarray, count: int, seed: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    rng = np.random.default_rng(seed)
+    open_cells = np.argwhere(navmap == 1)
+    picks = rng.choice(len(open_cells), size=(count, 2))
+    return [(tuple(open_cells[a]), tuple(open_cells[b])) for a, b in picks]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark A* and Jump Point Search on a sea-ice raster.")
+    parser.add_argument("raster", help="NSIDC extent GeoTIFF; open ocean (code 0) is navigable.")
+    parser.add_argument("--upsample", type=int, nargs="+", default=[1, 2, 4], help="Grid upsampling factors.")
+    parser.add_argument("--pairs", type=int, default=20, help="Random start/goal pairs per grid.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import rasterio
+
+    with rasterio.open(args.raster) as src:
+        base = (src.read(1) == 0).astype(np.uint8)
+
+    for factor in args.upsample:
+        navmap = np.kron(base, np.ones((factor, factor), dtype=np.uint8))
+        pairs = _benchmark_pairs(navmap, args.pairs, args.seed)
+        print(f"{navmap.shape[0]}x{navmap.shape[1]} grid, {len(pairs)} pairs")
+        for name, jump_points in (("astar", False), ("jps", True)):
+            t0 = time.perf_counter()
+            found = [astar_pathfinding(navmap, s, e, jump_points=jump_points) for s, e in pairs]
+            elapsed = time.perf_counter() - t0
+            routed = sum(1 for p in found if p)
+            print(f"  {name:5s} {elapsed / len(pairs) * 1000:8.1f} ms/route  ({routed} routed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,192 @@
+"""
+Shipping-corridor proximity for corridor-aware routing.
+
+Route geometries are split into two-point segments (polygons by their
+boundaries, plus a containment index) and indexed in shapely ``STRtree``s,
+so distance and bonus queries take coordinate arrays and run as single
+vectorized shapely calls.  For routing,
+:meth:`ShippingCorridorHandler.bonus_raster` burns the corridors into a
+raster grid once and turns a Euclidean distance transform of it into a
+per-cell cost multiplier, cached per grid.
+
+The backend reads corridors from ``ICE_CORRIDORS_PATH`` (defaults to the
+repository's ``routing/corridors_buffered.geojson``) via :func:`get_corridors`.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, Optional, Tuple
+
 import geopandas as gpd
-from shapely.geometry import Point
-from shapely.ops import nearest_points
+import numpy as np
+import rasterio
+import shapely
+from pyproj import CRS, Transformer
+from rasterio import features
+from scipy import ndimage
+
+CORRIDORS_PATH = Path(
+    os.environ.get(
+        "ICE_CORRIDORS_PATH",
+        Path(__file__).resolve().parents[2] / "routing" / "corridors_buffered.geojson",
+    )
+)
+# Metres per degree of latitude, for distances on geographic grids.
+METRES_PER_DEGREE = 111_320.0
+
+
+def _segments(geometries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ``(segments, polygons)``: every line and polygon ring split into
+    two-point segments (points kept as they are), and the polygon parts.
+    """
+    parts = shapely.get_parts(geometries)
+    parts = parts[~shapely.is_empty(parts)]
+    is_polygon = shapely.get_type_id(parts) == 3
+    polygons = parts[is_polygon]
+    lines = np.concatenate([parts[~is_polygon], shapely.get_parts(shapely.get_rings(polygons))])
+    is_point = shapely.get_type_id(lines) == 0
+    coords, index = shapely.get_coordinates(lines[~is_point], return_index=True)
+    same_line = index[1:] == index[:-1]
+    segments = shapely.linestrings(np.stack([coords[:-1][same_line], coords[1:][same_line]], axis=1))
+    return np.concatenate([lines[is_point], segments]), polygons
+
 
 class ShippingCorridorHandler:
     def __init__(self, geojson_path: str, buffer_m=5000, crs="EPSG:4326"):
+        """
+        Initialize handler for shipping corridors.
+        Args:
+            geojson_path: Path to your GeoJSON file of shipping routes.
+            buffer_m: Corridor buffer distance (in units of ``crs``; metres on rasters).
+            crs: Target projection (e.g., EPSG:3413 for Arctic analysis).
+        """
         self.routes = gpd.read_file(geojson_path)
         self.routes = self.routes.to_crs(crs)
         self.buffer_m = buffer_m
-        self.corridors = self.routes.buffer(buffer_m)
-        self.corridor_union = self.corridors.unary_union
         self.crs = crs
+        self.segments, self.polygons = _segments(self.routes.geometry.values)
+        self.tree = shapely.STRtree(self.segments)
+        self.polygon_tree = shapely.STRtree(self.polygons)
+        self._from_lonlat = Transformer.from_crs("EPSG:4326", self.routes.crs, always_xy=True)
+        self._rasters: Dict[Hashable, np.ndarray] = {}
+        self._rasters_lock = threading.Lock()
+
+    def _points(self, xs, ys, from_latlon=True) -> np.ndarray:
+        xs = np.atleast_1d(np.asarray(xs, dtype=np.float64))
+        ys = np.atleast_1d(np.asarray(ys, dtype=np.float64))
+        if from_latlon:
+            xs, ys = self._from_lonlat.transform(xs, ys)
+        return shapely.points(xs, ys)
+
+    def nearest_corridor_distances(self, xs, ys, from_latlon=True, max_distance=None) -> np.ndarray:
+        """
+        Distance from each coordinate to the nearest corridor (in ``crs``
+        units); ``inf`` without corridors or beyond ``max_distance``.
+        """
+        points = self._points(xs, ys, from_latlon)
+        distances = np.full(len(points), np.inf)
+        if len(self.segments):
+            (hits, _), nearest = self.tree.query_nearest(
+                points, max_distance=max_distance, return_distance=True, all_matches=False
+            )
+            distances[hits] = nearest
+        if len(self.polygons):
+            inside, _ = self.polygon_tree.query(points, predicate="intersects")
+            distances[inside] = 0.0
+        return distances
+
+    def points_in_corridor(self, xs, ys, from_latlon=True) -> np.ndarray:
+        """Whether each coordinate lies within ``buffer_m`` of a corridor."""
+        return self.nearest_corridor_distances(xs, ys, from_latlon, self.buffer_m) <= self.buffer_m
+
+    def bonus_for_distance(self, distances, max_bonus=0.5) -> np.ndarray:
+        """
+        Cost multiplier for distances to the nearest corridor: ``max_bonus``
+        within the buffer, rising linearly to 1 at three buffer widths.
+        """
+        decay = np.clip((np.asarray(distances, dtype=np.float64) - self.buffer_m) / (self.buffer_m * 2), 0.0, 1.0)
+        return max_bonus + (1 - max_bonus) * decay
+
+    def corridor_bonuses(self, xs, ys, max_bonus=0.5, from_latlon=True) -> np.ndarray:
+        """Cost multiplier of each coordinate based on its proximity to a corridor."""
+        distances = self.nearest_corridor_distances(xs, ys, from_latlon, self.buffer_m * 3)
+        return self.bonus_for_distance(distances, max_bonus)
+
+    def is_point_in_corridor(self, lon: float, lat: float, from_latlon=True) -> bool:
+        """Check if a coordinate lies within the corridor buffer."""
+        return bool(self.points_in_corridor(lon, lat, from_latlon)[0])
+
+    def nearest_corridor_distance(self, lon: float, lat: float, from_latlon=True) -> float:
+        """Compute distance from a coordinate to the nearest corridor line (in ``crs`` units)."""
+        return float(self.nearest_corridor_distances(lon, lat, from_latlon)[0])
+
+    def corridor_bonus(self, lon: float, lat: float, max_bonus=0.5, from_latlon=True) -> float:
+        """Return a cost multiplier based on proximity to a corridor."""
+        return float(self.corridor_bonuses(lon, lat, max_bonus, from_latlon)[0])
+
+    def bonus_raster(
+        self, transform: rasterio.Affine, shape: Tuple[int, int], crs, max_bonus=0.5
+    ) -> np.ndarray:
+        """
+        Read-only float32 corridor multiplier (:meth:`bonus_for_distance`)
+        for every cell of a raster grid, cached per grid.
+
+        Corridors are burned into the grid (every touched cell) and the
+        distance from each cell centre to the nearest burned cell is taken
+        from a Euclidean distance transform, in metres (approximated from
+        degrees on geographic grids).
+        """
+        crs = CRS.from_user_input(crs)
+        key = (tuple(transform)[:6], tuple(shape), crs.to_wkt(), float(max_bonus))
+        raster = self._rasters.get(key)
+        if raster is not None:
+            return raster
+
+        geometries = self.routes.geometry.to_crs(crs).values
+        geometries = geometries[~shapely.is_empty(geometries)]
+        if len(geometries) == 0:
+            raster = np.ones(shape, dtype=np.float32)
+        else:
+            burned = features.rasterize(
+                geometries, out_shape=shape, transform=transform, fill=0, default_value=1,
+                all_touched=True, dtype=np.uint8,
+            )
+            sampling = (abs(transform.e), abs(transform.a))
+            if crs.is_geographic:
+                centre_lat = transform.f + transform.e * shape[0] / 2
+                sampling = (
+                    sampling[0] * METRES_PER_DEGREE,
+                    sampling[1] * METRES_PER_DEGREE * max(np.cos(np.radians(centre_lat)), 0.01),
+                )
+            if burned.any():
+                distances = ndimage.distance_transform_edt(burned == 0, sampling=sampling)
+                raster = self.bonus_for_distance(distances, max_bonus).astype(np.float32)
+            else:
+                raster = np.ones(shape, dtype=np.float32)
+        raster.setflags(write=False)
+        with self._rasters_lock:
+            self._rasters.setdefault(key, raster)
+        return self._rasters[key]
+
+
+_corridors: Optional[ShippingCorridorHandler] = None
+_corridors_lock = threading.Lock()
+
+
+def get_corridors() -> ShippingCorridorHandler:
+    """
+    The process-wide corridor handler for ``ICE_CORRIDORS_PATH``, loaded on first use.
 
-    def is_point_in_corridor(self, lon: float, lat: float):
-        pt = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326").to_crs(self.routes.crs)
-        return self.corridor_union.contains(pt.iloc[0])
+    Raises ``FileNotFoundError`` when the corridor file is missing.
+    """
+    global _corridors
+    if _corridors is None:
+        with _corridors_lock:
+            if _corridors is None:
+                if not CORRIDORS_PATH.exists():
+                    raise FileNotFoundError(f"Shipping corridors not found at {CORRIDORS_PATH}")
+                _corridors = ShippingCorridorHandler(str(CORRIDORS_PATH))
+    return _corridors
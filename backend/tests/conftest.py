@@ -0,0 +1,24 @@
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Point every on-disk cache at a scratch directory before any backend module
+# reads its settings at import time.
+_SCRATCH = Path(tempfile.mkdtemp(prefix="ice-backend-tests-"))
+for _name, _sub in (
+    ("ICE_CACHE_DIR", "cache"),
+    ("ICE_CATALOG_PATH", "catalog.sqlite"),
+    ("ICE_CUBE_DIR", "cube"),
+    ("ICE_DATASET_DIR", "datasets"),
+    ("ICE_GRID_CACHE_DIR", "grid"),
+    ("ICE_MODEL_CACHE_DIR", "model"),
+):
+    os.environ[_name] = str(_SCRATCH / _sub)
+
+
+@pytest.fixture(scope="session")
+def sample_raster() -> Path:
+    """The NSIDC GeoTIFF shipped with the routing prototype."""
+    return Path(__file__).resolve().parents[2] / "routing" / "N_19781026_extent_v4.0.tif"
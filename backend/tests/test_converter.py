@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from backend.converter import convert_tif_to_geojson
+
+
+@pytest.mark.parametrize("radius_km", [0, 500])
+def test_columnar_engine_matches_geopandas(sample_raster, radius_km):
+    columnar = convert_tif_to_geojson(str(sample_raster), radius_km, engine="columnar")
+    reference = convert_tif_to_geojson(str(sample_raster), radius_km, engine="geopandas")
+
+    assert columnar["type"] == reference["type"] == "FeatureCollection"
+    assert len(columnar["features"]) == len(reference["features"]) > 0
+    for ours, theirs in zip(columnar["features"], reference["features"]):
+        assert ours["id"] == theirs["id"]
+        assert ours["properties"] == theirs["properties"]
+        assert ours["geometry"]["type"] == theirs["geometry"]["type"] == "Point"
+    coords = np.array([f["geometry"]["coordinates"] for f in columnar["features"]])
+    expected = np.array([f["geometry"]["coordinates"] for f in reference["features"]])
+    np.testing.assert_allclose(coords, expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(columnar["bbox"], reference["bbox"], rtol=0, atol=1e-9)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import rasterio
+
+from backend.maskcodec import (
+    MASK_ENCODINGS,
+    PROBABILITY_ENCODINGS,
+    decode_raster,
+    encode_raster,
+    grid_header,
+    quantize_probability,
+)
+
+HEADER = {"transform": [25000.0, 0.0, -3850000.0, 0.0, -25000.0, 5850000.0], "crs": "EPSG:3411"}
+SHAPES = [(1, 1), (3, 5), (7, 13), (448, 304)]
+
+
+@pytest.mark.parametrize("encoding", MASK_ENCODINGS)
+@pytest.mark.parametrize("shape", SHAPES)
+def test_mask_round_trip(encoding, shape):
+    rng = np.random.default_rng(shape[0] * shape[1])
+    for mask in (rng.random(shape) < 0.3, np.zeros(shape, bool), np.ones(shape, bool)):
+        header, values = decode_raster(encode_raster(mask, encoding, {**HEADER, "date": "2020-01-01"}))
+        assert values.dtype == np.bool_
+        np.testing.assert_array_equal(values, mask)
+        assert header["shape"] == list(shape)
+        assert header["encoding"] == encoding
+        assert header["date"] == "2020-01-01"
+        assert header["transform"] == HEADER["transform"]
+
+
+@pytest.mark.parametrize("encoding", PROBABILITY_ENCODINGS)
+@pytest.mark.parametrize("shape", SHAPES)
+def test_probability_round_trip(encoding, shape):
+    rng = np.random.default_rng(shape[0] + shape[1])
+    prob = rng.random(shape)
+    prob[prob < 0.5] = 0.0
+    quantized = quantize_probability(prob)
+    header, values = decode_raster(encode_raster(quantized, encoding, HEADER))
+    assert values.dtype == np.uint8
+    np.testing.assert_array_equal(values, quantized)
+    assert np.abs(values / 255.0 - prob).max() <= 0.5 / 255 + 1e-12
+
+
+def test_rejects_mismatched_encodings():
+    with pytest.raises(ValueError):
+        encode_raster(np.zeros((2, 2), bool), "raw", HEADER)
+    with pytest.raises(ValueError):
+        encode_raster(np.zeros((2, 2), np.uint8), "bits", HEADER)
+    with pytest.raises(ValueError):
+        encode_raster(np.zeros((2, 2), np.float32), "raw", HEADER)
+    with pytest.raises(ValueError):
+        decode_raster(b"NOPE" + bytes(8))
+
+
+def test_grid_header_describes_raster(sample_raster):
+    with rasterio.open(sample_raster) as src:
+        header = grid_header(src.transform, src.crs)
+        mask = src.read(1) == 1
+    decoded, values = decode_raster(encode_raster(mask, "bits", header))
+    assert rasterio.Affine(*decoded["transform"]) == src.transform
+    assert rasterio.crs.CRS.from_string(decoded["crs"]) == src.crs
+    np.testing.assert_array_equal(values, mask)
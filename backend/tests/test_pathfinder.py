@@ -0,0 +1,104 @@
+import math
+
+import numpy as np
+import pytest
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from backend.routing.pathfinder import (
+    SQRT2,
+    anytime_pathfinding,
+    astar_pathfinding,
+    component_labels,
+    connected,
+    path_length,
+)
+
+MOVES = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+def _dijkstra(navmap, start, cost=None):
+    """Distance from ``start`` to every cell; a step costs its length times the cost of the cell entered."""
+    h, w = navmap.shape
+    cost = np.ones(navmap.shape) if cost is None else cost
+    index = np.arange(h * w).reshape(h, w)
+    rows, cols, weights = [], [], []
+    for dr, dc in MOVES:
+        src = index[max(-dr, 0) : h - max(dr, 0), max(-dc, 0) : w - max(dc, 0)]
+        dst = index[max(dr, 0) : h - max(-dr, 0), max(dc, 0) : w - max(-dc, 0)]
+        ok = navmap.ravel()[dst] == 1
+        rows.append(src[ok])
+        cols.append(dst[ok])
+        weights.append((SQRT2 if dr and dc else 1.0) * cost.ravel()[dst[ok]])
+    graph = coo_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=(h * w, h * w))
+    return dijkstra(graph.tocsr(), indices=start[0] * w + start[1]).reshape(h, w)
+
+
+def _random_cases(count, seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        h, w = rng.integers(5, 40, size=2)
+        navmap = (rng.random((h, w)) < rng.uniform(0.5, 0.85)).astype(np.uint8)
+        open_cells = np.argwhere(navmap == 1)
+        if len(open_cells) < 2:
+            continue
+        a, b = rng.choice(len(open_cells), size=2, replace=False)
+        yield rng, navmap, tuple(open_cells[a]), tuple(open_cells[b])
+
+
+def _assert_valid_path(path, navmap, start, goal):
+    assert path[0] == start and path[-1] == goal
+    assert all(navmap[cell] == 1 for cell in path[1:])
+    steps = np.abs(np.diff(np.asarray(path), axis=0))
+    assert steps.max() == 1
+
+
+@pytest.mark.parametrize("jump_points", [False, True])
+def test_astar_matches_dijkstra(jump_points):
+    for _, navmap, start, goal in _random_cases(300, seed=20):
+        expected = _dijkstra(navmap, start)[goal]
+        path = astar_pathfinding(navmap, start, goal, jump_points=jump_points)
+        if math.isinf(expected):
+            assert path == []
+            continue
+        _assert_valid_path(path, navmap, start, goal)
+        assert path_length(path) == pytest.approx(expected, abs=1e-9)
+
+
+def _path_cost(path, cost):
+    steps = np.abs(np.diff(np.asarray(path), axis=0)).sum(axis=1)
+    entered = tuple(np.asarray(path[1:]).T)
+    return float((np.where(steps == 2, SQRT2, 1.0) * cost[entered]).sum())
+
+
+def test_anytime_matches_dijkstra():
+    for rng, navmap, start, goal in _random_cases(300, seed=21):
+        cost = rng.uniform(1.0, 3.0, size=navmap.shape)
+        expected = _dijkstra(navmap, start, cost)[goal]
+        labels = component_labels(navmap)
+        assert connected(labels, start, goal) == (not math.isinf(expected))
+
+        result = anytime_pathfinding(navmap, start, goal, labels=labels, cost=cost)
+        if math.isinf(expected):
+            assert result.status == "unreachable" and result.path == []
+            continue
+        assert result.status == "optimal" and result.bound == 1.0
+        _assert_valid_path(result.path, navmap, start, goal)
+        assert result.cost == pytest.approx(expected, abs=1e-9)
+        assert _path_cost(result.path, cost) == pytest.approx(expected, abs=1e-9)
+
+
+def test_anytime_budget_bounds_suboptimality():
+    bounded = 0
+    for rng, navmap, start, goal in _random_cases(300, seed=22):
+        cost = rng.uniform(1.0, 3.0, size=navmap.shape)
+        expected = _dijkstra(navmap, start, cost)[goal]
+        budget = int(rng.integers(5, 60))
+        result = anytime_pathfinding(navmap, start, goal, weight=3.0, max_expansions=budget, cost=cost)
+        if result.status in ("timeout", "unreachable"):
+            assert result.path == []
+            continue
+        _assert_valid_path(result.path, navmap, start, goal)
+        assert expected - 1e-9 <= result.cost <= result.bound * expected + 1e-9
+        bounded += result.status == "bounded"
+    assert bounded > 0
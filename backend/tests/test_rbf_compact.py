@@ -0,0 +1,34 @@
+import numpy as np
+
+from backend.rbf_compact import compact_weights, rbf_kernel, temporal_features
+
+
+def _daily_model(rng, months=30, pixels=50):
+    month_index = np.repeat(np.arange(months), rng.integers(1, 5, size=months))
+    rng.shuffle(month_index)
+    years = 2015 + month_index // 12
+    months_of_year = month_index % 12 + 1
+    return rng.standard_normal((pixels, month_index.size)), years, months_of_year
+
+
+def test_compacted_weights_predict_the_same():
+    rng = np.random.default_rng(0)
+    weights, years, months = _daily_model(rng)
+    compact, c_years, c_months = compact_weights(weights, years, months)
+
+    keys = c_years * 12 + c_months
+    assert compact.shape == (weights.shape[0], np.unique(years * 12 + months).size)
+    assert np.all(np.diff(keys) > 0)
+
+    gamma = 1.0 / (2 * 0.3**2)
+    query = temporal_features(np.array([2015, 2016, 2017, 2019]), np.array([1, 4, 9, 12]), 2015.0, 10.0)
+    daily = weights @ rbf_kernel(temporal_features(years, months, 2015.0, 10.0), query, gamma)
+    monthly = compact @ rbf_kernel(temporal_features(c_years, c_months, 2015.0, 10.0), query, gamma)
+    np.testing.assert_allclose(monthly, daily, rtol=0, atol=1e-10)
+
+
+def test_compact_models_are_returned_as_is():
+    rng = np.random.default_rng(1)
+    weights, years, months = compact_weights(*_daily_model(rng))
+    again = compact_weights(weights, years, months)
+    assert again[0] is weights
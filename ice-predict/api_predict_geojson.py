@@ -22,19 +22,29 @@ print(f"Loading model: {MODEL_PATH}")
 
 # ---------------------- Preload Model ----------------------
 data = np.load(MODEL_PATH, allow_pickle=True)
-weights = torch.from_numpy(data["weights"]).to(DEVICE).float()   # (N_valid, T)
+weights = torch.from_numpy(data["weights"]).to(DEVICE).float()   # (N_active, T)
 valid_mask = data["valid_mask"].astype(bool)                     # (H, W)
 years = data["years"]
 months = data["months"]
 alpha = float(data["alpha"])
 gamma = float(data["gamma"])
 H, W = int(data["H"]), int(data["W"])
+if "weight_basis" in data:  # float16/int8 coefficients from backend.rbf_quantize
+    weights = weights @ torch.from_numpy(data["weight_basis"]).to(DEVICE)
+# Models trained before the year normalisation was stored span their own years
+if "year_origin" in data:
+    year_origin, year_span = float(data["year_origin"]), float(data["year_span"])
+else:
+    year_origin, year_span = years.min(), max(1, (years.max() - years.min()))
+# Older models have a weight row for every valid pixel
+active_mask = data["active_mask"].astype(bool) if "active_mask" in data else valid_mask
+constant_values = data["constant_values"] if "constant_values" in data else np.zeros((H, W), np.uint8)
 
 A, B, C, D, E, F = data["transform"].tolist()
 transform = rasterio.Affine(A, B, C, D, E, F)
 crs = rasterio.crs.CRS.from_string(str(data["crs"]))
 
-year_norm = (years - years.min()) / max(1, (years.max() - years.min()))
+year_norm = (years - year_origin) / year_span
 month_sin = np.sin(2 * np.pi * months / 12.0)
 month_cos = np.cos(2 * np.pi * months / 12.0)
 t_features = np.stack([year_norm, month_sin, month_cos], axis=1)
@@ -71,7 +81,7 @@ def predict_sea_ice(
     FUTURE_DATE = datetime(year, month, 1)
 
     # Construct time feature for the given date
-    year_norm_next = (FUTURE_DATE.year - years.min()) / max(1, (years.max() - years.min()))
+    year_norm_next = (FUTURE_DATE.year - year_origin) / year_span
     month_sin_next = np.sin(2 * np.pi * FUTURE_DATE.month / 12.0)
     month_cos_next = np.cos(2 * np.pi * FUTURE_DATE.month / 12.0)
     t_next = torch.tensor([[year_norm_next, month_sin_next, month_cos_next]],
@@ -83,8 +93,8 @@ def predict_sea_ice(
     preds = np.clip(preds, 0, 1)
 
     # Fill predicted probability map
-    pred_prob = np.zeros((H, W), dtype=np.float32)
-    pred_prob[valid_mask] = preds
+    pred_prob = np.where(valid_mask, constant_values, 0).astype(np.float32)
+    pred_prob[active_mask] = preds
     ice_mask_bin = pred_prob >= thresh
     ice_mask_bin &= valid_mask
 
@@ -1,12 +1,15 @@
 import rasterio
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
 from pathlib import Path
 import shutil
+import sys
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from seaice_forecast.grid import get_grid_geometry  # noqa: E402
+
 
 def gen_geojson(path: Path, radius_km: float = 500) -> Path:
     with rasterio.open(path) as src:
@@ -14,20 +17,13 @@ def gen_geojson(path: Path, radius_km: float = 500) -> Path:
         transform = src.transform
         crs = src.crs
 
-    height, width = data.shape
-    cols, rows = np.meshgrid(np.arange(width), np.arange(height))
-    xs = transform.c + cols * transform.a + rows * transform.b
-    ys = transform.f + cols * transform.d + rows * transform.e
-    dist_km = np.sqrt(xs**2 + ys**2) / 1000
-
-    mask = (data == 1) & (dist_km > radius_km)
-    rows, cols = np.where(mask)
-    if len(rows) == 0:
+    grid = get_grid_geometry(transform, data.shape, crs)
+    mask = (data == 1) & grid.radius_mask(radius_km)
+    if not mask.any():
         return None
 
-    xs, ys = rasterio.transform.xy(transform, rows, cols)
-    points = [Point(x, y) for x, y in zip(xs, ys)]
-    gdf = gpd.GeoDataFrame(geometry=points, crs=crs).to_crs(epsg=4326)
+    points = gpd.points_from_xy(grid.lon[mask], grid.lat[mask])
+    gdf = gpd.GeoDataFrame(geometry=points, crs="EPSG:4326")
     out_geojson = path.with_suffix(".geojson")
     gdf.to_file(out_geojson, driver="GeoJSON")
     return out_geojson
@@ -1,20 +1,71 @@
 # ========================================
 # Sea Ice Prediction - SpatioTemporal RBF Regression (train & save)
 # Saves weights + metadata for later point-GeoJSON prediction
+#
+#   python rbf.py            full training over YEAR_RANGE
+#   python rbf.py --append   add the frames newer than the saved model
+#   python rbf.py --tune     pick gamma/alpha by leave-one-month-out error, then train
+#
+# Daily frames of one month share their temporal features, so the (T, T)
+# kernel is K = P Km P^T, with Km the kernel of the M unique (year, month)
+# frames and P the frame -> month indicator.  The model only needs the
+# weights summed per month (the backend compacts them that way anyway), and
+# those solve an (M, M) system in the per-month ice counts P^T Y:
+#
+#   P^T W = (D Km + alpha*I)^-1 P^T Y = D^1/2 (D^1/2 Km D^1/2 + alpha*I)^-1 D^-1/2 P^T Y
+#
+# with D the frames per month.  The symmetric middle matrix is Cholesky-
+# factored, so training is exact for daily frames while the solve stays
+# (M, M), about 550 x 550 for the full record, however many days are read
+# (see seaice_forecast/rbf_solver.py, covered by ice-predict/tests).
+# The ice counts are saved with the model (uint8) so --append only adds the
+# new frames' counts and re-solves, without re-reading past rasters.  They
+# are exact integers, so appends never drift from a full retrain: --append
+# streams them from the saved model in row blocks and, before replacing it,
+# retrains the block of image rows with the most variable pixels from the
+# cube and fails if its predictions differ by more than APPEND_TOLERANCE.
+#
+# Frames are read by a thread pool into the packed cube (bit-packed ice masks
+# in a memmap, extended in place when new files land) and the counts are
+# taken for blocks of image rows straight from it, so memory stays bounded
+# by BLOCK_MB however long the archive is.
 # ========================================
 
-import os, glob, re
+import os, sys, glob, re, shutil, tempfile, zipfile
 import numpy as np
 import rasterio
 from datetime import datetime
 from tqdm import tqdm
 import torch
 
+from seaice_forecast.cube import build_cube
+from seaice_forecast.rbf_solver import (
+    kernel_cholesky,
+    leave_month_out_errors,
+    month_groups,
+    rbf_kernel,
+    solve_weights,
+)
+
 
 DATA_ROOT = r"C:\Documents\NASA\ice-predict\data\all_source"
 MODEL_DIR = r"C:\Documents\NASA\ice-predict\models"
+# Packed cube (see seaice_forecast.cube); created or extended on every run
+CUBE_DIR = r"C:\Documents\NASA\ice-predict\data\cube"
+READ_WORKERS = 8
+# Unpacked frames (and float64 month counts) held per pixel block; bounds peak memory
+BLOCK_MB = 1024
+# Frames scanned at once when classifying pixels
+FRAME_CHUNK = 256
 
 YEAR_RANGE = (2015, 2025)
+APPEND = "--append" in sys.argv[1:]
+# Largest probability difference allowed between an appended model and a full retrain
+APPEND_TOLERANCE = 1e-4
+TUNE = "--tune" in sys.argv[1:]
+# --tune candidates: kernel length scales (gamma = 1 / (2 l^2)) and ridge strengths
+TUNE_LENGTH_SCALES = (0.1, 0.15, 0.2, 0.3, 0.45, 0.6, 1.0)
+TUNE_ALPHAS = tuple(np.logspace(-4, 0, 9))
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 os.makedirs(MODEL_DIR, exist_ok=True)
@@ -39,85 +90,276 @@ def within_year_range(date):
 
 files_all = sorted(glob.glob(os.path.join(DATA_ROOT, "**", "*.tif"), recursive=True),
                    key=lambda p: (parse_date(p) or datetime.min))
-files = [f for f in files_all if parse_date(f) and within_year_range(parse_date(f))]
-
-print(f"Total frames loaded: {len(files)} ({YEAR_RANGE[0]}–{YEAR_RANGE[1]})")
-if len(files) == 0:
-    raise RuntimeError("No TIFs found for the given YEAR_RANGE.")
-
-with rasterio.open(files[0]) as src:
-    H, W = src.height, src.width
-    transform, crs = src.transform, src.crs
-
-
-T = len(files)
-ice_seq = np.zeros((T, H, W), np.float32)
-land_mask = np.zeros((H, W), np.uint8)
-border_mask = np.zeros((H, W), np.uint8)
-dates = []
-
-for t, f in enumerate(tqdm(files, desc="Loading .tif")):
-    dt = parse_date(f)
-    dates.append(dt)
-    with rasterio.open(f) as src:
-        arr = src.read(1)
-    ice_seq[t] = (arr == 1).astype(np.float32)
-    land_mask |= (arr == 254)
-    border_mask |= (arr == 253)
-
-valid_mask = (land_mask == 0) & (border_mask == 0)
-print(f"Valid pixel ratio: {valid_mask.mean():.3f}")
-
-
-years = np.array([d.year for d in dates], dtype=np.int32)
-months = np.array([d.month for d in dates], dtype=np.int32)
-# 归一化到 [0,1]
-year_norm = (years - YEAR_RANGE[0]) / max(1, (YEAR_RANGE[1] - YEAR_RANGE[0]))
-month_sin = np.sin(2 * np.pi * months / 12.0)
-month_cos = np.cos(2 * np.pi * months / 12.0)
-t_features = np.stack([year_norm, month_sin, month_cos], axis=1)
-t = torch.tensor(t_features, dtype=torch.float32, device=DEVICE)   # (T,3)
-
-
-def rbf_kernel(x1, x2, gamma):
-    diff = x1[:, None, :] - x2[None, :, :]    # (T1,T2,3)
-    dist2 = torch.sum(diff**2, dim=2)         # (T1,T2)
-    return torch.exp(-gamma * dist2)
-
-
-Y = ice_seq[:, valid_mask]   # (T, N_valid)
-N_valid = Y.shape[1]
-print(f"Training {N_valid} pixels, {T} timesteps")
-
-alpha = 1e-2
-gamma = 1.0 / (2 * (0.3 ** 2))
-BATCH = 4000
-
-K = rbf_kernel(t, t, gamma)                         # (T,T)
-K_reg = K + alpha * torch.eye(T, device=DEVICE)     # (T,T)
-K_inv = torch.linalg.inv(K_reg)                      # (T,T)
-
-weights_all = np.zeros((N_valid, T), np.float32)
-
-for i in tqdm(range(0, N_valid, BATCH), desc="Training SpatioTemporal RBF"):
-    batch_Y = torch.from_numpy(Y[:, i:i+BATCH]).to(DEVICE).float()   # (T,B)
-    w = K_inv @ batch_Y                                              # (T,B)
-    weights_all[i:i+BATCH, :] = w.T.detach().cpu().numpy()
-
-
-np.savez(
-    SAVE_MODEL,
-    weights=weights_all,
-    alpha=alpha,
-    gamma=gamma,
-    valid_mask=valid_mask,
-    years=years,
-    months=months,
-    H=np.int32(H),
-    W=np.int32(W),
-    transform=np.array([transform.a, transform.b, transform.c,
-                        transform.d, transform.e, transform.f], dtype=np.float64),
-    crs=str(crs)
-)
+cube = build_cube([(parse_date(f), f) for f in files_all if parse_date(f)], CUBE_DIR, workers=READ_WORKERS)
+H, W = cube.height, cube.width
+cube_dates = [datetime.strptime(d, "%Y-%m-%d") for d in cube.dates]
+
+
+def frame_window(keep):
+    """Cube index range [lo, hi) of the (contiguous) days for which keep(date) holds."""
+    index = [i for i, d in enumerate(cube_dates) if keep(d)]
+    return (index[0], index[-1] + 1) if index else (0, 0)
+
+
+def block_counts(lo, hi, r0, r1, pixels, starts):
+    """
+    Ice counts (M, n) uint8 per month of frames [lo, hi) for the `pixels` in
+    image rows [r0, r1); month m starts at frame lo + starts[m].
+    """
+    ice = np.unpackbits(cube.ice_bits[lo:hi, r0:r1], axis=-1, count=W)   # (T, rows, W) uint8
+    return np.add.reduceat(ice[:, pixels[r0:r1]], starts, axis=0, dtype=np.uint8)
+
+
+def row_blocks(T):
+    rows = max(1, (BLOCK_MB << 20) // (T * W))
+    return [(r, min(r + rows, H)) for r in range(0, H, rows)]
+
+
+def temporal_features(years, months):
+    # 归一化到 [0,1]
+    year_norm = (years - year_origin) / year_span
+    month_sin = np.sin(2 * np.pi * months / 12.0)
+    month_cos = np.cos(2 * np.pi * months / 12.0)
+    t_features = np.stack([year_norm, month_sin, month_cos], axis=1)
+    return torch.tensor(t_features, dtype=torch.float64, device=DEVICE)   # (T,3)
+
+
+def date_code(d):
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def open_npz_rows(path, name):
+    """
+    Stream the rows of 2-D array `name` of an uncompressed .npz in order:
+    returns (archive, member, shape, dtype), read with `read_rows`.
+    """
+    archive = zipfile.ZipFile(path)
+    member = archive.open(f"{name}.npy")
+    version = np.lib.format.read_magic(member)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(member)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(member)
+    if fortran_order or len(shape) != 2:
+        raise RuntimeError(f"{name} in {path} is not a C-ordered 2-D array.")
+    return archive, member, shape, dtype
+
+
+def read_rows(member, shape, dtype, count):
+    """The next `count` rows from a member opened by `open_npz_rows`."""
+    data = member.read(count * shape[1] * dtype.itemsize)
+    return np.frombuffer(data, dtype=dtype).reshape(count, shape[1])
+
+
+def scratch_array(name, shape, dtype):
+    """A writable .npy memmap in the run's scratch directory."""
+    return np.lib.format.open_memmap(os.path.join(scratch, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+
+# Weight and count memmaps live in a scratch directory that is removed however
+# the run ends, together with a partially written model.
+scratch = tempfile.mkdtemp(prefix=".rbf-", dir=MODEL_DIR)
+tmp_model = SAVE_MODEL + ".partial.npz"
+weights_all = counts_all = None
+try:
+    if not APPEND:
+        lo, hi = frame_window(within_year_range)
+        T = hi - lo
+        print(f"Total frames loaded: {T} ({YEAR_RANGE[0]}–{YEAR_RANGE[1]})")
+        if T == 0:
+            raise RuntimeError("No TIFs found for the given YEAR_RANGE.")
+        transform, crs = cube.transform, cube.crs
+        dates = cube_dates[lo:hi]
+
+        ice_count = np.zeros((H, W), np.int32)
+        land_mask = np.zeros((H, W), bool)
+        border_mask = np.zeros((H, W), bool)
+        for i in tqdm(range(lo, hi, FRAME_CHUNK), desc="Scanning frames"):
+            codes = np.asarray(cube.codes[i:min(i + FRAME_CHUNK, hi)])
+            ice_count += (codes == 1).sum(axis=0)
+            land_mask |= (codes == 254).any(axis=0)
+            border_mask |= (codes == 253).any(axis=0)
+        valid_mask = ~land_mask & ~border_mask
+        print(f"Valid pixel ratio: {valid_mask.mean():.3f}")
+
+        years, months, frame_counts, starts = month_groups(dates)
+        M = len(years)
+        year_origin = float(YEAR_RANGE[0])
+        year_span = float(max(1, (YEAR_RANGE[1] - YEAR_RANGE[0])))
+        t = temporal_features(years, months)
+        N_valid = int(valid_mask.sum())
+
+        # Pixels that are ice in every frame (or in none) need no weights: the model
+        # stores them as constants and only fits the seasonal (variable) pixels.
+        always_ice = valid_mask & (ice_count == T)
+        never_ice = valid_mask & (ice_count == 0)
+        active_mask = valid_mask & ~always_ice & ~never_ice
+        constant_values = always_ice.astype(np.uint8)
+        N_active = int(active_mask.sum())
+        print(f"Constant pixels: {int(always_ice.sum())} always ice, {int(never_ice.sum())} never ice")
+        print(f"Training {N_active}/{N_valid} variable pixels, {T} timesteps in {M} months")
+
+        alpha = 1e-2
+        gamma = 1.0 / (2 * (0.3 ** 2))
+        blocks = row_blocks(T)
+
+        if TUNE:
+            SSt = torch.zeros((M, M), dtype=torch.float64, device=DEVICE)
+            ice_totals = torch.zeros(M, dtype=torch.float64, device=DEVICE)
+            for r0, r1 in tqdm(blocks, desc="Accumulating S S^T"):
+                S = torch.from_numpy(block_counts(lo, hi, r0, r1, active_mask, starts)).to(DEVICE).double()
+                SSt += S @ S.T
+                ice_totals += S.sum(dim=1)
+
+            best = (np.inf, alpha, gamma)
+            for scale in tqdm(TUNE_LENGTH_SCALES, desc="Tuning gamma/alpha"):
+                g = 1.0 / (2 * scale ** 2)
+                errs = leave_month_out_errors(t, SSt, ice_totals, frame_counts, g, TUNE_ALPHAS, N_active)
+                for a, err in zip(TUNE_ALPHAS, errs):
+                    print(f"  length scale {scale:<5} gamma {g:9.3f}  alpha {a:.0e}  LOO MSE {err:.5f}")
+                    if err < best[0]:
+                        best = (err, float(a), g)
+            loo_mse, alpha, gamma = best
+            print(f"Best: gamma={gamma:.4f} alpha={alpha:.0e} (leave-one-month-out MSE {loo_mse:.5f})")
+
+        L = kernel_cholesky(t, frame_counts, gamma, alpha)                # (M,M) lower
+
+        # Weight rows follow the row-major order of active_mask, as do the blocks.
+        weights_all = scratch_array("weights", (N_active, M), np.float32)
+        counts_all = scratch_array("ice_counts", (N_active, M), np.uint8)
+        row = 0
+        for r0, r1 in tqdm(blocks, desc="Training SpatioTemporal RBF"):
+            S = block_counts(lo, hi, r0, r1, active_mask, starts)               # (M,B)
+            weights_all[row:row + S.shape[1], :] = solve_weights(S, L, frame_counts)
+            counts_all[row:row + S.shape[1], :] = S.T
+            row += S.shape[1]
+        last_date = date_code(dates[-1])
+
+    else:
+        # ---------------------- Incremental update ----------------------
+        with np.load(SAVE_MODEL, allow_pickle=True) as prev:
+            if "ice_counts" not in prev or "weight_basis" in prev:
+                raise RuntimeError(f"{SAVE_MODEL} was not written by this script with ice counts; retrain without --append.")
+            if (int(prev["H"]), int(prev["W"])) != (H, W):
+                raise RuntimeError(f"{SAVE_MODEL} does not match the grid of {CUBE_DIR}.")
+            transform = rasterio.Affine(*prev["transform"].tolist())
+            crs = str(prev["crs"])
+            alpha, gamma = float(prev["alpha"]), float(prev["gamma"])
+            year_origin, year_span = float(prev["year_origin"]), float(prev["year_span"])
+            valid_mask = prev["valid_mask"].astype(bool)
+            old_active = prev["active_mask"].astype(bool)
+            constant_values = prev["constant_values"].astype(np.uint8)
+            old_years, old_months = prev["years"], prev["months"]
+            old_frame_counts = prev["frame_counts"]
+            old_last_date = int(prev["last_date"])
+
+        lo, hi = frame_window(lambda d: date_code(d) > old_last_date)
+        if hi == lo:
+            print("No new frames; model is up to date.")
+            sys.exit(0)
+        print(f"Appending {hi - lo} new frames to {int(old_frame_counts.sum())}")
+        new_seq = np.unpackbits(cube.ice_bits[lo:hi], axis=-1, count=W)        # (k,H,W) uint8
+        dates = cube_dates[lo:hi]
+        new_years, new_months, new_counts, new_starts = month_groups(dates)
+
+        # New frames fill up the last saved month or start new ones.
+        M_old = len(old_years)
+        merge = int(old_years[-1]) * 12 + int(old_months[-1]) == int(new_years[0]) * 12 + int(new_months[0])
+        new_cols = np.arange(len(new_years)) + M_old - int(merge)
+        years = np.concatenate([old_years, new_years[int(merge):]])
+        months = np.concatenate([old_months, new_months[int(merge):]])
+        frame_counts = np.concatenate([old_frame_counts, np.zeros(len(years) - M_old, dtype=old_frame_counts.dtype)])
+        frame_counts[new_cols] += new_counts
+        M = len(years)
+        T = int(frame_counts.sum())
+        BATCH = max(1, (BLOCK_MB << 20) // (M * 8))
+        t = temporal_features(years, months)
+        L = kernel_cholesky(t, frame_counts, gamma, alpha)                                    # (M,M) lower
+
+        # The cube must still hold exactly the model's frames for the retrain check.
+        first_month = int(years[0]) * 12 + int(months[0]) - 1
+        full_lo, full_hi = frame_window(lambda d: d.year * 12 + d.month - 1 >= first_month)
+        _, _, full_counts, full_starts = month_groups(cube_dates[full_lo:full_hi])
+        if not np.array_equal(full_counts, frame_counts):
+            raise RuntimeError(f"{CUBE_DIR} no longer holds the frames of {SAVE_MODEL}; retrain without --append.")
+
+        # Constant pixels become active once a new frame disagrees with their value.
+        Y_new = new_seq[:, valid_mask]                                            # (k, N_valid)
+        const_valid = constant_values[valid_mask]
+        was_active = old_active[valid_mask]
+        variable = was_active | np.any(Y_new != const_valid[None, :], axis=0)
+        active_mask = np.zeros((H, W), dtype=bool)
+        active_mask[valid_mask] = variable
+        constant_values[active_mask] = 0
+        N_active = int(variable.sum())
+        print(f"Updating {N_active} variable pixels ({N_active - int(was_active.sum())} newly variable), {T} timesteps in {M} months")
+
+        # Row of each active pixel in the old counts, or -1 for newly variable pixels.
+        old_rows = np.full(valid_mask.sum(), -1, dtype=np.int64)
+        old_rows[was_active] = np.arange(int(was_active.sum()))
+        old_rows = old_rows[variable]
+        S_new = np.add.reduceat(Y_new[:, variable], new_starts, axis=0, dtype=np.uint8)  # (M_new, N_active)
+        const_valid = const_valid[variable]
+
+        weights_all = scratch_array("weights", (N_active, M), np.float32)
+        counts_all = scratch_array("ice_counts", (N_active, M), np.uint8)
+
+        # Old active pixels keep their relative order, so their count rows are read in sequence.
+        archive, old_counts, counts_shape, counts_dtype = open_npz_rows(SAVE_MODEL, "ice_counts")
+        with archive, old_counts:
+            for i in tqdm(range(0, N_active, BATCH), desc="Updating SpatioTemporal RBF"):
+                rows = old_rows[i:i+BATCH]
+                S = np.zeros((M, len(rows)), dtype=np.uint8)
+                # A constant pixel was iced in every frame of the old months, or in none.
+                S[:M_old] = old_frame_counts[:, None] * const_valid[None, i:i+BATCH]
+                known = rows >= 0
+                if known.any():
+                    S[:M_old, known] = read_rows(old_counts, counts_shape, counts_dtype, int(known.sum())).T
+                S[new_cols] += S_new[:, i:i+BATCH]
+                weights_all[i:i+BATCH, :] = solve_weights(S, L, frame_counts)
+                counts_all[i:i+BATCH, :] = S.T
+
+        # Retrain the row block with the most variable pixels from the cube and compare.
+        blocks = row_blocks(full_hi - full_lo)
+        r0, r1 = max(blocks, key=lambda b: int(active_mask[b[0]:b[1]].sum()))
+        row = int(active_mask[:r0].sum())
+        S = block_counts(full_lo, full_hi, r0, r1, active_mask, full_starts)
+        n = S.shape[1]
+        Km = rbf_kernel(t, t, gamma).float().cpu().numpy()
+        error = float(np.abs((weights_all[row:row + n] - solve_weights(S, L, frame_counts)) @ Km).max(initial=0.0))
+        print(f"Appended vs retrained rows {r0}-{r1} ({n} pixels): max probability difference {error:.2e}")
+        if not np.array_equal(counts_all[row:row + n], S.T) or error > APPEND_TOLERANCE:
+            raise RuntimeError(f"Appended model differs from a full retrain (max {error:.2e}); {SAVE_MODEL} left unchanged.")
+
+        last_date = date_code(dates[-1])
+
+    np.savez(
+        tmp_model,
+        weights=weights_all,
+        alpha=alpha,
+        gamma=gamma,
+        valid_mask=valid_mask,
+        active_mask=active_mask,          # pixels with a row in `weights`
+        constant_values=constant_values,  # 0/1 for the other valid pixels
+        years=years,                      # one column per (year, month)
+        months=months,
+        frame_counts=frame_counts,        # daily frames per month, for --append
+        ice_counts=counts_all,            # iced frames per month of each active pixel
+        last_date=np.int32(last_date),    # YYYYMMDD of the last frame
+        year_origin=year_origin,          # year_norm = (year - year_origin) / year_span
+        year_span=year_span,
+        H=np.int32(H),
+        W=np.int32(W),
+        transform=np.array([transform.a, transform.b, transform.c,
+                            transform.d, transform.e, transform.f], dtype=np.float64),
+        crs=str(crs)
+    )
+    os.replace(tmp_model, SAVE_MODEL)
+finally:
+    # Memmaps must be released before their files can be removed on Windows.
+    weights_all = counts_all = None
+    shutil.rmtree(scratch, ignore_errors=True)
+    if os.path.exists(tmp_model):
+        os.remove(tmp_model)
 
 print(f"Model saved to: {SAVE_MODEL}")
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 DATA_ROOT = Path("data/all_source")
+CUBE_DIR = Path("data/cube")
 
 OUTPUT_DIR = Path("outputs")
 CHECKPOINT_DIR = OUTPUT_DIR / "checkpoints"
@@ -0,0 +1,28 @@
+"""
+Packed daily sea-ice data cube built from the NSIDC GeoTIFF archive.
+
+The implementation is ``backend/cube.py``, shared with the API so both sides
+read and write the same on-disk format; this module puts the repository root
+on the import path and re-exports it.  Build or extend a cube with::
+
+    python -m seaice_forecast.cube build --root data/all_source --out data/cube
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from backend.cube import (  # noqa: E402
+    COAST_CODE,
+    CUBE_FORMAT_VERSION,
+    ICE_CODE,
+    LAND_CODE,
+    CubeError,
+    IceCube,
+    build_cube,
+    discover_rasters,
+    main,
+)
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ from torch.utils.data import Dataset
 import re, os
 from pathlib import Path
 
+from seaice_forecast.cube import IceCube
+from seaice_forecast.grid import grid_geometry_for_raster
+
 DATE_RE = re.compile(r"N_(\d{4})(\d{2})(\d{2})_extent_v4\.0\.tif$")
 
 def parse_date(p):
@@ -15,11 +18,13 @@ def parse_date(p):
     return datetime(y, mth, d)
 
 class SeaIceDataset(Dataset):
-    def __init__(self, root_dir, seq_len=6, radius_km=200, years_range=(2020,2025)):
+    def __init__(self, root_dir, seq_len=6, radius_km=200, years_range=(2020,2025), cube_dir=None):
         self.root_dir = Path(root_dir)
         self.seq_len = seq_len
         self.radius_km = radius_km
         self.years_range = years_range
+        # Read frames from the packed cube when available instead of per-file GeoTIFFs
+        self.cube = IceCube(cube_dir) if cube_dir and (Path(cube_dir) / "meta.json").exists() else None
 
         files = sorted(self.root_dir.rglob("*.tif"), key=lambda p: parse_date(p))
         pairs = []
@@ -32,22 +37,22 @@ class SeaIceDataset(Dataset):
         self.dates = [dt for dt, _ in pairs]
         self.indices = list(range(seq_len, len(self.files)))
 
-        with rasterio.open(self.files[0]) as src:
-            h, w = src.height, src.width
-            transform = src.transform
-        cols, rows = np.meshgrid(np.arange(w), np.arange(h))
-        xs = transform.c + cols * transform.a + rows * transform.b
-        ys = transform.f + cols * transform.d + rows * transform.e
-        self.dist_km = np.sqrt(xs**2 + ys**2) / 1000
+        grid = grid_geometry_for_raster(self.files[0])
+        self.dist_km = grid.dist_km
+        self.near_pole = np.asarray(grid.dist_km < radius_km)
 
     def __len__(self):
         return len(self.indices)
 
     def _read_mask(self, path: Path):
-        with rasterio.open(path) as src:
-            arr = src.read(1)
+        index = self.cube.lookup_source(path) if self.cube is not None else None
+        if index is not None:
+            arr = self.cube.codes[index]
+        else:
+            with rasterio.open(path) as src:
+                arr = src.read(1)
         mask = (arr == 1).astype(np.float32)
-        mask[self.dist_km < self.radius_km] = 0
+        mask[self.near_pole] = 0
         return mask
 
     def __getitem__(self, idx):
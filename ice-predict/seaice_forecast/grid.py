@@ -0,0 +1,20 @@
+"""
+Precomputed geometry for the fixed NSIDC raster grid.
+
+The implementation is ``backend/grid.py``, shared with the API so both sides
+read and write the same cache files; this module puts the repository root on
+the import path and re-exports it.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from backend.grid import (  # noqa: E402
+    ARRAY_NAMES,
+    GRID_CACHE_DIR,
+    GRID_FORMAT_VERSION,
+    GridGeometry,
+    get_grid_geometry,
+    grid_geometry_for_raster,
+)
@@ -0,0 +1,86 @@
+# seaice_forecast/rbf_solver.py
+#
+# Month-space solve of the spatiotemporal RBF model trained by rbf.py.  Daily
+# frames of one month share their temporal features, so the (T, T) daily
+# kernel system collapses onto the M unique (year, month) frames:
+#
+#   P^T W = D^1/2 (D^1/2 Km D^1/2 + alpha*I)^-1 D^-1/2 P^T Y
+#
+# with Km the month kernel, D the frames per month and P^T Y the per-month
+# ice counts.  Everything here is (M, M) work on float64 tensors, on the
+# device of the features passed in.
+import numpy as np
+import torch
+
+
+def month_groups(dates):
+    """Years, months, frame counts and first frame index of each month of date-sorted frames."""
+    keys = np.array([d.year * 12 + d.month - 1 for d in dates], dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    return (keys[starts] // 12).astype(np.int32), (keys[starts] % 12 + 1).astype(np.int32), counts, starts
+
+
+def rbf_kernel(x1, x2, gamma):
+    diff = x1[:, None, :] - x2[None, :, :]    # (T1,T2,3)
+    dist2 = torch.sum(diff**2, dim=2)         # (T1,T2)
+    return torch.exp(-gamma * dist2)
+
+
+def month_kernel(t, counts, gamma):
+    """D^1/2 Km D^1/2 over the unique months, D = frames per month."""
+    d = torch.sqrt(torch.as_tensor(counts, dtype=torch.float64, device=t.device))
+    return rbf_kernel(t, t, gamma) * d[:, None] * d[None, :]
+
+
+def kernel_cholesky(t, counts, gamma, alpha):
+    """Lower Cholesky factor of D^1/2 Km D^1/2 + alpha*I, in float64."""
+    K_reg = month_kernel(t, counts, gamma)
+    K_reg.diagonal().add_(alpha)
+    return torch.linalg.cholesky(K_reg)
+
+
+def solve_weights(S, L, counts):
+    """Weights (B, M) float32 of month ice counts S (M, B), summed per month."""
+    d = torch.sqrt(torch.as_tensor(counts, dtype=torch.float64, device=L.device))[:, None]
+    S = torch.from_numpy(S).to(L.device).double()
+    return (d * torch.cholesky_solve(S / d, L)).T.float().cpu().numpy()
+
+
+def leave_month_out_errors(t, SSt, ice_totals, counts, gamma, alphas, pixels):
+    """
+    Mean squared leave-one-month-out error of each alpha for one gamma, over
+    every daily frame and the `pixels` the counts were summed over.
+
+    With S the month ice counts and A = Km (alpha*I + D Km)^-1, the daily
+    weights of month g are (Y_g - 1 u_g^T) / alpha with u = A S, and refitting
+    without the frames of month g leaves residuals Y_g - 1 v_g^T on them,
+    v_g = (1 + b n_g) u_g - b s_g with b = A_gg / (1 - n_g A_gg).  Their
+    squared sum only needs the diagonals of A, A S S^T and A S S^T A, and
+    the summed ice counts (the targets are 0/1), so every candidate costs
+    (M, M) work whatever the number of frames and pixels.
+    D^1/2 Km D^1/2 = Q diag(lam) Q^T is decomposed once per gamma, giving
+    A = R diag(lam / (lam + alpha)) R^T with R = D^-1/2 Q.  Daily frames of
+    one month share their features, so leaving out single frames would
+    barely test anything.
+    """
+    n = torch.as_tensor(counts, dtype=torch.float64, device=t.device)
+    lam, Q = torch.linalg.eigh(month_kernel(t, counts, gamma))
+    lam = lam.clamp(min=0)
+    R = Q / torch.sqrt(n)[:, None]
+    V = R.T @ SSt                                    # R^T S S^T
+    Z = V @ R                                        # R^T S S^T R
+    ss = torch.diagonal(SSt)
+    errors = []
+    for a in alphas:
+        Rf = R * (lam / (lam + a))                   # A = Rf R^T
+        c = torch.sum(Rf * R, dim=1)
+        us = torch.sum(Rf * V.T, dim=1)              # diag(A S S^T)
+        uu = torch.sum((Rf @ Z) * Rf, dim=1)         # diag(A S S^T A)
+        b = c / (1 - n * c)
+        g = 1 + b * n
+        vs = g * us - b * ss
+        vv = g * g * uu - 2 * b * g * us + b * b * ss
+        total = torch.sum(ice_totals - 2 * vs + n * vv).item()
+        errors.append(total / (n.sum().item() * pixels))
+    return errors
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+import torch
+
+from seaice_forecast.rbf_solver import (
+    kernel_cholesky,
+    leave_month_out_errors,
+    month_groups,
+    rbf_kernel,
+    solve_weights,
+)
+
+GAMMA = 1.0 / (2 * 0.3**2)
+ALPHA = 1e-2
+
+
+def _features(years, months):
+    return torch.tensor(
+        np.stack([(years - 2015) / 3.0, np.sin(2 * np.pi * months / 12.0), np.cos(2 * np.pi * months / 12.0)], axis=1),
+        dtype=torch.float64,
+    )
+
+
+def _daily_problem(seed, months=14, pixels=40):
+    """Random daily 0/1 frames over `months` consecutive months, 1-4 days each."""
+    rng = np.random.default_rng(seed)
+    dates = []
+    for m in range(months):
+        first = datetime(2015 + m // 12, m % 12 + 1, 1)
+        dates += [first + timedelta(days=int(d)) for d in sorted(rng.choice(28, rng.integers(1, 5), replace=False))]
+    years, months_, counts, starts = month_groups(dates)
+    Y = (rng.random((len(dates), pixels)) < rng.random(pixels)).astype(np.uint8)
+    P = np.zeros((len(dates), len(years)))
+    P[np.arange(len(dates)), np.repeat(np.arange(len(years)), counts)] = 1
+    return dates, years, months_, counts, starts, Y, P
+
+
+def test_month_groups():
+    dates, years, months, counts, starts, _, _ = _daily_problem(0)
+    assert counts.sum() == len(dates)
+    for y, m, n, s in zip(years, months, counts, starts):
+        group = dates[s : s + n]
+        assert all((d.year, d.month) == (y, m) for d in group)
+    assert len(set(zip(years, months))) == len(years)
+
+
+def test_month_solve_matches_daily_solve():
+    _, years, months, counts, starts, Y, P = _daily_problem(1)
+    t = _features(years, months)
+
+    S = np.add.reduceat(Y, starts, axis=0, dtype=np.uint8)             # (M, pixels)
+    weights = solve_weights(S, kernel_cholesky(t, counts, GAMMA, ALPHA), counts)
+
+    Km = rbf_kernel(t, t, GAMMA).numpy()
+    K = P @ Km @ P.T
+    daily = np.linalg.solve(K + ALPHA * np.eye(len(K)), Y.astype(np.float64))
+    expected = (P.T @ daily).T                                          # summed per month
+    np.testing.assert_allclose(weights, expected, rtol=0, atol=1e-5 * np.abs(expected).max())
+
+
+@pytest.mark.parametrize("length_scale", [0.15, 0.3, 1.0])
+def test_leave_month_out_errors_match_refits(length_scale):
+    _, years, months, counts, starts, Y, P = _daily_problem(2)
+    t = _features(years, months)
+    gamma = 1.0 / (2 * length_scale**2)
+    alphas = (1e-3, 1e-2, 1e-1, 1.0)
+
+    S = torch.from_numpy(np.add.reduceat(Y, starts, axis=0, dtype=np.uint8)).double()
+    errors = leave_month_out_errors(t, S @ S.T, S.sum(dim=1), counts, gamma, alphas, Y.shape[1])
+
+    K = P @ rbf_kernel(t, t, gamma).numpy() @ P.T
+    month_of = np.repeat(np.arange(len(counts)), counts)
+    for alpha, error in zip(alphas, errors):
+        total = 0.0
+        for g in range(len(counts)):
+            out, keep = month_of == g, month_of != g
+            W = np.linalg.solve(K[np.ix_(keep, keep)] + alpha * np.eye(keep.sum()), Y[keep].astype(np.float64))
+            total += ((Y[out] - K[np.ix_(out, keep)] @ W) ** 2).sum()
+        assert error == pytest.approx(total / Y.size, rel=1e-8)
@@ -7,7 +7,7 @@ from seaice_forecast.train_utils import train_epoch, validate_epoch
 from seaice_forecast.config import *
 
 def main():
-    dataset = SeaIceDataset(DATA_ROOT, seq_len=SEQ_LEN, radius_km=RADIUS_KM)
+    dataset = SeaIceDataset(DATA_ROOT, seq_len=SEQ_LEN, radius_km=RADIUS_KM, cube_dir=CUBE_DIR)
     n_total = len(dataset)
     n_train = int(n_total * 0.8)
     n_val = n_total - n_train
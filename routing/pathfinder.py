@@ -1,6 +1,11 @@
 import routing_util
 import geopandas as gpd
 import heapq
+import math
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from scipy import ndimage
 
 tif_path = "./N_19781026_extent_v4.0.tif"
 
@@ -9,51 +14,177 @@ start_lon = -91.6
 end_lat = 52.77
 end_lon = -79.6
 
-def find_nearest_open(navmap, row, col, radius=10):
+def nearest_open_cells(navmap):
+    """Exact Euclidean distance to, and (rows, cols) of, the nearest open cell for every cell."""
+    return ndimage.distance_transform_edt(navmap != 1, return_indices=True)
+
+
+def find_nearest_open(navmap, row, col, radius=10, nearest=None):
+    """Nearest open cell to (row, col) within ``radius`` cells, or None; pass ``nearest_open_cells`` to reuse it."""
+    if not (navmap == 1).any():
+        return None
+    distance, (rows, cols) = nearest if nearest is not None else nearest_open_cells(navmap)
     h, w = navmap.shape
-    for r in range(-radius, radius + 1):
-        for c in range(-radius, radius + 1):
-            rr, cc = row + r, col + c
-            if 0 <= rr < h and 0 <= cc < w and navmap[rr, cc] == 1:
-                return (rr, cc)
-    return None
-
-# --- 8-connected A* pathfinding ---
-def astar_pathfinding(navmap, start, goal):
+    row, col = min(max(row, 0), h - 1), min(max(col, 0), w - 1)
+    if distance[row, col] > radius:
+        return None
+    return int(rows[row, col]), int(cols[row, col])
+
+# --- 8-connected A* / Jump Point Search on flat indices (see backend/routing/pathfinder.py) ---
+SQRT2 = math.sqrt(2.0)
+_OCTILE = SQRT2 - 2.0
+
+
+def _padded(navmap: np.ndarray) -> Tuple[bytes, int]:
+    """Navigable flags of ``navmap`` with a blocked border, and the padded width."""
     h, w = navmap.shape
-    open_set = [(0, start)]
-    came_from = {}
-    g_score = {start: 0}
+    open_cells = np.zeros((h + 2, w + 2), dtype=np.uint8)
+    open_cells[1:-1, 1:-1] = np.asarray(navmap) == 1
+    return open_cells.tobytes(), w + 2
+
+
+def _path(parent, node: int, stride: int) -> List[Tuple[int, int]]:
+    """Cells from the start to ``node`` following ``parent``, filling in skipped cells."""
+    path = [divmod(node, stride)]
+    while parent[node] >= 0:
+        prev = parent[node]
+        (r0, c0), (r1, c1) = divmod(prev, stride), path[-1]
+        steps = max(abs(r1 - r0), abs(c1 - c0))
+        dr, dc = (r0 > r1) - (r0 < r1), (c0 > c1) - (c0 < c1)
+        path.extend((r1 + k * dr, c1 + k * dc) for k in range(1, steps + 1))
+        node = prev
+    return [(r - 1, c - 1) for r, c in reversed(path)]
+
+
+def _jump(cells: bytes, node: int, dr: int, dc: int, goal: int, stride: int) -> int:
+    """
+    Next jump point from ``node`` (exclusive) in direction (dr, dc), or -1.
+    """
+    step = dr * stride + dc
+    if dr and dc:
+        # A diagonal stops where either of its straight sweeps finds a jump point.
+        node += step
+        while cells[node]:
+            if node == goal:
+                return node
+            if (cells[node + dr * stride - dc] and not cells[node - dc]) or (
+                cells[node - dr * stride + dc] and not cells[node - dr * stride]
+            ):
+                return node
+            if _jump(cells, node, 0, dc, goal, stride) >= 0 or _jump(cells, node, dr, 0, goal, stride) >= 0:
+                return node
+            node += step
+        return -1
+
+    side = 1 if dr else stride  # the two cells beside a straight move
+    node += step
+    while cells[node]:
+        if node == goal:
+            return node
+        if (cells[node + side + step] and not cells[node + side]) or (
+            cells[node - side + step] and not cells[node - side]
+        ):
+            return node
+        node += step
+    return -1
+
+
+def _directions(cells: bytes, node: int, parent: int, stride: int) -> Sequence[Tuple[int, int]]:
+    """Directions worth searching from ``node`` when reached from ``parent`` (pruned JPS neighbours)."""
+    if parent < 0:
+        return ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+    pr, pc = divmod(parent, stride)
+    r, c = divmod(node, stride)
+    dr, dc = (r > pr) - (r < pr), (c > pc) - (c < pc)
+    if dr and dc:
+        dirs = [(dr, dc), (dr, 0), (0, dc)]
+        if not cells[node - dc]:
+            dirs.append((dr, -dc))
+        if not cells[node - dr * stride]:
+            dirs.append((-dr, dc))
+        return dirs
+    dirs = [(dr, dc)]
+    if dr:
+        for side in (-1, 1):
+            if not cells[node + side]:
+                dirs.append((dr, side))
+    else:
+        for side in (-1, 1):
+            if not cells[node + side * stride]:
+                dirs.append((side, dc))
+    return dirs
+
+
+def astar_pathfinding(navmap, start, goal, jump_points: bool = False):
+    """
+    Shortest 8-connected path from ``start`` to ``goal`` (``(row, col)``
+    cells) over the cells where ``navmap == 1``.
+
+    Returns the path as a list of cells including both ends, or ``[]`` when
+    the goal cannot be reached.  ``jump_points`` selects Jump Point Search.
+    """
+    h, w = navmap.shape
+    if not (0 <= start[0] < h and 0 <= start[1] < w and 0 <= goal[0] < h and 0 <= goal[1] < w):
+        return []
+    cells, stride = _padded(navmap)
+    size = len(cells)
+    source = (int(start[0]) + 1) * stride + int(start[1]) + 1
+    target = (int(goal[0]) + 1) * stride + int(goal[1]) + 1
+
+    g_arr = np.full(size, np.inf)
+    parent_arr = np.full(size, -1, dtype=np.int64)
+    closed_arr = np.zeros(size, dtype=np.uint8)
+    g, parent, closed = memoryview(g_arr), memoryview(parent_arr), memoryview(closed_arr)
+
+    gr, gc = divmod(target, stride)
 
-    def heuristic(a, b):
-        # Manhattan distance is fine here; diagonal cost handled separately
-        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+    def heuristic(node: int) -> float:
+        r, c = divmod(node, stride)
+        dr, dc = abs(r - gr), abs(c - gc)
+        return dr + dc + _OCTILE * (dr if dr < dc else dc)
 
-    neighbors = [(-1, 0), (1, 0), (0, -1), (0, 1),
-                 (-1, -1), (-1, 1), (1, -1), (1, 1)]
+    g[source] = 0.0
+    open_set = [(heuristic(source), source)]
+    if jump_points:
+        while open_set:
+            _, node = heapq.heappop(open_set)
+            if closed[node]:
+                continue
+            if node == target:
+                return _path(parent, node, stride)
+            closed[node] = 1
+            base = g[node]
+            for dr, dc in _directions(cells, node, parent[node], stride):
+                nxt = _jump(cells, node, dr, dc, target, stride)
+                if nxt < 0 or closed[nxt]:
+                    continue
+                steps = abs(nxt // stride - node // stride) if dr else abs(nxt - node)
+                tentative = base + steps * (SQRT2 if dc and dr else 1.0)
+                if tentative < g[nxt]:
+                    g[nxt] = tentative
+                    parent[nxt] = node
+                    heapq.heappush(open_set, (tentative + heuristic(nxt), nxt))
+        return []
 
+    straight = (-stride, stride, -1, 1)
+    diagonal = (-stride - 1, -stride + 1, stride - 1, stride + 1)
     while open_set:
-        _, current = heapq.heappop(open_set)
-        if current == goal:
-            # reconstruct path
-            path = [current]
-            while current in came_from:
-                current = came_from[current]
-                path.append(current)
-            return path[::-1]
-
-        for dr, dc in neighbors:
-            nr, nc = current[0] + dr, current[1] + dc
-            neighbor = (nr, nc)
-            if 0 <= nr < h and 0 <= nc < w and navmap[nr, nc] == 1:
-                cost = 1.0 if abs(dr) + abs(dc) == 1 else 1.4
-                tentative_g = g_score[current] + cost
-                if tentative_g < g_score.get(neighbor, float("inf")):
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g
-                    f_score = tentative_g + heuristic(neighbor, goal)
-                    heapq.heappush(open_set, (f_score, neighbor))
-    return []  # No path found
+        _, node = heapq.heappop(open_set)
+        if closed[node]:
+            continue
+        if node == target:
+            return _path(parent, node, stride)
+        closed[node] = 1
+        base = g[node]
+        for offsets, cost in ((straight, 1.0), (diagonal, SQRT2)):
+            tentative = base + cost
+            for offset in offsets:
+                nxt = node + offset
+                if cells[nxt] and not closed[nxt] and tentative < g[nxt]:
+                    g[nxt] = tentative
+                    parent[nxt] = node
+                    heapq.heappush(open_set, (tentative + heuristic(nxt), nxt))
+    return []
 
 navmap, rgb_img, src = routing_util.preprocess_color_tiff_to_binary(
     tif_path,
@@ -65,14 +196,15 @@ navmap, rgb_img, src = routing_util.preprocess_color_tiff_to_binary(
 start_pixel = routing_util.get_pixel_value_from_latlon(tif_path, start_lat, start_lon)
 goal_pixel  = routing_util.get_pixel_value_from_latlon(tif_path, end_lat, end_lon)
 
-start = find_nearest_open(navmap, *start_pixel)
-goal = find_nearest_open(navmap, *goal_pixel)
+nearest = nearest_open_cells(navmap)
+start = find_nearest_open(navmap, *start_pixel, nearest=nearest)
+goal = find_nearest_open(navmap, *goal_pixel, nearest=nearest)
 if not start or not goal:
     raise ValueError("Could not find valid start/goal near given points.")
 
 print(f"Start: {start}, Goal: {goal}")
 
-path = astar_pathfinding(navmap, start_pixel, goal_pixel)
+path = astar_pathfinding(navmap, start, goal, jump_points=True)
 
 # routing_util.export_navmap(navmap)
 